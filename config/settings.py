@@ -1,3 +1,9 @@
 
 
-pt_num_threshold = 10000
\ No newline at end of file
+pt_num_threshold = 10000  # above this estimated number of points, profiles are created in chunks
+profile_chunk_size = 100000
+memmap_pt_num_threshold = 5000000  # above this estimated number of points, profile arrays are memory-mapped
+profiles_cache_dirname = "qProf_cache"  # folder of the computed profiles cache, in the QGIS settings directory
+dem_overview_sampling_ratio = 0.0  # when positive, DEMs are read at the coarsest existing overview level with cells at least this many times smaller than the sample distance; 0 for full resolution
+dem_overview_build = False  # build the missing DEM overviews used by coarse samplings, as .ovr files next to the DEMs, after confirmation
+polygon_intersection_max_threads = 4  # profiles intersected concurrently with the polygon layer; 1 for serial processing
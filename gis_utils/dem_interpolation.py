@@ -0,0 +1,261 @@
+
+from builtins import object
+import copy
+
+import numpy as np
+
+
+class GridParameters(object):
+    """
+    Geometric parameters of a non-rotated grid.
+    Row indices are counted from the bottom (yMin) of the grid.
+    """
+
+    def __init__(self, name, cellsizeEW, cellsizeNS, rows, cols, xMin, xMax, yMin, yMax, nodatavalue):
+
+        self.name = name
+        self.cellsizeEW = cellsizeEW
+        self.cellsizeNS = cellsizeNS
+        self.rows = rows
+        self.cols = cols
+        self.xMin = xMin
+        self.xMax = xMax
+        self.yMin = yMin
+        self.yMax = yMax
+        self.nodatavalue = nodatavalue
+
+    def grid_parameters(self):
+        """
+        Plain copy of the grid parameters, e.g. to be passed to other processes.
+
+        :return: GridParameters
+        """
+
+        return GridParameters(self.name, self.cellsizeEW, self.cellsizeNS, self.rows, self.cols,
+                              self.xMin, self.xMax, self.yMin, self.yMax, self.nodatavalue)
+
+    def decimated(self, factor):
+        """
+        Parameters of the grid with cells aggregated by a decimation factor,
+        anchored at the top-left corner as GDAL overviews are.
+        The decimated grid can extend beyond the right and bottom borders of the grid.
+
+        :param factor: int
+        :return: a copy of the parameters, of the same class
+        """
+
+        if factor == 1:
+            return self
+
+        decimated_params = copy.copy(self)
+
+        decimated_params.cellsizeEW = self.cellsizeEW * factor
+        decimated_params.cellsizeNS = self.cellsizeNS * factor
+        decimated_params.rows = int(np.ceil(self.rows / float(factor)))
+        decimated_params.cols = int(np.ceil(self.cols / float(factor)))
+        decimated_params.xMax = self.xMin + decimated_params.cols * decimated_params.cellsizeEW
+        decimated_params.yMin = self.yMax - decimated_params.rows * decimated_params.cellsizeNS
+
+        return decimated_params
+
+    def point_in_dem_area_array(self, xs, ys):
+        """
+        Check which points are within or on the boundary of the grid area.
+
+        :param xs: np.ndarray of x values
+        :param ys: np.ndarray of y values
+        :return: np.ndarray of bool
+        """
+
+        return (self.xMin <= xs) & (xs <= self.xMax) & \
+               (self.yMin <= ys) & (ys <= self.yMax)
+
+    def point_in_interpolation_area_array(self, xs, ys):
+        """
+        Check which points are within or on the boundary of the area defined by
+        the extreme cell center values.
+
+        :param xs: np.ndarray of x values
+        :param ys: np.ndarray of y values
+        :return: np.ndarray of bool
+        """
+
+        return (self.xMin + self.cellsizeEW / 2.0 <= xs) & (xs <= self.xMax - self.cellsizeEW / 2.0) & \
+               (self.yMin + self.cellsizeNS / 2.0 <= ys) & (ys <= self.yMax - self.cellsizeNS / 2.0)
+
+    def geogr2raster_array(self, xs, ys):
+        """
+        Convert from geographic to raster-based coordinates.
+
+        :param xs: np.ndarray of x values
+        :param ys: np.ndarray of y values
+        :return: tuple of two np.ndarray (raster x and y values)
+        """
+
+        raster_xs = (xs - (self.xMin + self.cellsizeEW / 2.0)) / self.cellsizeEW
+        raster_ys = (ys - (self.yMin + self.cellsizeNS / 2.0)) / self.cellsizeNS
+
+        return raster_xs, raster_ys
+
+    def raster2geogr_array(self, raster_xs, raster_ys):
+        """
+        Convert from raster-based to geographic coordinates.
+
+        :param raster_xs: np.ndarray of raster x values
+        :param raster_ys: np.ndarray of raster y values
+        :return: tuple of two np.ndarray (geographic x and y values)
+        """
+
+        xs = self.xMin + (raster_xs + 0.5) * self.cellsizeEW
+        ys = self.yMin + (raster_ys + 0.5) * self.cellsizeNS
+
+        return xs, ys
+
+
+def points_spacing(xs, ys):
+    """
+    Typical spacing of a sequence of points, as the median distance between consecutive points.
+
+    :param xs: np.ndarray of x values
+    :param ys: np.ndarray of y values
+    :return: float, NaN when undefined
+    """
+
+    distances = np.hypot(np.diff(xs), np.diff(ys))
+    distances = distances[np.isfinite(distances) & (distances > 0.0)]
+
+    if distances.size == 0:
+        return np.nan
+
+    return float(np.median(distances))
+
+
+def overview_decimation_factor(params, sample_spacing, sampling_ratio, available_factors=None):
+    """
+    Decimation factor, as a power of two, of the coarsest overview level
+    whose cells are still at least sampling_ratio times smaller than the sample spacing.
+    Larger sampling ratios favour accuracy, smaller ones favour speed.
+    Decimated grids keep at least two rows and columns.
+    With available factors, only existing overview levels are chosen:
+    reading a decimated grid without overviews just subsamples the full-resolution cells.
+
+    :param params: GridParameters
+    :param sample_spacing: float, in the grid units
+    :param sampling_ratio: float, zero for no decimation
+    :param available_factors: collection of the decimation factors of the existing overviews, or None for any
+    :return: int, 1 for the full-resolution grid
+    """
+
+    if not sampling_ratio > 0.0 or not sample_spacing > 0.0 or not np.isfinite(sample_spacing):
+        return 1
+
+    cellsize = max(params.cellsizeEW, params.cellsizeNS)
+
+    factor = 1
+    chosen_factor = 1
+    while sample_spacing >= sampling_ratio * cellsize * factor * 2 and min(params.rows, params.cols) >= factor * 4:
+        factor *= 2
+        if available_factors is None or factor in available_factors:
+            chosen_factor = factor
+
+    return chosen_factor
+
+
+class GridInterpolator(object):
+    """
+    Interpolation of grid values at points.
+    Subclasses provide the cell values.
+    """
+
+    def __init__(self, params, source_params=None):
+        """
+        :param params: GridParameters
+        :param source_params: GridParameters of the full-resolution grid, when params are decimated
+        """
+
+        self.params = params
+        self.source_params = source_params
+
+    def cell_values(self, cols, rows):
+        """
+        Return the values of grid cells,
+        with rows counted from the bottom of the grid.
+        Cells outside the grid are returned as NaN.
+
+        :param cols: np.ndarray of int
+        :param rows: np.ndarray of int
+        :return: np.ndarray of float
+        """
+
+        raise NotImplementedError
+
+    def get_z_array(self, xs, ys):
+        """
+        Return the values of the cells containing the points.
+
+        :param xs: np.ndarray of x values
+        :param ys: np.ndarray of y values
+        :return: np.ndarray of float
+        """
+
+        cols = np.minimum(np.floor((xs - self.params.xMin) / self.params.cellsizeEW), self.params.cols - 1)
+        rows = np.minimum(np.floor((ys - self.params.yMin) / self.params.cellsizeNS), self.params.rows - 1)
+
+        return self.cell_values(cols.astype(np.int64), rows.astype(np.int64))
+
+    def interpolate_bilinear_array(self, xs, ys):
+        """
+        Bilinear interpolation of the points from the four nearest cell centers.
+
+        :param xs: np.ndarray of x values
+        :param ys: np.ndarray of y values
+        :return: np.ndarray of float
+        """
+
+        raster_xs, raster_ys = self.params.geogr2raster_array(xs, ys)
+
+        floor_xs_raster = np.floor(raster_xs)
+        ceil_xs_raster = np.ceil(raster_xs)
+        floor_ys_raster = np.floor(raster_ys)
+        ceil_ys_raster = np.ceil(raster_ys)
+
+        z1 = self.cell_values(floor_xs_raster.astype(np.int64), floor_ys_raster.astype(np.int64))
+        z2 = self.cell_values(ceil_xs_raster.astype(np.int64), floor_ys_raster.astype(np.int64))
+        z3 = self.cell_values(floor_xs_raster.astype(np.int64), ceil_ys_raster.astype(np.int64))
+        z4 = self.cell_values(ceil_xs_raster.astype(np.int64), ceil_ys_raster.astype(np.int64))
+
+        delta_xs = raster_xs - floor_xs_raster
+        delta_ys = raster_ys - floor_ys_raster
+
+        zs_x_a = z1 + (z2 - z1) * delta_xs
+        zs_x_b = z3 + (z4 - z3) * delta_xs
+
+        return zs_x_a + (zs_x_b - zs_x_a) * delta_ys
+
+    def interpolate_z_array(self, xs, ys):
+        """
+        Interpolate the grid values at the points:
+        bilinear interpolation inside the cell-center area,
+        value of the containing cell in the boundary band,
+        NaN outside the DEM.
+
+        :param xs: np.ndarray of x values
+        :param ys: np.ndarray of y values
+        :return: np.ndarray of float
+        """
+
+        zs = np.full(xs.shape, np.nan)
+
+        in_interpolation_area = self.params.point_in_interpolation_area_array(xs, ys)
+        in_boundary_band = self.params.point_in_dem_area_array(xs, ys) & ~in_interpolation_area
+
+        zs[in_interpolation_area] = self.interpolate_bilinear_array(xs[in_interpolation_area],
+                                                                    ys[in_interpolation_area])
+        zs[in_boundary_band] = self.get_z_array(xs[in_boundary_band],
+                                                ys[in_boundary_band])
+
+        # decimated grids can extend beyond the source grid
+        if self.source_params is not None:
+            zs[~self.source_params.point_in_dem_area_array(xs, ys)] = np.nan
+
+        return zs
@@ -5,9 +5,7 @@ from builtins import range
 from builtins import object
 import numpy as np
 
-from .qgs_tools import project_point
-
-from ..gsf.geometry import Vect, Point
+from ..gsf.geometry import MIN_SCALAR_VALUE, Vect, Point
 
 MIN_2D_SEPARATION_THRESHOLD = 1e-10
 MINIMUM_SEPARATION_THRESHOLD = 1e-10
@@ -193,55 +191,113 @@ class Segment(object):
         """
 
         assert densify_distance > 0.0
+        assert self.length_2d > 0.0
 
-        length2d = self.length_2d
-
-        assert length2d > 0.0
-
-        vect = self.vector()
-        vers_2d = vect.versor_2d
-        generator_vector = vers_2d.scale(densify_distance)
-
-        assert generator_vector.len_2d > 0.0
-
-        interpolated_line = Line([self.start_pt])
-        n = 0
-        while True:
-            n += 1
-            new_pt = self.start_pt.vect_offset(generator_vector.scale(n))
-            distance = self.start_pt.dist_2d(new_pt)
-            if distance >= length2d:
-                break
-            interpolated_line.add_pt(new_pt)
-        interpolated_line.add_pt(self.end_pt)
-
-        return interpolated_line
+        return Line([self.start_pt, self.end_pt]).densify_2d_line(densify_distance)
 
 
 class Line(object):
     """
-    A list of Point objects.
+    A sequence of points, stored as a contiguous N x 4 (x, y, z, t) float array.
     """
 
     def __init__(self, pts=None):
 
         if pts is None:
             pts = []
-        self._pts = pts
+
+        self._buffer = np.empty((max(len(pts), 1), 4), dtype=np.float64)
+        self._num_pts = 0
+        self._pts = None  # cached Point list, see pts
+
+        self.add_pts(pts)
+
+    @classmethod
+    def from_array(cls, arr):
+        """
+        Create a Line from a N x 4 (x, y, z, t) or N x 3 (x, y, z) array.
+        The array values are copied.
+
+        :param arr: 2D np.ndarray
+        :return: Line instance
+        """
+
+        arr = np.asarray(arr, dtype=np.float64)
+        assert arr.ndim == 2 and 3 <= arr.shape[1] <= 4
+
+        obj = cls()
+        obj._buffer = np.full((max(arr.shape[0], 1), 4), np.nan)
+        obj._buffer[:arr.shape[0], :arr.shape[1]] = arr
+        obj._num_pts = arr.shape[0]
+
+        return obj
+
+    @classmethod
+    def from_arrays(cls, xs, ys, zs=None, ts=None):
+        """
+        Create a Line from coordinate arrays.
+        Missing z and t values are set to NaN.
+
+        :param xs: array-like of x values
+        :param ys: array-like of y values
+        :param zs: array-like of z values
+        :param ts: array-like of t values
+        :return: Line instance
+        """
+
+        xs = np.asarray(xs, dtype=np.float64)
+
+        arr = np.full((xs.size, 4), np.nan)
+        arr[:, 0] = xs
+        arr[:, 1] = ys
+        if zs is not None:
+            arr[:, 2] = zs
+        if ts is not None:
+            arr[:, 3] = ts
+
+        return cls.from_array(arr)
+
+    @property
+    def array(self):
+        """
+        The N x 4 (x, y, z, t) array of the line points.
+        It is a view on the line storage: it is not meant to be modified in place,
+        points being added with add_pt and add_pts.
+
+        :return: 2D np.ndarray
+        """
+
+        return self._buffer[:self._num_pts]
 
     @property
     def pts(self):
+        """
+        The line points, as a list of Point instances.
+        The list is created at the first access and kept until points are added.
+
+        :return: list of Point
+        """
+
+        if self._pts is None:
+            self._pts = [Point.from_array(row) for row in self.array]
 
         return self._pts
 
     @property
     def num_pts(self):
 
-        return len(self.pts)
+        return self._num_pts
 
     def clone(self):
 
-        return Line([pt.clone() for pt in self.pts])
+        return Line.from_array(self.array)
+
+    def _reserve(self, num_pts):
+
+        if num_pts > self._buffer.shape[0]:
+            buffer = np.empty((max(num_pts, 2 * self._buffer.shape[0]), 4), dtype=np.float64)
+            buffer[:self._num_pts] = self.array
+            self._buffer = buffer
 
     def add_pt(self, pt):
         """
@@ -252,7 +308,10 @@ class Line(object):
         :return: self
         """
 
-        self.pts.append(pt)
+        self._reserve(self._num_pts + 1)
+        self._buffer[self._num_pts] = pt.v
+        self._num_pts += 1
+        self._pts = None
 
     def add_pts(self, pt_list):
         """
@@ -263,22 +322,38 @@ class Line(object):
         :return: self
         """
 
-        self._pts += pt_list
+        self._reserve(self._num_pts + len(pt_list))
+        for pt in pt_list:
+            self._buffer[self._num_pts] = pt.v
+            self._num_pts += 1
+        self._pts = None
+
+    def x_array(self):
+
+        return self.array[:, 0]
+
+    def y_array(self):
+
+        return self.array[:, 1]
+
+    def z_array(self):
+
+        return self.array[:, 2]
 
     @property
     def x_list(self):
 
-        return [pt.x for pt in self.pts]
+        return self.x_array().tolist()
 
     @property
     def y_list(self):
 
-        return [pt.y for pt in self.pts]
+        return self.y_array().tolist()
 
     @property
     def z_list(self):
 
-        return [pt.z for pt in self.pts]
+        return self.z_array().tolist()
 
     def xy_lists(self):
 
@@ -287,36 +362,32 @@ class Line(object):
     @property
     def x_min(self):
 
-        return np.nanmin(self.x_list)
+        return np.nanmin(self.x_array())
 
     @property
     def x_max(self):
 
-        return np.nanmax(self.x_list)
+        return np.nanmax(self.x_array())
 
     @property
     def y_min(self):
 
-        return np.nanmin(self.y_list)
+        return np.nanmin(self.y_array())
 
     @property
     def y_max(self):
 
-        return np.nanmax(self.y_list)
+        return np.nanmax(self.y_array())
 
     @property
     def z_min(self):
 
-        return np.nanmin(self.z_list)
+        return np.nanmin(self.z_array())
 
     @property
     def z_max(self):
 
-        return np.nanmax(self.z_list)
-
-    def z_array(self):
-
-        return np.array(self.z_list)
+        return np.nanmax(self.z_array())
 
     @property
     def z_mean(self):
@@ -342,12 +413,7 @@ class Line(object):
 
         assert self.num_pts >= 2
 
-        new_line = Line(self.pts[:1])
-        for ndx in range(1, self.num_pts):
-            if not self.pts[ndx].coincident(new_line.pts[-1]):
-                new_line.add_pt(self.pts[ndx])
-
-        return new_line
+        return Line.from_array(self.array[not_coincident_mask(self.array)])
 
     def as_segments(self):
         """
@@ -356,37 +422,131 @@ class Line(object):
         :return: list of Segment objects
         """
 
-        pts_pairs = list(zip(self.pts[:-1], self.pts[1:]))
+        pts = self.pts
+        pts_pairs = list(zip(pts[:-1], pts[1:]))
 
         segments = [Segment(pt_a, pt_b) for (pt_a, pt_b) in pts_pairs]
 
         return segments
 
-    def densify_2d_line(self, sample_distance):
+    def densify_2d_line(self, sample_distance, continuous=False):
         """
         Densify a line into a new line instance,
         using the provided sample distance.
+        By default the sampling restarts at each line vertex;
+        when continuous is True, samples are spaced along the whole line
+        at multiples of the sample distance from the line start, and the line vertices are kept.
+        Elevations are linearly interpolated along the segments.
         Returned Line instance has coincident successive points removed.
         
         :param sample_distance: float
+        :param continuous: bool
         :return: Line instance
         """
 
         assert sample_distance > 0.0
+        assert self.num_pts >= 2
+
+        segment_lengths = self.segment_lengths_2d()
+        vertex_chainages = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+
+        if continuous:
+            stations = np.arange(0.0, vertex_chainages[-1], sample_distance)
+            segment_ndxs = np.searchsorted(vertex_chainages, stations, side='right') - 1
+            offsets = stations - vertex_chainages[segment_ndxs]
+        else:
+            # for each segment, the offsets n * sample_distance < segment length
+            samples_nums = np.ceil(segment_lengths / sample_distance).astype(np.int64)
+            segment_ndxs = np.repeat(np.arange(segment_lengths.size), samples_nums)
+            first_sample_ndxs = np.repeat(np.cumsum(samples_nums) - samples_nums, samples_nums)
+            offsets = (np.arange(segment_ndxs.size) - first_sample_ndxs) * sample_distance
+            stations = vertex_chainages[segment_ndxs] + offsets
+
+        samples = self._segment_samples(segment_lengths, segment_ndxs, offsets)
+
+        if continuous:
+            # merge samples and vertices in chainage order, vertices first at equal chainage
+            chainages = np.concatenate((vertex_chainages, stations))
+            order = np.argsort(chainages, kind='stable')
+            densified_pts = np.concatenate((self.array, samples))[order]
+        else:
+            densified_pts = np.concatenate((samples, self.array[-1:]))
+
+        return Line.from_array(densified_pts).remove_coincident_points()
+
+    def _segment_samples(self, segment_lengths, segment_ndxs, offsets):
+        """
+        Points at the given 2D offsets from the start of the given segments,
+        with elevations linearly interpolated.
+
+        :param segment_lengths: np.ndarray of segment 2D lengths
+        :param segment_ndxs: np.ndarray of int
+        :param offsets: np.ndarray of float
+        :return: N x 4 np.ndarray
+        """
+
+        start_pts = self.array[segment_ndxs]
+        end_pts = self.array[segment_ndxs + 1]
+
+        samples = start_pts.copy()
+        fractions = (offsets / segment_lengths[segment_ndxs])[:, np.newaxis]
+        samples[:, :3] += (end_pts[:, :3] - start_pts[:, :3]) * fractions
+
+        return samples
+
+    def densify_2d_line_chunks(self, sample_distance, chunk_size):
+        """
+        Densify a line as densify_2d_line does (sampling restarting at each vertex),
+        yielding the densified line in consecutive chunks of at most chunk_size points,
+        so that the whole densified line is never created at once.
+
+        :param sample_distance: float
+        :param chunk_size: int
+        :return: generator of Line instances
+        """
+
+        assert sample_distance > 0.0
+        assert chunk_size > 0
+        assert self.num_pts >= 2
+
+        segment_lengths = self.segment_lengths_2d()
+        samples_nums = np.ceil(segment_lengths / sample_distance).astype(np.int64)
+        samples_ends = np.cumsum(samples_nums)
+        segment_samples_num = int(samples_ends[-1])
 
-        segments = self.as_segments()
+        previous_pt = None
+        for chunk_start in range(0, segment_samples_num + 1, chunk_size):
 
-        densified_line_list = [segment.densify_2d_segment(sample_distance) for segment in segments]
+            sample_ndxs = np.arange(chunk_start, min(segment_samples_num + 1, chunk_start + chunk_size))
 
-        assert len(densified_line_list) > 0
+            segment_sample_ndxs = sample_ndxs[sample_ndxs < segment_samples_num]
+            segment_ndxs = np.searchsorted(samples_ends, segment_sample_ndxs, side='right')
+            offsets = (segment_sample_ndxs - samples_ends[segment_ndxs] + samples_nums[segment_ndxs]) * sample_distance
 
-        densifyied_multiline = MultiLine(densified_line_list)
+            chunk_pts = self._segment_samples(segment_lengths, segment_ndxs, offsets)
+            if sample_ndxs[-1] == segment_samples_num:
+                chunk_pts = np.concatenate((chunk_pts, self.array[-1:]))
 
-        densifyied_line = densifyied_multiline.to_line()
+            # coincident points are removed also across the chunk boundaries
+            if previous_pt is not None:
+                chunk_pts = np.concatenate((previous_pt, chunk_pts))
+            chunk_pts = chunk_pts[not_coincident_mask(chunk_pts)]
+            if previous_pt is not None:
+                chunk_pts = chunk_pts[1:]
 
-        densifyied_line_wo_coinc_pts = densifyied_line.remove_coincident_points()
+            if chunk_pts.shape[0] > 0:
+                previous_pt = chunk_pts[-1:]
+                yield Line.from_array(chunk_pts)
+
+    def densified_2d_pts_max_num(self, sample_distance):
+        """
+        Upper limit of the number of points of the densified line.
+
+        :param sample_distance: float
+        :return: int
+        """
 
-        return densifyied_line_wo_coinc_pts
+        return int(np.sum(np.ceil(self.segment_lengths_2d() / sample_distance))) + 1
 
     def join(self, another):
         """
@@ -395,75 +555,104 @@ class Line(object):
         and orientation mismatches between the two original lines
         """
 
-        return Line(self.pts + another.pts)
+        return Line.from_array(np.concatenate((self.array, another.array)))
+
+    def segment_lengths_2d(self):
+        """
+        Horizontal lengths of the line segments.
+
+        :return: np.ndarray, with num_pts - 1 values
+        """
+
+        deltas = np.diff(self.array[:, :2], axis=0)
+
+        return np.hypot(deltas[:, 0], deltas[:, 1])
+
+    def segment_lengths_3d(self):
+        """
+        Spatial lengths of the line segments.
+
+        :return: np.ndarray, with num_pts - 1 values
+        """
+
+        deltas = np.diff(self.array[:, :3], axis=0)
+
+        return np.sqrt(np.sum(deltas * deltas, axis=1))
 
     @property
     def length_3d(self):
 
-        length = 0.0
-        for ndx in range(self.num_pts - 1):
-            length += self.pts[ndx].dist_3d(self.pts[ndx + 1])
-        return length
+        return float(np.sum(self.segment_lengths_3d()))
 
     @property
     def length_2d(self):
 
-        length = 0.0
-        for ndx in range(self.num_pts - 1):
-            length += self.pts[ndx].dist_2d(self.pts[ndx + 1])
-        return length
+        return float(np.sum(self.segment_lengths_2d()))
 
-    def incremental_length_3d(self):
+    def incremental_length_3d_array(self):
 
-        incremental_length_list = []
-        length = 0.0
-        incremental_length_list.append(length)
-        for ndx in range(self.num_pts - 1):
-            length += self.pts[ndx].dist_3d(self.pts[ndx + 1])
-            incremental_length_list.append(length)
+        return np.concatenate(([0.0], np.cumsum(self.segment_lengths_3d())))
 
-        return incremental_length_list
+    def incremental_length_2d_array(self):
 
-    def incremental_length_2d(self):
+        return np.concatenate(([0.0], np.cumsum(self.segment_lengths_2d())))
 
-        lIncrementalLengths = []
-        length = 0.0
-        lIncrementalLengths.append(length)
-        for ndx in range(self.num_pts - 1):
-            length += self.pts[ndx].dist_2d(self.pts[ndx + 1])
-            lIncrementalLengths.append(length)
+    def incremental_length_3d(self):
 
-        return lIncrementalLengths
+        return self.incremental_length_3d_array().tolist()
+
+    def incremental_length_2d(self):
+
+        return self.incremental_length_2d_array().tolist()
 
     def reverse_direction(self):
 
-        new_line = self.clone()
-        new_line.pts.reverse()  # in-place operation on new_line
+        return Line.from_array(self.array[::-1])
 
-        return new_line
+    def slopes_array(self):
+        """
+        Slopes of the line segments, in degrees, positive when upward.
+        The slope value for the last point is unknown and set to NaN,
+        as for vertical segments with no elevation change.
 
-    def slopes(self):
+        :return: np.ndarray
+        """
 
-        lSlopes = []
-        for ndx in range(self.num_pts - 1):
-            vector = Segment(self.pts[ndx], self.pts[ndx + 1]).vector()
-            lSlopes.append(-vector.slope)  # minus because vector convetion is positive downward
-        lSlopes.append(np.nan)  # slope value for last point is unknown
+        slopes = np.full(self.num_pts, np.nan)
+        if self.num_pts < 2:
+            return slopes
 
-        return lSlopes
+        lengths_2d = self.segment_lengths_2d()
+        delta_zs = np.diff(self.z_array())
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            segment_slopes = np.degrees(np.arctan(delta_zs / lengths_2d))
+
+        vertical = lengths_2d == 0.0
+        segment_slopes[vertical] = np.sign(delta_zs[vertical]) * 90.0
+        segment_slopes[vertical & (delta_zs == 0.0)] = np.nan
+        segment_slopes[np.fabs(segment_slopes) <= MIN_SCALAR_VALUE] = 0.0
+
+        slopes[:-1] = segment_slopes
+
+        return slopes
+
+    def slopes(self):
+
+        return self.slopes_array().tolist()
 
     def absolute_slopes(self):
 
-        return list(map(abs, self.slopes()))
+        return np.fabs(self.slopes_array()).tolist()
 
     def crs_project(self, srcCrs, destCrs):
 
-        points = []
-        for point in self.pts:
-            destCrs_point = project_point(point, srcCrs, destCrs)
-            points.append(destCrs_point)
+        # imported here, so that the geometries can be used without QGIS
+        from .qgs_tools import project_xy_arrays
+
+        xs, ys = project_xy_arrays(self.x_array(), self.y_array(), srcCrs, destCrs)
 
-        return Line(points)
+        return Line.from_arrays(xs, ys)
 
 
 class MultiLine(object):
@@ -553,7 +742,10 @@ class MultiLine(object):
 
     def to_line(self):
 
-        return Line([point for line in self.lines for point in line.pts])
+        if not self.lines:
+            return Line()
+
+        return Line.from_array(np.concatenate([line.array for line in self.lines]))
 
     def crs_project(self, srcCrs, destCrs):
 
@@ -563,11 +755,11 @@ class MultiLine(object):
 
         return MultiLine(lines)
 
-    def densify_2d_multiline(self, sample_distance):
+    def densify_2d_multiline(self, sample_distance, continuous=False):
 
         lDensifiedLines = []
         for line in self.lines:
-            lDensifiedLines.append(line.densify_2d_line(sample_distance))
+            lDensifiedLines.append(line.densify_2d_line(sample_distance, continuous))
 
         return MultiLine(lDensifiedLines)
 
@@ -620,6 +812,211 @@ class ParamLine3D(object):
                      z1 - n * k)
 
 
+def not_coincident_mask(pts_array, tolerance=MINIMUM_SEPARATION_THRESHOLD):
+    """
+    Mask of the points that are not coincident with the last kept point.
+    The first point is always kept.
+    Points with undefined distances from the last kept point are considered coincident,
+    as in Point.coincident.
+    Points are first compared with their previous point all at once:
+    only the points following a removed one are compared again, one by one.
+
+    :param pts_array: N x 4 (x, y, z, t) np.ndarray
+    :param tolerance: float
+    :return: np.ndarray of bool
+    """
+
+    def separated(deltas):
+
+        with np.errstate(invalid='ignore'):
+            return (np.hypot(deltas[..., 0], deltas[..., 1]) > tolerance) | \
+                   (np.sqrt(np.sum(deltas * deltas, axis=-1)) > tolerance)
+
+    pts = pts_array[:, :3]
+
+    mask = np.ones(pts.shape[0], dtype=bool)
+    mask[1:] = separated(np.diff(pts, axis=0))
+
+    # a point following a removed one is compared with the last kept point,
+    # i.e. the point preceding the removed run
+    removed_ndxs = np.flatnonzero(~ mask)
+    removed_pos = 0
+    while removed_pos < removed_ndxs.size:
+
+        ndx = removed_ndxs[removed_pos]
+        last_kept_pt = pts[ndx - 1]
+
+        ndx += 1
+        while ndx < pts.shape[0] and not separated(pts[ndx] - last_kept_pt):
+            mask[ndx] = False
+            ndx += 1
+
+        if ndx < pts.shape[0]:
+            mask[ndx] = True
+
+        removed_pos = np.searchsorted(removed_ndxs, ndx, side='right')
+
+    return mask
+
+
+def multilines_to_array(multilines):
+    """
+    Flatten a list of MultiLine into a single point array,
+    with offsets describing the line and multiline structure.
+
+    :param multilines: list of MultiLine
+    :return: tuple of N x 4 (x, y, z, t) np.ndarray,
+             line offsets (np.ndarray of point indices, one more than the lines)
+             and multiline offsets (np.ndarray of line indices, one more than the multilines)
+    """
+
+    lines = [line for multiline in multilines for line in multiline.lines]
+
+    if lines:
+        pts_array = np.concatenate([line.array for line in lines])
+    else:
+        pts_array = np.empty((0, 4))
+
+    line_offsets = np.cumsum([0] + [line.num_pts for line in lines])
+    multiline_offsets = np.cumsum([0] + [multiline.num_parts for multiline in multilines])
+
+    return pts_array, line_offsets, multiline_offsets
+
+
+def multilines_from_array(pts_array, line_offsets, multiline_offsets):
+    """
+    Inverse of multilines_to_array.
+
+    :param pts_array: N x 3 (x, y, z) or N x 4 (x, y, z, t) np.ndarray
+    :param line_offsets: np.ndarray of point indices
+    :param multiline_offsets: np.ndarray of line indices
+    :return: list of MultiLine
+    """
+
+    lines = [Line.from_array(pts_array[line_offsets[ndx]:line_offsets[ndx + 1]])
+             for ndx in range(len(line_offsets) - 1)]
+
+    return [MultiLine(lines[multiline_offsets[ndx]:multiline_offsets[ndx + 1]])
+            for ndx in range(len(multiline_offsets) - 1)]
+
+
+def multilines_segments(pts_array, line_offsets):
+    """
+    Indices of the segments of flattened lines (see multilines_to_array):
+    pairs of consecutive points belonging to the same line.
+
+    :param pts_array: N x 2 or more np.ndarray
+    :param line_offsets: np.ndarray of point indices
+    :return: np.ndarray of segment start point indices
+    """
+
+    is_segment = np.ones(max(pts_array.shape[0] - 1, 0), dtype=bool)
+    line_ends = np.asarray(line_offsets[1:-1], dtype=np.int64) - 1
+    is_segment[line_ends[(0 <= line_ends) & (line_ends < is_segment.size)]] = False
+
+    return np.flatnonzero(is_segment)
+
+
+def segments_intersections_2d(starts_a, ends_a, starts_b, ends_b, half_open_a=None, tolerance=1e-9,
+                              max_pairs=4000000):
+    """
+    Intersections between all the segments of a set (e.g. a profile) and all the segments of a second set,
+    with the parametric formulation p = start_a + t (end_a - start_a) = start_b + u (end_b - start_b).
+    Segment pairs are first filtered by bounding box overlap, then the remaining pairs are all tested at once.
+    The bounding box tests are done on blocks of segments of the first set, of at most max_pairs pairs.
+    Parallel and zero-length segments do not intersect.
+
+    :param starts_a: M x 2 np.ndarray
+    :param ends_a: M x 2 np.ndarray
+    :param starts_b: N x 2 np.ndarray
+    :param ends_b: N x 2 np.ndarray
+    :param half_open_a: np.ndarray of bool, segments of the first set excluding their end point
+                        (e.g. to not count twice the intersections at the shared vertices of a line), or None
+    :param tolerance: float, tolerance of the segment parameters
+    :param max_pairs: int, maximum number of segment pairs tested for bounding box overlap at once
+    :return: tuple of indices of the intersecting segments of the first and of the second set,
+             and of the t and u parameters of the intersections, as np.ndarray
+    """
+
+    starts_a, ends_a = np.asarray(starts_a, dtype=np.float64), np.asarray(ends_a, dtype=np.float64)
+    starts_b, ends_b = np.asarray(starts_b, dtype=np.float64), np.asarray(ends_b, dtype=np.float64)
+
+    mins_a, maxs_a = np.minimum(starts_a, ends_a), np.maximum(starts_a, ends_a)
+    mins_b, maxs_b = np.minimum(starts_b, ends_b), np.maximum(starts_b, ends_b)
+
+    # candidate pairs, in first set and second set order
+
+    block_size = max(1, max_pairs // max(1, starts_b.shape[0]))
+    block_ndxs_a, block_ndxs_b = [], []
+    for block_start in range(0, starts_a.shape[0], block_size):
+        block_end = block_start + block_size
+        overlapping = np.all(mins_b[np.newaxis, :, :] <= maxs_a[block_start:block_end, np.newaxis, :], axis=2) & \
+                      np.all(maxs_b[np.newaxis, :, :] >= mins_a[block_start:block_end, np.newaxis, :], axis=2)
+        pair_ndxs_a, pair_ndxs_b = np.nonzero(overlapping)
+        block_ndxs_a.append(pair_ndxs_a + block_start)
+        block_ndxs_b.append(pair_ndxs_b)
+
+    if not block_ndxs_a:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+
+    ndxs_a = np.concatenate(block_ndxs_a).astype(np.int64)
+    ndxs_b = np.concatenate(block_ndxs_b).astype(np.int64)
+
+    # parametric test of all the candidate pairs
+
+    deltas_a = ends_a[ndxs_a] - starts_a[ndxs_a]
+    deltas_b = ends_b[ndxs_b] - starts_b[ndxs_b]
+    offsets = starts_b[ndxs_b] - starts_a[ndxs_a]
+
+    denominators = deltas_a[:, 0] * deltas_b[:, 1] - deltas_a[:, 1] * deltas_b[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ts = (offsets[:, 0] * deltas_b[:, 1] - offsets[:, 1] * deltas_b[:, 0]) / denominators
+        us = (offsets[:, 0] * deltas_a[:, 1] - offsets[:, 1] * deltas_a[:, 0]) / denominators
+
+    if half_open_a is None:
+        ts_max = np.full(ndxs_a.size, 1.0 + tolerance)
+    else:
+        ts_max = np.where(np.asarray(half_open_a, dtype=bool)[ndxs_a], 1.0 - tolerance, 1.0 + tolerance)
+
+    intersecting = (denominators != 0.0) & (ts >= - tolerance) & (ts < ts_max) & \
+                   (us >= - tolerance) & (us <= 1.0 + tolerance)
+
+    return ndxs_a[intersecting], \
+           ndxs_b[intersecting], \
+           np.clip(ts[intersecting], 0.0, 1.0), \
+           np.clip(us[intersecting], 0.0, 1.0)
+
+
+def distances_along_line(line, xs, ys):
+    """
+    Distances from the start of a line, measured along the line,
+    of points lying on it, each one located on its nearest line segment.
+
+    :param line: Line
+    :param xs: np.ndarray of x values
+    :param ys: np.ndarray of y values
+    :return: np.ndarray of distances
+    """
+
+    line_pts = line.array[:, :2]
+    segment_deltas = np.diff(line_pts, axis=0)
+    segment_lengths = np.hypot(segment_deltas[:, 0], segment_deltas[:, 1])
+    segment_starts_s = np.concatenate(([0.0], np.cumsum(segment_lengths)[:-1]))
+
+    dxs = xs[:, np.newaxis] - line_pts[:-1, 0]
+    dys = ys[:, np.newaxis] - line_pts[:-1, 1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ts = (dxs * segment_deltas[:, 0] + dys * segment_deltas[:, 1]) / segment_lengths ** 2
+    ts = np.where(segment_lengths > 0.0, np.clip(ts, 0.0, 1.0), 0.0)
+
+    offsets = np.hypot(dxs - ts * segment_deltas[:, 0], dys - ts * segment_deltas[:, 1])
+    nearest_ndxs = np.argmin(offsets, axis=1)
+    pt_ndxs = np.arange(nearest_ndxs.size)
+
+    return segment_starts_s[nearest_ndxs] + ts[pt_ndxs, nearest_ndxs] * segment_lengths[nearest_ndxs]
+
+
 def eq_xy_pair(xy_pair_1, xy_pair_2):
 
     if xy_pair_1[0] == xy_pair_2[0] and xy_pair_1[1] == xy_pair_2[1]:
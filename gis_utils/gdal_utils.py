@@ -8,7 +8,7 @@ import os
 
 from osgeo import ogr, gdal, osr
 
-from .errors import RasterParametersException, OGRIOException
+from .errors import RasterParametersException, RasterIOException, OGRIOException
 
 
 from ..gsf.geometry import Point
@@ -467,3 +467,86 @@ def ogr_write_point_result(point_shapelayer, field_list, rec_values_list2, geom_
         curr_Pt_geom.Destroy()
         curr_Pt_shape.Destroy()
 
+
+def overview_factors(dataset):
+    """
+    Decimation factors of the overview levels of the first band of a GDAL dataset.
+
+    :param dataset: osgeo.gdal.Dataset
+    :return: set of int
+    """
+
+    band = dataset.GetRasterBand(1)
+    factors = set()
+    for overview_ndx in range(band.GetOverviewCount()):
+        overview_cols = band.GetOverview(overview_ndx).XSize
+        factors.add(int(round(dataset.RasterXSize / float(overview_cols))))
+
+    return factors
+
+
+def raster_overview_factors(raster_path):
+    """
+    Decimation factors of the existing overview levels of a raster, internal or external.
+
+    :param raster_path: str
+    :return: set of int
+    """
+
+    dataset = gdal.Open(raster_path, gdal.GA_ReadOnly)
+    if dataset is None:
+        raise RasterIOException("Unable to open raster {}".format(raster_path))
+
+    factors = overview_factors(dataset)
+    dataset = None
+
+    return factors
+
+
+def missing_overview_factors(raster_path, max_factor):
+    """
+    Power-of-two decimation factors, up to a maximum factor, with no overview level in a raster.
+
+    :param raster_path: str
+    :param max_factor: int, the largest decimation factor
+    :return: list of int
+    """
+
+    factors = []
+    factor = 2
+    while factor <= max_factor:
+        factors.append(factor)
+        factor *= 2
+
+    if not factors:
+        return []
+
+    existing_factors = raster_overview_factors(raster_path)
+
+    return [factor for factor in factors if factor not in existing_factors]
+
+
+def build_raster_overviews(raster_path, max_factor, resampling="AVERAGE"):
+    """
+    Build the missing power-of-two overview levels of a raster, up to a decimation factor.
+    Overviews are written into an external .ovr file, next to the raster: the raster itself is not modified.
+
+    :param raster_path: str
+    :param max_factor: int, the largest decimation factor
+    :param resampling: str, the GDAL overview resampling method
+    :return: list of the built decimation factors
+    """
+
+    missing_factors = missing_overview_factors(raster_path, max_factor)
+    if missing_factors:
+
+        dataset = gdal.Open(raster_path, gdal.GA_ReadOnly)
+        if dataset is None:
+            raise RasterIOException("Unable to open raster {}".format(raster_path))
+
+        if dataset.BuildOverviews(resampling, missing_factors) != 0:
+            raise RasterIOException("Unable to build overviews for raster {}".format(raster_path))
+
+        dataset = None
+
+    return missing_factors
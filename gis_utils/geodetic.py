@@ -1,7 +1,8 @@
 from __future__ import division
 
 from builtins import object
-from math import sqrt, radians, sin, cos
+
+import numpy as np
 
 from ..gsf.geometry import Point
 from .time_utils import standard_gpstime_to_seconds
@@ -14,20 +15,24 @@ WGS84 = {'semi-major axis': 6378137.0,
 def n_phi(phi_rad):
     a = WGS84['semi-major axis']
     e_squared = WGS84['first eccentricity squared']
-    return a / sqrt(1.0 - e_squared * sin(phi_rad) ** 2)
+    return a / np.sqrt(1.0 - e_squared * np.sin(phi_rad) ** 2)
 
 
 def geodetic2ecef(lat, lon, height):
+    """
+    Convert geodetic coordinates into ECEF ones.
+    Works with both scalar and array values.
+    """
 
     e_squared = WGS84['first eccentricity squared']
 
-    lat_rad, lon_rad = radians(lat), radians(lon)
+    lat_rad, lon_rad = np.radians(lat), np.radians(lon)
 
     nphi = n_phi(lat_rad)
 
-    x = (nphi + height) * cos(lat_rad) * cos(lon_rad)
-    y = (nphi + height) * cos(lat_rad) * sin(lon_rad)
-    z = (nphi * (1 - e_squared) + height) * sin(lat_rad)
+    x = (nphi + height) * np.cos(lat_rad) * np.cos(lon_rad)
+    y = (nphi + height) * np.cos(lat_rad) * np.sin(lon_rad)
+    z = (nphi * (1 - e_squared) + height) * np.sin(lat_rad)
 
     return x, y, z
 
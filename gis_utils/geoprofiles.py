@@ -0,0 +1,270 @@
+
+from builtins import map
+from builtins import zip
+from builtins import object
+
+import numpy as np
+
+
+# This module does not depend on QGIS:
+# DEM layers are only stored, as references, in the topographic profiles.
+
+
+class GeoProfilesSet(object):
+    """
+    Represents a set of ProfileElements instances,
+    stored as a list
+    """
+
+    def __init__(self, name=""):
+
+        self._name = name
+        self._geoprofiles = []
+        self.profiles_created = False
+        self.plot_params = None
+
+        # colors of the geological elements, as restored from the profiles cache
+        self.plane_attitudes_colors = []
+        self.polygon_classification_colors = None
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, new_name):
+
+        self._name = new_name
+
+    @property
+    def geoprofiles(self):
+
+        return self._geoprofiles
+
+    @property
+    def geoprofiles_num(self):
+
+        return len(self._geoprofiles)
+
+    def geoprofile(self, ndx):
+
+        return self._geoprofiles[ndx]
+
+    def append(self, geoprofile):
+
+        self._geoprofiles.append(geoprofile)
+
+    def insert(self, ndx, geoprofile):
+
+        self._geoprofiles.insert(ndx, geoprofile)
+
+    def move(self, ndx_init, ndx_final):
+
+        geoprofile = self._geoprofiles.pop(ndx_init)
+        self.insert(ndx_final, geoprofile)
+
+    def move_up(self, ndx):
+
+        self.move(ndx, ndx -1)
+
+    def move_down(self, ndx):
+
+        self.move(ndx, ndx + 1)
+
+    def remove(self, ndx):
+
+        _ = self._geoprofiles.pop(ndx)
+
+
+class GeoProfile(object):
+    """
+    Class representing the topographic and geological elements
+    embodying a single geological profile.
+    """
+
+    def __init__(self):
+
+        self.source_data_type = None
+        self.original_line = None
+        self.sample_distance = None  # max spacing along profile; float
+        self.resampled_line = None
+
+        self.topo_profiles = None  # instance of ProfileElevations
+        self.geoplane_attitudes = []
+        self.geoplane_attitudes_inputs = []  # GeologicalInput instances (or None), one for each attitude set
+        self.geosurfaces = []
+        self.geosurfaces_ids = []
+        self.lineaments = []
+        self.outcrops = []
+        self.outcrops_input = None  # GeologicalInput instance, or None
+
+    def set_topo_profiles(self, topo_profiles):
+
+        self.topo_profiles = topo_profiles
+
+    def add_intersections_pts(self, intersection_list):
+
+        self.lineaments += intersection_list
+
+    def add_intersections_lines(self, formation_list, intersection_line3d_list, intersection_polygon_s_list2,
+                                geological_input=None):
+
+        self.outcrops = list(zip(formation_list, intersection_line3d_list, intersection_polygon_s_list2))
+        self.outcrops_input = geological_input
+
+    def get_current_dem_names(self):
+
+        return self.topo_profiles.surface_names
+
+    def max_s(self):
+        return self.topo_profiles.max_s()
+
+    def min_z_topo(self):
+        return self.topo_profiles.min_z()
+
+    def max_z_topo(self):
+        return self.topo_profiles.max_z()
+
+    def min_z_plane_attitudes(self):
+
+        # TODO:  manage case for possible nan p_z values
+        return min([plane_attitude.pt_3d.p_z for plane_attitude_set in self.geoplane_attitudes for plane_attitude in
+                    plane_attitude_set if 0.0 <= plane_attitude.sign_hor_dist <= self.max_s()])
+
+    def max_z_plane_attitudes(self):
+
+        # TODO:  manage case for possible nan p_z values
+        return max([plane_attitude.pt_3d.p_z for plane_attitude_set in self.geoplane_attitudes for plane_attitude in
+                    plane_attitude_set if 0.0 <= plane_attitude.sign_hor_dist <= self.max_s()])
+
+    def min_z_curves(self):
+
+        return min([pt_2d.p_y for multiline_2d_list in self.geosurfaces for multiline_2d in multiline_2d_list for line_2d in
+                    multiline_2d.lines for pt_2d in line_2d.pts if 0.0 <= pt_2d.p_x <= self.max_s()])
+
+    def max_z_curves(self):
+
+        return max([pt_2d.p_y for multiline_2d_list in self.geosurfaces for multiline_2d in multiline_2d_list for line_2d in
+                    multiline_2d.lines for pt_2d in line_2d.pts if 0.0 <= pt_2d.p_x <= self.max_s()])
+
+    def min_z(self):
+
+        min_z = self.min_z_topo()
+
+        if len(self.geoplane_attitudes) > 0:
+            min_z = min([min_z, self.min_z_plane_attitudes()])
+
+        if len(self.geosurfaces) > 0:
+            min_z = min([min_z, self.min_z_curves()])
+
+        return min_z
+
+    def max_z(self):
+
+        max_z = self.max_z_topo()
+
+        if len(self.geoplane_attitudes) > 0:
+            max_z = max([max_z, self.max_z_plane_attitudes()])
+
+        if len(self.geosurfaces) > 0:
+            max_z = max([max_z, self.max_z_curves()])
+
+        return max_z
+
+    def add_plane_attitudes(self, plane_attitudes, geological_input=None):
+
+        self.geoplane_attitudes.append(plane_attitudes)
+        self.geoplane_attitudes_inputs.append(geological_input)
+
+    def add_curves(self, lMultilines, lIds):
+
+        self.geosurfaces.append(lMultilines)
+        self.geosurfaces_ids.append(lIds)
+
+
+class ProfileElevations(object):
+
+    def __init__(self):
+
+        #self.line_source = None
+        self.dem_params = []
+        self.gpx_params = None
+
+        self.planar_xs = None
+        self.planar_ys = None
+        self.lons = None
+        self.lats = None
+        self.times = None  # np.ndarray of seconds since January 1, 1970 (UTC), NaN when missing
+        self.profile_s = None
+
+        self.surface_names = []
+        self.surface_errors = []  # sampling error messages, None for successful surfaces
+
+        self.profile_s3ds = []
+        self.profile_zs = []
+        self.profile_dirslopes = []
+
+        self.swath_half_width = None
+        self.profile_swaths = []  # SwathElevations instances, one for each surface, for swath profiles
+
+        self.inverted = None
+
+        self.statistics_calculated = False
+        self.profile_created = False
+
+    def max_s(self):
+
+        return self.profile_s[-1]
+
+    def min_z(self):
+
+        return min(list(map(np.nanmin, self.profile_zs + [swath.min_zs for swath in self.profile_swaths])))
+
+    def max_z(self):
+
+        return max(list(map(np.nanmax, self.profile_zs + [swath.max_zs for swath in self.profile_swaths])))
+
+    @property
+    def absolute_slopes(self):
+
+        return list(map(np.fabs, self.profile_dirslopes))
+
+
+class DEMParams(object):
+
+    def __init__(self, layer, params):
+
+        self.layer = layer
+        self.params = params
+
+
+class PlaneAttitude(object):
+
+    def __init__(self, rec_id, source_point_3d, source_geol_plane, point_3d, slope_rad, dwnwrd_sense, sign_hor_dist):
+
+        self.id = rec_id
+        self.src_pt_3d = source_point_3d
+        self.src_geol_plane = source_geol_plane
+        self.pt_3d = point_3d
+        self.slope_rad = slope_rad
+        self.dwnwrd_sense = dwnwrd_sense
+        self.sign_hor_dist = sign_hor_dist
+
+
+class GeologicalInput(object):
+    """
+    Source of a geological element added to the profiles (a set of plane attitudes, or the outcrops):
+    the layer id, the element parameters and the fingerprint of the inputs,
+    used to tell whether a cached element is still valid.
+    """
+
+    def __init__(self, layer_id, parameters, fingerprint):
+        """
+        :param layer_id: str
+        :param parameters: JSON-serializable value
+        :param fingerprint: str, see qProf.gis_utils.profile_cache.geological_fingerprint
+        """
+
+        self.layer_id = layer_id
+        self.parameters = parameters
+        self.fingerprint = fingerprint
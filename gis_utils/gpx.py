@@ -0,0 +1,119 @@
+
+from builtins import object
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from .errors import GPXIOException
+
+
+class GrowingArray(object):
+    """
+    One-dimensional array with amortized-constant appends.
+    """
+
+    def __init__(self, dtype=np.float64, capacity=1024):
+
+        self._values = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def append(self, value):
+
+        if self._size == self._values.size:
+            values = np.empty(2 * self._values.size, dtype=self._values.dtype)
+            values[:self._size] = self._values
+            self._values = values
+
+        self._values[self._size] = value
+        self._size += 1
+
+    def array(self):
+        """
+        The appended values, as a trimmed copy.
+
+        :return: np.ndarray
+        """
+
+        return self._values[:self._size].copy()
+
+
+def local_tag(element):
+    """
+    Element tag without the namespace.
+
+    :param element: xml.etree.ElementTree.Element
+    :return: str
+    """
+
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def child_text(element, tag):
+    """
+    Text of the first child with the given (namespace-free) tag.
+
+    :param element: xml.etree.ElementTree.Element
+    :param tag: str
+    :return: str, or None when no such child exists
+    """
+
+    for child in element:
+        if local_tag(child) == tag:
+            return child.text
+
+    return None
+
+
+def read_gpx_track(gpx_path):
+    """
+    Read the track points of a GPX file incrementally,
+    so that the XML document is never fully loaded in memory:
+    each track point is removed from the parsed tree after being read.
+    Missing elevations are set to NaN, missing times to empty strings.
+
+    :param gpx_path: str
+    :return: tuple of track name (str) and lat, lon, ele (float np.ndarray) and time (np.ndarray of str) arrays
+    """
+
+    track_name = ''
+
+    lats = GrowingArray()
+    lons = GrowingArray()
+    elevs = GrowingArray()
+    times = GrowingArray(dtype=object)
+
+    elements = []  # currently open elements, from the root
+
+    try:
+
+        for event, element in ElementTree.iterparse(gpx_path, events=('start', 'end')):
+
+            if event == 'start':
+                elements.append(element)
+                continue
+
+            elements.pop()
+            tag = local_tag(element)
+
+            if tag == 'trkpt':
+
+                lats.append(float(element.get('lat')))
+                lons.append(float(element.get('lon')))
+
+                elev = child_text(element, 'ele')
+                elevs.append(float(elev) if elev else np.nan)
+
+                time = child_text(element, 'time')
+                times.append(time.strip() if time else '')
+
+                elements[-1].remove(element)
+
+            elif tag == 'name' and not track_name and elements and local_tag(elements[-1]) == 'trk':
+
+                track_name = element.text or ''
+
+    except (ElementTree.ParseError, TypeError, ValueError) as e:
+
+        raise GPXIOException("Unable to read GPX file: {}".format(e))
+
+    return track_name, lats.array(), lons.array(), elevs.array(), times.array()
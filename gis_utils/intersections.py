@@ -8,11 +8,11 @@ from math import *
 
 import numpy as np
 
-from ..gsf.geometry import Point, GAxis, GVect, Vect
+from ..gsf.geometry import Point, GAxis, GVect, Vect, MIN_SCALAR_VALUE
 
 from .features import Segment, ParamLine3D
-from .profile import PlaneAttitude
-from .errors import ConnectionException
+from .geoprofiles import PlaneAttitude
+from .errors import ConnectionException, FunInputException
 
 
 def calculate_distance_with_sign(projected_point, section_init_pt, section_vector):
@@ -103,30 +103,222 @@ def map_measure_to_section(structural_rec, section_data, map_axis=None):
                          signed_distance_from_section_start)
 
 
+def geological_versors(azimuths, plunges):
+    """
+    Array version of GVect.versor:
+    Cartesian versors (East, North, Up) of geological vectors.
+
+    :param azimuths: np.ndarray of trend values, in degrees
+    :param plunges: np.ndarray of plunge values, in degrees (positive downward)
+    :return: np.ndarray of shape (N, 3)
+    """
+
+    trends_rad = np.radians(azimuths % 360.0)
+    plunges_rad = np.radians(plunges)
+
+    return np.column_stack((np.cos(plunges_rad) * np.sin(trends_rad),
+                            np.cos(plunges_rad) * np.cos(trends_rad),
+                            -np.sin(plunges_rad)))
+
+
+def section_axis_intersections(pts, axis_versors, section_cartes_plane):
+    """
+    Array version of calculate_axis_intersection:
+    intersections with the section plane of the lines through the points, parallel to the axis versors.
+
+    :param pts: np.ndarray of shape (N, 3)
+    :param axis_versors: np.ndarray of shape (N, 3) or (3,)
+    :param section_cartes_plane: Plane
+    :return: np.ndarray of shape (N, 3), with NaN values for axes parallel to the section
+    """
+
+    section_coeffs = np.array([section_cartes_plane.a, section_cartes_plane.b, section_cartes_plane.c])
+
+    # axes parallel to the section, within rounding errors, do not intersect it
+    axis_sps = np.dot(axis_versors, section_coeffs)
+    axis_sps = np.where(np.abs(axis_sps) <= MIN_SCALAR_VALUE * np.linalg.norm(section_coeffs), np.nan, axis_sps)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ks = (pts.dot(section_coeffs) + section_cartes_plane.d) / axis_sps
+        inters_pts = pts - np.reshape(axis_versors, (-1, 3)) * np.reshape(ks, (-1, 1))
+
+    inters_pts[~ np.isfinite(inters_pts).all(axis=1)] = np.nan
+
+    return inters_pts
+
+
+def section_signed_distances(pts, section_init_pt, section_vector):
+    """
+    Array version of calculate_distance_with_sign.
+
+    :param pts: np.ndarray of shape (N, 3)
+    :param section_init_pt: Point
+    :param section_vector: Vect
+    :return: np.ndarray of float
+    """
+
+    section_vect = np.array([section_vector.x, section_vector.y, section_vector.z])
+    section_start = np.array([section_init_pt.x, section_init_pt.y, section_init_pt.z])
+
+    return (pts - section_start).dot(section_vect) / np.linalg.norm(section_vect)
+
+
+def map_attitudes_arrays_to_section(struct_pts, dip_dirs, dip_angles, section_data, axis_trends=None, axis_plunges=None):
+    """
+    Array version of map_measure_to_section:
+    maps a set of structural measures onto the section plane in bulk.
+    Without axis values, attitudes are mapped to the nearest intersection with the section,
+    otherwise they are moved along the axes (a single one or one for each measure) until the section.
+
+    :param struct_pts: np.ndarray of shape (N, 3), the measure points
+    :param dip_dirs: np.ndarray of dip direction values, in degrees
+    :param dip_angles: np.ndarray of dip angle values, in degrees
+    :param section_data: dict with section initial point, Cartesian plane and vector
+    :param axis_trends: None, or trend values of the mapping axes, as a float or a np.ndarray
+    :param axis_plunges: None, or plunge values of the mapping axes, as a float or a np.ndarray
+    :return: tuple of intersection points (np.ndarray of shape (N, 3)), slopes (radians),
+             downward senses (np.ndarray of str) and signed distances from the section start,
+             with NaN values for the measures that cannot be mapped
+    """
+
+    struct_pts = np.asarray(struct_pts, dtype=np.float64).reshape(-1, 3)
+    dip_dirs = np.asarray(dip_dirs, dtype=np.float64)
+    dip_angles = np.asarray(dip_angles, dtype=np.float64)
+
+    section_init_pt, section_cartes_plane, section_vector = section_data['init_pt'], section_data['cartes_plane'], \
+                                                            section_data['vector']
+
+    section_coeffs = np.array([section_cartes_plane.a, section_cartes_plane.b, section_cartes_plane.c])
+    section_d = section_cartes_plane.d
+    section_normal = section_coeffs / np.linalg.norm(section_coeffs)
+    section_vect = np.array([section_vector.x, section_vector.y, section_vector.z])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        # Cartesian planes of the geological planes: normal versors and d coefficients
+        struct_normals = geological_versors(dip_dirs, dip_angles - 90.0)
+        struct_ds = - np.einsum('ij,ij->i', struct_normals, struct_pts)
+
+        # intersection versors
+        inters_versors = np.cross(section_normal, struct_normals)
+        inters_versors /= np.linalg.norm(inters_versors, axis=1)[:, np.newaxis]
+
+        # slopes of the geological planes onto the section plane
+        slopes_degr = np.degrees(np.abs(np.arctan2(inters_versors[:, 2], np.hypot(inters_versors[:, 0], inters_versors[:, 1]))))
+        slopes_degr[slopes_degr <= MIN_SCALAR_VALUE] = 0.0
+        slopes_radians = np.radians(slopes_degr)
+
+        downward_versors = np.where(inters_versors[:, 2:3] > 0.0, -inters_versors, inters_versors)
+        downward_sps = downward_versors.dot(section_vect)
+        downward_senses = np.where(downward_sps > 0.0, "right", np.where(downward_sps == 0.0, "vertical", "left"))
+
+        if axis_trends is None:
+
+            # nearest point on the plane-plane intersection line:
+            # a point on the line (the minimum-norm solution of the two plane equations)
+            # moved along the line to the measure point
+            normals_sp = struct_normals.dot(section_normal)
+            struct_normals_sq = np.einsum('ij,ij->i', struct_normals, struct_normals)
+            section_b = - section_d / np.linalg.norm(section_coeffs)
+            determinants = struct_normals_sq - normals_sp * normals_sp
+            section_weights = (struct_normals_sq * section_b + normals_sp * struct_ds) / determinants
+            struct_weights = (- struct_ds - normals_sp * section_b) / determinants
+            line_pts = section_weights[:, np.newaxis] * section_normal + struct_weights[:, np.newaxis] * struct_normals
+
+            offsets = np.einsum('ij,ij->i', struct_pts - line_pts, inters_versors)
+            inters_pts = line_pts + inters_versors * offsets[:, np.newaxis]
+
+        else:
+
+            # intersection of the mapping axes, passing through the measure points, with the section plane
+            axis_trends = np.broadcast_to(np.asarray(axis_trends, dtype=np.float64), dip_dirs.shape)
+            axis_plunges = np.broadcast_to(np.asarray(axis_plunges, dtype=np.float64), dip_dirs.shape)
+            axis_plunges = np.where(np.abs(axis_plunges) <= 90.0, axis_plunges, np.nan)
+
+            inters_pts = section_axis_intersections(struct_pts,
+                                                    geological_versors(axis_trends, axis_plunges),
+                                                    section_cartes_plane)
+
+        signed_distances = section_signed_distances(inters_pts, section_init_pt, section_vector)
+
+    invalid = ~ (np.isfinite(inters_pts).all(axis=1) & np.isfinite(slopes_radians) & np.isfinite(signed_distances))
+    inters_pts[invalid] = np.nan
+    slopes_radians[invalid] = np.nan
+    signed_distances[invalid] = np.nan
+
+    return inters_pts, slopes_radians, downward_senses, signed_distances
+
+
+def project_pts_on_section_along_axis(pts, section_data, trend, plunge):
+    """
+    Project points onto the section plane along a common axis.
+
+    :param pts: np.ndarray of shape (N, 3), in the project CRS
+    :param section_data: dict with section initial point, Cartesian plane and vector
+    :param trend: float, the axis trend, in degrees
+    :param plunge: float, the axis plunge, in degrees
+    :return: tuple of the projected points (np.ndarray of shape (N, 3))
+             and of their signed distances from the section start
+    """
+
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 3)
+
+    axis_versor = geological_versors(np.array([trend], dtype=np.float64), np.array([plunge], dtype=np.float64))[0]
+    inters_pts = section_axis_intersections(pts, axis_versor, section_data['cartes_plane'])
+
+    return inters_pts, section_signed_distances(inters_pts, section_data['init_pt'], section_data['vector'])
+
+
+def float_or_nan(value):
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
 def map_struct_pts_on_section(structural_data, section_data, mapping_method):
     """
     defines:
         - 2D x-y location in section
         - plane-plane segment intersection
+    With the 'nearest' and 'common axis' methods, measures that cannot be mapped
+    (e.g. planes or axes parallel to the section) are kept, with NaN locations, slopes and distances.
+    With the 'individual axes' method, measures with invalid or parallel axes are skipped.
+
+    :raise FunInputException: for an unknown mapping method
     """
 
-    if mapping_method['method'] == 'nearest':
-        return [map_measure_to_section(structural_rec, section_data) for structural_rec in structural_data]
+    if not structural_data:
+        return []
 
-    if mapping_method['method'] == 'common axis':
-        map_axis = GAxis(mapping_method['trend'], mapping_method['plunge'])
-        return [map_measure_to_section(structural_rec, section_data, map_axis) for structural_rec in structural_data]
+    struct_pts = np.array([[pt.x, pt.y, pt.z] for pt, _, _ in structural_data], dtype=np.float64)
+    dip_dirs = np.array([plane.dd for _, plane, _ in structural_data], dtype=np.float64)
+    dip_angles = np.array([plane.da for _, plane, _ in structural_data], dtype=np.float64)
 
-    if mapping_method['method'] == 'individual axes':
+    if mapping_method['method'] == 'nearest':
+        axis_trends, axis_plunges = None, None
+    elif mapping_method['method'] == 'common axis':
+        axis_trends, axis_plunges = mapping_method['trend'], mapping_method['plunge']
+    elif mapping_method['method'] == 'individual axes':
         assert len(mapping_method['individual_axes_values']) == len(structural_data)
-        result = []
-        for structural_rec, (trend, plunge) in zip(structural_data, mapping_method['individual_axes_values']):
-            try:
-                map_axis = GAxis(trend, plunge)
-                result.append(map_measure_to_section(structural_rec, section_data, map_axis))
-            except:
-                continue
-        return result
+        axis_trends = np.array([float_or_nan(trend) for trend, _ in mapping_method['individual_axes_values']])
+        axis_plunges = np.array([float_or_nan(plunge) for _, plunge in mapping_method['individual_axes_values']])
+    else:
+        raise FunInputException("Unknown mapping method: {}".format(mapping_method['method']))
+
+    inters_pts, slopes_radians, downward_senses, signed_distances = map_attitudes_arrays_to_section(
+        struct_pts, dip_dirs, dip_angles, section_data, axis_trends, axis_plunges)
+
+    return [PlaneAttitude(structural_pt_id,
+                          structural_pt,
+                          structural_plane,
+                          Point(*inters_pts[ndx]),
+                          float(slopes_radians[ndx]),
+                          str(downward_senses[ndx]),
+                          float(signed_distances[ndx]))
+            for ndx, (structural_pt, structural_plane, structural_pt_id) in enumerate(structural_data)
+            if mapping_method['method'] != 'individual axes' or np.isfinite(signed_distances[ndx])]
 
 
 class IntersectionParameters(object):
@@ -0,0 +1,113 @@
+
+import os
+
+
+# This module does not depend on QGIS:
+# layers, CRSs and the map canvas are only accessed through their methods.
+
+
+def get_on_the_fly_projection(canvas):
+
+    on_the_fly_projection = True
+
+    if on_the_fly_projection:
+        project_crs = canvas.mapSettings().destinationCrs()
+    else:
+        project_crs = None
+
+    return on_the_fly_projection, project_crs
+
+
+def crs_key(crs):
+    """
+    Return a value identifying a CRS:
+    its authority identifier, or its WKT definition for custom CRSs.
+
+    :param crs: qgis._core.QgsCoordinateReferenceSystem
+    :return: str
+    """
+
+    return crs.authid() or crs.toWkt()
+
+
+def layer_source_signature(layer):
+    """
+    Return a value identifying the current data source of a layer,
+    changing when the source is changed or the source file is rewritten.
+
+    :param layer: qgis._core.QgsMapLayer
+    :return: tuple
+    """
+
+    source = layer.source()
+    source_path = source.split("|")[0]
+
+    if os.path.isfile(source_path):
+        modification_time = os.path.getmtime(source_path)
+    else:
+        modification_time = None
+
+    return source, modification_time
+
+
+def vector_layer_signature(layer):
+    """
+    Return a value identifying the current contents of a vector layer,
+    or None when the layer has pending edits.
+
+    :param layer: qgis._core.QgsVectorLayer
+    :return: tuple, or None
+    """
+
+    if layer.isModified():
+        return None
+
+    return layer_source_signature(layer) + (layer.subsetString(), layer.featureCount())
+
+
+_layers_edits_num = {}
+
+
+def _track_layer_edits(layer):
+    """
+    Count the geometry edits of a vector layer, through its edit signals.
+
+    :param layer: qgis._core.QgsVectorLayer
+    :return: None
+    """
+
+    layer_id = layer.id()
+
+    def count_edit(*args):
+        _layers_edits_num[layer_id] += 1
+
+    def forget_layer(*args):
+        _layers_edits_num.pop(layer_id, None)
+
+    _layers_edits_num[layer_id] = 0
+
+    for signal in (layer.featureAdded, layer.featureDeleted, layer.geometryChanged,
+                   layer.afterRollBack, layer.afterCommitChanges):
+        signal.connect(count_edit)
+    layer.willBeDeleted.connect(forget_layer)
+
+
+def vector_layer_edits_signature(layer):
+    """
+    Return a value identifying the current contents of a vector layer,
+    also while the layer has pending edits:
+    geometry edits are counted from the first call for the layer on.
+
+    :param layer: qgis._core.QgsVectorLayer
+    :return: tuple
+    """
+
+    if layer.id() not in _layers_edits_num:
+        _track_layer_edits(layer)
+
+    signature = layer_source_signature(layer) + (layer.subsetString(), layer.featureCount())
+
+    if layer.isModified():
+        signature += ("edits", _layers_edits_num[layer.id()])
+
+    return signature
@@ -5,309 +5,770 @@ from builtins import zip
 from builtins import map
 from builtins import range
 from builtins import object
-import copy
-import xml.dom.minidom
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-from .features import Line, xytuple_l2_to_MultiLine
+from .dem_interpolation import points_spacing, overview_decimation_factor
+from .geoprofiles import GeoProfilesSet, GeoProfile, ProfileElevations, DEMParams, PlaneAttitude, GeologicalInput
+from .features import Line, xytuple_l2_to_MultiLine, multilines_to_array, multilines_segments, \
+    segments_intersections_2d, distances_along_line
+from .gdal_utils import build_raster_overviews, missing_overview_factors, raster_overview_factors
 
 from .qgs_tools import *
 
-from .geodetic import TrackPointGPX
+from .geodetic import geodetic2ecef
+from .gpx import read_gpx_track
+from .profile_chunks import chunked_profile_elevations
+from .profile_memo import ProfileSamplesMemo, profile_samples_memo
+from .profile_workers import profile_executor, run_profile_tasks, map_with_thread_copies
+from .swath import SwathElevations, swath_elevations
+from .time_utils import gpstimes_to_seconds
 
-from .errors import GPXIOException
+from .errors import GPXIOException, RasterIOException
 
 
-class GeoProfilesSet(object):
+MAX_DEM_SAMPLING_THREADS = 4
+SWATH_PERCENTILES = (25.0, 75.0)
+
+
+def topoline_from_dem(resampled_trace2d, bOnTheFlyProjection, project_crs, dem, dem_params):
+
+    if bOnTheFlyProjection and dem.crs() != project_crs:
+        trace2d_in_dem_crs = resampled_trace2d.crs_project(project_crs, dem.crs())
+    else:
+        trace2d_in_dem_crs = resampled_trace2d
+
+    zs = interpolate_z_array(dem,
+                             dem_params,
+                             trace2d_in_dem_crs.x_array(),
+                             trace2d_in_dem_crs.y_array())
+
+    return Line.from_arrays(resampled_trace2d.x_array(),
+                            resampled_trace2d.y_array(),
+                            zs)
+
+
+def topoprofiles_from_dems(
+        canvas,
+        source_profile_line,
+        sample_distance,
+        selected_dems,
+        selected_dem_parameters,
+        invert_profile,
+        chunk_size=None,
+        use_memmap=False,
+        memo=None,
+        overview_sampling_ratio=0.0
+):
     """
-    Represents a set of ProfileElements instances,
-    stored as a list
+    Create the topographic profiles of a line from DEMs.
+    When chunk_size is provided, the densified line is processed in chunks
+    of at most chunk_size points (see topoprofiles_from_dems_chunked).
+    When a memo is provided, only the DEMs not already sampled along the same resampled line are sampled.
+
+    :param chunk_size: int or None
+    :param use_memmap: bool, store the chunked results in temporary memory-mapped files
+    :param memo: ProfileSamplesMemo or None, not used with chunk_size
+    :param overview_sampling_ratio: float, see sample_dems
+    :return: ProfileElevations instance
     """
 
-    def __init__(self, name=""):
+    # get project CRS information
+    on_the_fly_projection, project_crs = get_on_the_fly_projection(canvas)
 
-        self._name = name
-        self._geoprofiles = []
-        self.profiles_created = False
-        self.plot_params = None
+    if invert_profile:
+        line = source_profile_line.reverse_direction()
+    else:
+        line = source_profile_line
 
-    @property
-    def name(self):
-        return self._name
+    if chunk_size is not None:
+        return topoprofiles_from_dems_chunked(
+            line,
+            sample_distance,
+            selected_dems,
+            selected_dem_parameters,
+            on_the_fly_projection,
+            project_crs,
+            chunk_size,
+            use_memmap,
+            overview_sampling_ratio)
 
-    @name.setter
-    def name(self, new_name):
+    if memo is None:
 
-        self._name = new_name
+        resampled_line = line.densify_2d_line(sample_distance)  # line resampled by sample distance
 
-    @property
-    def geoprofiles(self):
+        # calculate 3D profiles from DEMs
 
-        return self._geoprofiles
+        dems_zs, dems_errors = sample_dems(
+            resampled_line.x_array(),
+            resampled_line.y_array(),
+            selected_dems,
+            selected_dem_parameters,
+            on_the_fly_projection,
+            project_crs,
+            overview_sampling_ratio=overview_sampling_ratio)
 
-    @property
-    def geoprofiles_num(self):
+    else:
 
-        return len(self._geoprofiles)
+        line_key = memo.line_key(line, sample_distance, invert_profile, on_the_fly_projection, project_crs,
+                                 overview_sampling_ratio)
+        resampled_line = memo.resampled_line(line_key, line, sample_distance)
 
-    def geoprofile(self, ndx):
+        # calculate 3D profiles from the DEMs not already sampled
 
-        return self._geoprofiles[ndx]
+        dem_keys = [memo.dem_key(dem) for dem in selected_dems]
+        dems_zs, missing_ndxs = memo.samples(line_key, dem_keys)
+        dems_errors = [None for _ in selected_dems]
 
-    def append(self, geoprofile):
+        if missing_ndxs:
 
-        self._geoprofiles.append(geoprofile)
+            missing_dems_zs, missing_dems_errors = sample_dems(
+                resampled_line.x_array(),
+                resampled_line.y_array(),
+                [selected_dems[ndx] for ndx in missing_ndxs],
+                [selected_dem_parameters[ndx] for ndx in missing_ndxs],
+                on_the_fly_projection,
+                project_crs,
+                overview_sampling_ratio=overview_sampling_ratio)
 
-    def insert(self, ndx, geoprofile):
+            for ndx, zs, error in zip(missing_ndxs, missing_dems_zs, missing_dems_errors):
+                dems_zs[ndx], dems_errors[ndx] = zs, error
+                if error is None:
+                    memo.store_samples(line_key, dem_keys[ndx], zs)
 
-        self._geoprofiles.insert(ndx, geoprofile)
+    return profile_elevations_from_samples(
+        resampled_line,
+        selected_dems,
+        selected_dem_parameters,
+        dems_zs,
+        dems_errors)
 
-    def move(self, ndx_init, ndx_final):
 
-        geoprofile = self._geoprofiles.pop(ndx_init)
-        self.insert(ndx_final, geoprofile)
+def profile_elevations_from_samples(
+        resampled_line,
+        selected_dems,
+        selected_dem_parameters,
+        dems_zs,
+        dems_errors
+):
+    """
+    Create the topographic profiles from the DEM elevations sampled along a resampled line.
+
+    :param resampled_line: Line, in the project CRS
+    :param selected_dems: list of qgis._core.QgsRasterLayer
+    :param selected_dem_parameters: list of QGisRasterParameters
+    :param dems_zs: list of np.ndarray, in DEM order
+    :param dems_errors: list of error messages (None for no error), in DEM order
+    :return: ProfileElevations instance
+    """
+
+    dem_topolines3d = [Line.from_arrays(resampled_line.x_array(), resampled_line.y_array(), zs) for zs in dems_zs]
+
+    # setup topoprofiles properties
+
+    topo_profiles = ProfileElevations()
+
+    topo_profiles.planar_xs = resampled_line.x_array()
+    topo_profiles.planar_ys = resampled_line.y_array()
+    topo_profiles.surface_names = [dem.name() for dem in selected_dems]
+    topo_profiles.profile_s = resampled_line.incremental_length_2d_array()
+    topo_profiles.profile_s3ds = [cl3dt.incremental_length_3d_array() for cl3dt in dem_topolines3d]
+    topo_profiles.profile_zs = [cl3dt.z_array() for cl3dt in dem_topolines3d]
+    topo_profiles.profile_dirslopes = [cl3dt.slopes_array() for cl3dt in dem_topolines3d]
+    topo_profiles.surface_errors = dems_errors
+    topo_profiles.dem_params = [DEMParams(dem, params) for (dem, params) in
+                                zip(selected_dems, selected_dem_parameters)]
 
-    def move_up(self, ndx):
+    return topo_profiles
 
-        self.move(ndx, ndx -1)
 
-    def move_down(self, ndx):
+def swath_profiles_from_dems(
+        canvas,
+        source_profile_line,
+        sample_distance,
+        selected_dems,
+        selected_dem_parameters,
+        invert_profile,
+        half_width,
+        across_samples_num,
+        percentiles=SWATH_PERCENTILES,
+        memo=None,
+        overview_sampling_ratio=0.0
+):
+    """
+    Create the topographic profiles of a line from DEMs, together with the statistics
+    of the elevations across a corridor centered on the line (swath profiles).
+    For each profile station, the DEMs are sampled at equally-spaced points along the station normal:
+    stations are processed in chunks, each DEM block being read once per chunk.
+
+    :param half_width: float, the corridor half width, in the project CRS units
+    :param across_samples_num: int, number of samples across the corridor
+    :param percentiles: tuple of floats, in the 0-100 range
+    :param memo: ProfileSamplesMemo or None, used for the centerline elevations
+    :param overview_sampling_ratio: float, see sample_dems
+    :return: ProfileElevations instance
+    """
 
-        self.move(ndx, ndx + 1)
+    topo_profiles = topoprofiles_from_dems(
+        canvas,
+        source_profile_line,
+        sample_distance,
+        selected_dems,
+        selected_dem_parameters,
+        invert_profile,
+        memo=memo,
+        overview_sampling_ratio=overview_sampling_ratio)
 
-    def remove(self, ndx):
+    add_profile_swaths(
+        canvas,
+        topo_profiles,
+        selected_dems,
+        selected_dem_parameters,
+        half_width,
+        across_samples_num,
+        percentiles,
+        overview_sampling_ratio)
 
-        _ = self._geoprofiles.pop(ndx)
+    return topo_profiles
 
 
-class GeoProfile(object):
+def add_profile_swaths(
+        canvas,
+        topo_profiles,
+        selected_dems,
+        selected_dem_parameters,
+        half_width,
+        across_samples_num,
+        percentiles=SWATH_PERCENTILES,
+        overview_sampling_ratio=0.0
+):
     """
-    Class representing the topographic and geological elements
-    embodying a single geological profile.
+    Add the swath profiles of the DEMs to already created topographic profiles.
+    Errors of the swath sampling are reported for the DEMs whose profiles have no error.
+
+    :param topo_profiles: ProfileElevations instance, created from the DEMs
+    :param half_width: float, the corridor half width, in the project CRS units
+    :param across_samples_num: int, number of samples across the corridor
+    :param percentiles: tuple of floats, in the 0-100 range
+    :param overview_sampling_ratio: float, see sample_dems
     """
 
-    def __init__(self):
+    on_the_fly_projection, project_crs = get_on_the_fly_projection(canvas)
 
-        self.source_data_type = None
-        self.original_line = None
-        self.sample_distance = None  # max spacing along profile; float
-        self.resampled_line = None
+    def sample_points(xs, ys):
 
-        self.topo_profiles = None  # instance of ProfileElevations
-        self.geoplane_attitudes = []
-        self.geosurfaces = []
-        self.geosurfaces_ids = []
-        self.lineaments = []
-        self.outcrops = []
+        return sample_dems(
+            xs,
+            ys,
+            selected_dems,
+            selected_dem_parameters,
+            on_the_fly_projection,
+            project_crs,
+            overview_sampling_ratio=overview_sampling_ratio)
 
-    def set_topo_profiles(self, topo_profiles):
+    profile_swaths, swaths_errors = swath_elevations(
+        topo_profiles.planar_xs,
+        topo_profiles.planar_ys,
+        len(selected_dems),
+        half_width,
+        across_samples_num,
+        percentiles,
+        sample_points)
 
-        self.topo_profiles = topo_profiles
+    topo_profiles.swath_half_width = half_width
+    topo_profiles.profile_swaths = profile_swaths
+    topo_profiles.surface_errors = [profile_error if profile_error is not None else swath_error for
+                                    profile_error, swath_error in zip(topo_profiles.surface_errors, swaths_errors)]
 
-    def add_intersections_pts(self, intersection_list):
 
-        self.lineaments += intersection_list
+def estimated_profile_pts_num(source_profile_line, sample_distance):
+    """
+    Estimated number of points of a profile, from the line length and the sample distance.
 
-    def add_intersections_lines(self, formation_list, intersection_line3d_list, intersection_polygon_s_list2):
+    :param source_profile_line: Line
+    :param sample_distance: float
+    :return: int
+    """
 
-        self.outcrops = list(zip(formation_list, intersection_line3d_list, intersection_polygon_s_list2))
+    return int(np.ceil(source_profile_line.length_2d / sample_distance))
 
-    def get_current_dem_names(self):
 
-        return self.topo_profiles.surface_names
+def profile_chunking(source_profile_line, sample_distance, chunk_pt_num_threshold, chunk_size,
+                     memmap_pt_num_threshold=None):
+    """
+    Chunking of the creation of a profile (see topoprofiles_from_dems), from its estimated number of points.
+
+    :param source_profile_line: Line
+    :param sample_distance: float
+    :param chunk_pt_num_threshold: int or None, the estimated number of points above which the line is chunked
+    :param chunk_size: int
+    :param memmap_pt_num_threshold: int or None, the estimated number of points above which
+      the results of the chunked line are memory-mapped
+    :return: tuple of the chunk size (None for no chunking) and of the use of memory-mapped results
+    """
 
-    def max_s(self):
-        return self.topo_profiles.max_s()
+    pts_num = estimated_profile_pts_num(source_profile_line, sample_distance)
 
-    def min_z_topo(self):
-        return self.topo_profiles.min_z()
+    if chunk_pt_num_threshold is None or pts_num <= chunk_pt_num_threshold:
+        return None, False
 
-    def max_z_topo(self):
-        return self.topo_profiles.max_z()
+    return chunk_size, memmap_pt_num_threshold is not None and pts_num > memmap_pt_num_threshold
 
-    def min_z_plane_attitudes(self):
 
-        # TODO:  manage case for possible nan p_z values
-        return min([plane_attitude.pt_3d.p_z for plane_attitude_set in self.geoplane_attitudes for plane_attitude in
-                    plane_attitude_set if 0.0 <= plane_attitude.sign_hor_dist <= self.max_s()])
+def topoprofiles_from_dems_batch(
+        canvas,
+        source_profile_lines,
+        sample_distance,
+        selected_dems,
+        selected_dem_parameters,
+        invert_profile,
+        max_workers=None,
+        progress_callback=None,
+        cancel_requested=None,
+        memo=None,
+        overview_sampling_ratio=0.0,
+        chunk_pt_num_threshold=None,
+        chunk_size=None,
+        memmap_pt_num_threshold=None
+):
+    """
+    Create the topographic profiles of several lines from DEMs,
+    spreading the DEM sampling of the lines across workers (see profile_executor).
+    Lines are densified and reprojected in the calling process,
+    workers receive plain coordinate arrays and raster paths and read the rasters with GDAL.
+    Lines with more estimated points than chunk_pt_num_threshold are instead created in chunks
+    in the calling process, after the other ones.
+    When a DEM is not a GDAL raster, profiles are created serially in the calling process.
+
+    :param source_profile_lines: list of Line instances
+    :param max_workers: int or None, maximum number of workers
+    :param progress_callback: callable receiving the number of created profiles and the total number
+    :param cancel_requested: callable returning True when the processing has to be stopped
+    :param memo: ProfileSamplesMemo or None
+    :param overview_sampling_ratio: float, see sample_dems
+    :param chunk_pt_num_threshold: int or None, see profile_chunking
+    :param chunk_size: int, see profile_chunking
+    :param memmap_pt_num_threshold: int or None, see profile_chunking
+    :return: list of ProfileElevations instances, in line order, or None when cancelled
+    """
 
-    def max_z_plane_attitudes(self):
+    raster_paths = [dem.source() if dem.providerType() == "gdal" else None for dem in selected_dems]
+
+    if None in raster_paths:
+        return topoprofiles_from_dems_serially(
+            canvas,
+            source_profile_lines,
+            sample_distance,
+            selected_dems,
+            selected_dem_parameters,
+            invert_profile,
+            progress_callback,
+            cancel_requested,
+            memo,
+            overview_sampling_ratio,
+            chunk_pt_num_threshold,
+            chunk_size,
+            memmap_pt_num_threshold)
 
-        # TODO:  manage case for possible nan p_z values
-        return max([plane_attitude.pt_3d.p_z for plane_attitude_set in self.geoplane_attitudes for plane_attitude in
-                    plane_attitude_set if 0.0 <= plane_attitude.sign_hor_dist <= self.max_s()])
+    on_the_fly_projection, project_crs = get_on_the_fly_projection(canvas)
 
-    def min_z_curves(self):
+    grid_params = [params.grid_parameters() for params in selected_dem_parameters]
+    dems_overview_factors = [dem_overview_factors(dem, overview_sampling_ratio) for dem in selected_dems]
 
-        return min([pt_2d.p_y for multiline_2d_list in self.geosurfaces for multiline_2d in multiline_2d_list for line_2d in
-                    multiline_2d.lines for pt_2d in line_2d.pts if 0.0 <= pt_2d.p_x <= self.max_s()])
+    if memo is not None:
+        dem_keys = [memo.dem_key(dem) for dem in selected_dems]
 
-    def max_z_curves(self):
+    # densification and reprojection use QGIS objects, so they are done in this process
+    resampled_lines = dict()
+    line_keys = dict()
+    profiles_zs = dict()
+    profiles_tasks = []
+    chunked_ndxs = []
+    for profile_ndx, source_profile_line in enumerate(source_profile_lines):
 
-        return max([pt_2d.p_y for multiline_2d_list in self.geosurfaces for multiline_2d in multiline_2d_list for line_2d in
-                    multiline_2d.lines for pt_2d in line_2d.pts if 0.0 <= pt_2d.p_x <= self.max_s()])
+        line_chunk_size, _ = profile_chunking(source_profile_line, sample_distance, chunk_pt_num_threshold, chunk_size)
+        if line_chunk_size is not None:
+            chunked_ndxs.append(profile_ndx)
+            continue
 
-    def min_z(self):
+        if invert_profile:
+            line = source_profile_line.reverse_direction()
+        else:
+            line = source_profile_line
 
-        min_z = self.min_z_topo()
+        if memo is None:
+            line_key = None
+            resampled_line = line.densify_2d_line(sample_distance)
+            dems_zs, missing_ndxs = [None for _ in selected_dems], list(range(len(selected_dems)))
+        else:
+            line_key = memo.line_key(line, sample_distance, invert_profile, on_the_fly_projection, project_crs,
+                                     overview_sampling_ratio)
+            resampled_line = memo.resampled_line(line_key, line, sample_distance)
+            dems_zs, missing_ndxs = memo.samples(line_key, dem_keys)
+
+        xs, ys = resampled_line.x_array(), resampled_line.y_array()
+
+        dem_tasks = []
+        for dem_ndx in missing_ndxs:
+            dem = selected_dems[dem_ndx]
+            if on_the_fly_projection and dem.crs() != project_crs:
+                dem_xs, dem_ys = project_xy_arrays(xs, ys, project_crs, dem.crs())
+            else:
+                dem_xs, dem_ys = xs.copy(), ys.copy()
+            decimation = overview_decimation_factor(grid_params[dem_ndx],
+                                                    points_spacing(dem_xs, dem_ys),
+                                                    overview_sampling_ratio,
+                                                    dems_overview_factors[dem_ndx])
+            dem_tasks.append((raster_paths[dem_ndx], grid_params[dem_ndx], dem_xs, dem_ys, decimation))
+
+        resampled_lines[profile_ndx] = resampled_line
+        line_keys[profile_ndx] = line_key
+        profiles_zs[profile_ndx] = (dems_zs, missing_ndxs)
+        profiles_tasks.append((profile_ndx, dem_tasks))
+
+    topo_profiles_list = [None for _ in source_profile_lines]
+    profiles_num = len(source_profile_lines)
+
+    def add_profile(profile_ndx, missing_dems_zs, missing_dems_errors):
+
+        dems_zs, missing_ndxs = profiles_zs[profile_ndx]
+        dems_errors = [None for _ in selected_dems]
+
+        for dem_ndx, zs, error in zip(missing_ndxs, missing_dems_zs, missing_dems_errors):
+            dems_zs[dem_ndx], dems_errors[dem_ndx] = zs, error
+            if memo is not None and error is None:
+                memo.store_samples(line_keys[profile_ndx], dem_keys[dem_ndx], zs)
+
+        topo_profiles_list[profile_ndx] = profile_elevations_from_samples(
+            resampled_lines[profile_ndx],
+            selected_dems,
+            selected_dem_parameters,
+            dems_zs,
+            dems_errors)
+
+    # profiles with all the DEMs already sampled do not need workers
+    for profile_ndx, dem_tasks in profiles_tasks:
+        if not dem_tasks:
+            add_profile(profile_ndx, [], [])
+
+    sampled_tasks = [(profile_ndx, dem_tasks) for profile_ndx, dem_tasks in profiles_tasks if dem_tasks]
+    created_num = len(profiles_tasks) - len(sampled_tasks)
+
+    if sampled_tasks:
+
+        def update_progress(sampled_num, _):
+
+            if progress_callback is not None:
+                progress_callback(created_num + sampled_num, profiles_num)
+
+        # the executor is not used as a context manager, since exiting it waits for the running workers,
+        # also when the processing is cancelled
+        executor = profile_executor(max_workers)
+        try:
+            completed = run_profile_tasks(executor, sampled_tasks, add_profile, update_progress, cancel_requested)
+        finally:
+            executor.shutdown(wait=False)
 
-        if len(self.geoplane_attitudes) > 0:
-            min_z = min([min_z, self.min_z_plane_attitudes()])
+        if not completed:
+            return None
 
-        if len(self.geosurfaces) > 0:
-            min_z = min([min_z, self.min_z_curves()])
+        created_num += len(sampled_tasks)
 
-        return min_z
+    elif progress_callback is not None:
 
-    def max_z(self):
+        progress_callback(created_num, profiles_num)
 
-        max_z = self.max_z_topo()
+    # large lines are created in chunks in this process
+    for profile_ndx in chunked_ndxs:
 
-        if len(self.geoplane_attitudes) > 0:
-            max_z = max([max_z, self.max_z_plane_attitudes()])
+        if cancel_requested is not None and cancel_requested():
+            return None
 
-        if len(self.geosurfaces) > 0:
-            max_z = max([max_z, self.max_z_curves()])
+        source_profile_line = source_profile_lines[profile_ndx]
+        line_chunk_size, use_memmap = profile_chunking(source_profile_line,
+                                                       sample_distance,
+                                                       chunk_pt_num_threshold,
+                                                       chunk_size,
+                                                       memmap_pt_num_threshold)
+        topo_profiles_list[profile_ndx] = topoprofiles_from_dems(
+            canvas,
+            source_profile_line,
+            sample_distance,
+            selected_dems,
+            selected_dem_parameters,
+            invert_profile,
+            line_chunk_size,
+            use_memmap,
+            overview_sampling_ratio=overview_sampling_ratio)
+        created_num += 1
 
-        return max_z
+        if progress_callback is not None:
+            progress_callback(created_num, profiles_num)
 
-    def add_plane_attitudes(self, plane_attitudes):
+    return topo_profiles_list
 
-        self.geoplane_attitudes.append(plane_attitudes)
 
-    def add_curves(self, lMultilines, lIds):
+def topoprofiles_from_dems_serially(
+        canvas,
+        source_profile_lines,
+        sample_distance,
+        selected_dems,
+        selected_dem_parameters,
+        invert_profile,
+        progress_callback=None,
+        cancel_requested=None,
+        memo=None,
+        overview_sampling_ratio=0.0,
+        chunk_pt_num_threshold=None,
+        chunk_size=None,
+        memmap_pt_num_threshold=None
+):
+    """
+    Create the topographic profiles of several lines from DEMs, one line after the other.
+    See topoprofiles_from_dems_batch for the parameters.
 
-        self.geosurfaces.append(lMultilines)
-        self.geosurfaces_ids.append(lIds)
+    :return: list of ProfileElevations instances, in line order, or None when cancelled
+    """
 
+    topo_profiles_list = []
+    for source_profile_line in source_profile_lines:
 
-class ProfileElevations(object):
+        line_chunk_size, use_memmap = profile_chunking(source_profile_line,
+                                                       sample_distance,
+                                                       chunk_pt_num_threshold,
+                                                       chunk_size,
+                                                       memmap_pt_num_threshold)
 
-    def __init__(self):
+        topo_profiles_list.append(topoprofiles_from_dems(
+            canvas,
+            source_profile_line,
+            sample_distance,
+            selected_dems,
+            selected_dem_parameters,
+            invert_profile,
+            line_chunk_size,
+            use_memmap,
+            memo=memo,
+            overview_sampling_ratio=overview_sampling_ratio))
 
-        #self.line_source = None
-        self.dem_params = []
-        self.gpx_params = None
+        if progress_callback is not None:
+            progress_callback(len(topo_profiles_list), len(source_profile_lines))
 
-        self.planar_xs = None
-        self.planar_ys = None
-        self.lons = None
-        self.lats = None
-        self.times = None
-        self.profile_s = None
+        if cancel_requested is not None and cancel_requested():
+            return None
 
-        self.surface_names = []
+    return topo_profiles_list
 
-        self.profile_s3ds = []
-        self.profile_zs = []
-        self.profile_dirslopes = []
 
-        self.inverted = None
+def sample_dems(
+        xs,
+        ys,
+        selected_dems,
+        selected_dem_parameters,
+        on_the_fly_projection,
+        project_crs,
+        max_threads=MAX_DEM_SAMPLING_THREADS,
+        overview_sampling_ratio=0.0
+):
+    """
+    Interpolate the elevations of points from several DEMs.
+    DEMs are sampled concurrently on a bounded thread pool with the layer samplers kept by dem_sampler,
+    while reprojection is done in the calling thread. DEMs read through the QGIS data provider
+    are sampled by the pool with a clone of the provider. A single DEM is sampled in the calling thread.
+    A DEM that fails does not stop the sampling of the others:
+    its elevations are set to NaN and its error message is returned.
+    With an overview sampling ratio, points are considered as ordered along lines
+    and a DEM is read at the coarsest existing overview level whose cells are at least
+    that ratio times smaller than the point spacing (see overview_decimation_factor).
+
+    :param xs: np.ndarray of x values, in the project CRS
+    :param ys: np.ndarray of y values, in the project CRS
+    :param selected_dems: list of qgis._core.QgsRasterLayer
+    :param selected_dem_parameters: list of QGisRasterParameters
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param max_threads: int
+    :param overview_sampling_ratio: float, zero to always read the DEMs at full resolution
+    :return: tuple of two lists, in DEM order: elevation arrays and error messages (None for no error)
+    """
 
-        self.statistics_calculated = False
-        self.profile_created = False
+    dems_zs = [np.full(xs.shape, np.nan) for _ in selected_dems]
+    dems_errors = [None for _ in selected_dems]
 
-    def max_s(self):
+    # reprojection and sampler setup use QGIS objects owned by the calling thread
+    tasks = []
+    for dem_ndx, (dem, dem_params) in enumerate(zip(selected_dems, selected_dem_parameters)):
+        try:
+            if on_the_fly_projection and dem.crs() != project_crs:
+                dem_xs, dem_ys = project_xy_arrays(xs, ys, project_crs, dem.crs())
+            else:
+                dem_xs, dem_ys = xs, ys
+            decimation = overview_decimation_factor(dem_params,
+                                                    points_spacing(dem_xs, dem_ys),
+                                                    overview_sampling_ratio,
+                                                    dem_overview_factors(dem, overview_sampling_ratio))
+            tasks.append((dem_ndx, dem, dem_params, decimation, dem_xs, dem_ys))
+        except Exception as e:
+            dems_errors[dem_ndx] = str(e)
+
+    # the layer samplers are used by the thread pool when their backends are thread safe,
+    # otherwise samplers reading through a clone of the layer data provider are created, and closed when done.
+    # A backend shared by several tasks (the same DEM selected twice) is used by the calling thread
+    cloned_samplers = []
 
-        return self.profile_s[-1]
+    try:
 
-    def min_z(self):
+        threaded_tasks = []
+        serial_tasks = []
+        threaded_backends = set()
+        for dem_ndx, dem, dem_params, decimation, dem_xs, dem_ys in tasks:
+            try:
+                sampler = dem_sampler(dem, dem_params, decimation)
+                if len(tasks) == 1 or id(sampler.backend) in threaded_backends:
+                    serial_tasks.append((dem_ndx, sampler, dem_xs, dem_ys))
+                    continue
+                if not sampler.backend.thread_safe:
+                    sampler = DEMBlockSampler(dem, dem_params, provider=dem.dataProvider().clone(),
+                                              decimation=decimation)
+                    cloned_samplers.append(sampler)
+                threaded_backends.add(id(sampler.backend))
+                threaded_tasks.append((dem_ndx, sampler, dem_xs, dem_ys))
+            except Exception as e:
+                dems_errors[dem_ndx] = str(e)
+
+        if threaded_tasks:
+            with ThreadPoolExecutor(max_workers=min(max_threads, len(threaded_tasks))) as executor:
+                futures = [(dem_ndx, executor.submit(sampler.interpolate_z_array, dem_xs, dem_ys))
+                           for dem_ndx, sampler, dem_xs, dem_ys in threaded_tasks]
+                for dem_ndx, future in futures:
+                    try:
+                        dems_zs[dem_ndx] = future.result()
+                    except Exception as e:
+                        dems_errors[dem_ndx] = str(e)
+
+        for dem_ndx, sampler, dem_xs, dem_ys in serial_tasks:
+            try:
+                dems_zs[dem_ndx] = sampler.interpolate_z_array(dem_xs, dem_ys)
+            except Exception as e:
+                dems_errors[dem_ndx] = str(e)
 
-        return min(list(map(np.nanmin, self.profile_zs)))
+    finally:
 
-    def max_z(self):
+        for sampler in cloned_samplers:
+            sampler.backend.close()
 
-        return max(list(map(np.nanmax, self.profile_zs)))
+    return dems_zs, dems_errors
 
-    @property
-    def absolute_slopes(self):
 
-        return list(map(np.fabs, self.profile_dirslopes))
+def dem_overview_factors(dem, overview_sampling_ratio):
+    """
+    Decimation factors of the existing overview levels of a DEM.
+    Overviews are only looked up for GDAL DEMs, and only when decimated sampling is enabled.
 
+    :param dem: qgis._core.QgsRasterLayer
+    :param overview_sampling_ratio: float, see sample_dems
+    :return: set of int
+    """
 
-class DEMParams(object):
+    if not overview_sampling_ratio > 0.0 or dem.providerType() != "gdal":
+        return set()
 
-    def __init__(self, layer, params):
+    try:
+        return raster_overview_factors(dem.source())
+    except RasterIOException:
+        return set()
 
-        self.layer = layer
-        self.params = params
 
+def build_dems_overviews(canvas, selected_dems, selected_dem_parameters, sample_distance, overview_sampling_ratio,
+                         confirm_build=None):
+    """
+    Build the missing GDAL overview levels that are used when sampling the DEMs at the sample distance.
+    Only GDAL DEMs in the project CRS are considered, the sample distance being in the project CRS units.
+    Overviews are written as .ovr files next to the DEM files, so the build can be subject to a confirmation.
+
+    :param canvas: the map canvas
+    :param selected_dems: list of qgis._core.QgsRasterLayer
+    :param selected_dem_parameters: list of QGisRasterParameters
+    :param sample_distance: float
+    :param overview_sampling_ratio: float, see sample_dems
+    :param confirm_build: callable receiving the paths of the DEMs with missing overviews
+      and returning True to build them, or None to build them without confirmation
+    :return: list of the names of the DEMs with new overviews
+    """
 
-class PlaneAttitude(object):
+    on_the_fly_projection, project_crs = get_on_the_fly_projection(canvas)
 
-    def __init__(self, rec_id, source_point_3d, source_geol_plane, point_3d, slope_rad, dwnwrd_sense, sign_hor_dist):
+    dems_decimations = []
+    for dem, dem_params in zip(selected_dems, selected_dem_parameters):
 
-        self.id = rec_id
-        self.src_pt_3d = source_point_3d
-        self.src_geol_plane = source_geol_plane
-        self.pt_3d = point_3d
-        self.slope_rad = slope_rad
-        self.dwnwrd_sense = dwnwrd_sense
-        self.sign_hor_dist = sign_hor_dist
+        if dem.providerType() != "gdal" or (on_the_fly_projection and dem.crs() != project_crs):
+            continue
 
+        decimation = overview_decimation_factor(dem_params, sample_distance, overview_sampling_ratio)
+        if missing_overview_factors(dem.source(), decimation):
+            dems_decimations.append((dem, decimation))
 
-def topoline_from_dem(resampled_trace2d, bOnTheFlyProjection, project_crs, dem, dem_params):
+    if not dems_decimations:
+        return []
 
-    if bOnTheFlyProjection and dem.crs() != project_crs:
-        trace2d_in_dem_crs = resampled_trace2d.crs_project(project_crs, dem.crs())
-    else:
-        trace2d_in_dem_crs = resampled_trace2d
+    if confirm_build is not None and not confirm_build([dem.source() for dem, _ in dems_decimations]):
+        return []
 
-    ln3dtProfile = Line()
-    for trace_pt2d_dem_crs, trace_pt2d_project_crs in zip(trace2d_in_dem_crs.pts, resampled_trace2d.pts):
-        fInterpolatedZVal = interpolate_z(dem, dem_params, trace_pt2d_dem_crs)
-        pt3dtPoint = Point(trace_pt2d_project_crs.x,
-                           trace_pt2d_project_crs.y,
-                           fInterpolatedZVal)
-        ln3dtProfile.add_pt(pt3dtPoint)
+    updated_dem_names = []
+    for dem, decimation in dems_decimations:
+        if build_raster_overviews(dem.source(), decimation):
+            updated_dem_names.append(dem.name())
 
-    return ln3dtProfile
+    return updated_dem_names
 
 
-def topoprofiles_from_dems(
-        canvas,
-        source_profile_line,
+def topoprofiles_from_dems_chunked(
+        line,
         sample_distance,
         selected_dems,
         selected_dem_parameters,
-        invert_profile
+        on_the_fly_projection,
+        project_crs,
+        chunk_size,
+        use_memmap=False,
+        overview_sampling_ratio=0.0
 ):
-    
-    # get project CRS information
-    on_the_fly_projection, project_crs = get_on_the_fly_projection(canvas)
-
-    if invert_profile:
-        line = source_profile_line.reverse_direction()
-    else:
-        line = source_profile_line
-
-    resampled_line = line.densify_2d_line(sample_distance)  # line resampled by sample distance
-
-    # calculate 3D profiles from DEMs
+    """
+    Create the topographic profiles of a line from DEMs,
+    densifying, reprojecting and sampling the line in chunks of at most chunk_size points
+    (see chunked_profile_elevations).
+
+    :param line: Line, already in the requested direction
+    :param sample_distance: float
+    :param selected_dems: list of qgis._core.QgsRasterLayer
+    :param selected_dem_parameters: list of QGisRasterParameters
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param chunk_size: int
+    :param use_memmap: bool
+    :param overview_sampling_ratio: float, see sample_dems
+    :return: ProfileElevations instance
+    """
 
-    dem_topolines3d = []
-    for dem, dem_params in zip(selected_dems, selected_dem_parameters):
+    def sample_points(xs, ys):
 
-        dem_topoline3d = topoline_from_dem(
-            resampled_line,
+        return sample_dems(
+            xs,
+            ys,
+            selected_dems,
+            selected_dem_parameters,
             on_the_fly_projection,
             project_crs,
-            dem,
-            dem_params
-        )
+            overview_sampling_ratio=overview_sampling_ratio)
 
-        dem_topolines3d.append(dem_topoline3d)
+    topo_profiles = chunked_profile_elevations(
+        line.densify_2d_line_chunks(sample_distance, chunk_size),
+        line.densified_2d_pts_max_num(sample_distance),
+        len(selected_dems),
+        sample_points,
+        use_memmap)
 
-    # setup topoprofiles properties
-
-    topo_profiles = ProfileElevations()
-
-    topo_profiles.planar_xs = np.asarray(resampled_line.x_list)
-    topo_profiles.planar_ys = np.asarray(resampled_line.y_list)
     topo_profiles.surface_names = [dem.name() for dem in selected_dems]
-    topo_profiles.profile_s = np.asarray(resampled_line.incremental_length_2d())
-    topo_profiles.profile_s3ds = [np.asarray(cl3dt.incremental_length_3d()) for cl3dt in dem_topolines3d]
-    topo_profiles.profile_zs = [cl3dt.z_array() for cl3dt in dem_topolines3d]
-    topo_profiles.profile_dirslopes = [np.asarray(cl3dt.slopes()) for cl3dt in dem_topolines3d]
     topo_profiles.dem_params = [DEMParams(dem, params) for (dem, params) in
                                 zip(selected_dems, selected_dem_parameters)]
 
@@ -316,102 +777,75 @@ def topoprofiles_from_dems(
 
 def topoprofiles_from_gpxfile(source_gpx_path, invert_profile, gpx_source):
 
-    doc = xml.dom.minidom.parse(source_gpx_path)
-
-    # define track name
-    try:
-        trkname = doc.getElementsByTagName('trk')[0].getElementsByTagName('name')[0].firstChild.data
-    except:
-        trkname = ''
-
-    # get raw track point values (lat, lon, elev, time)
-    track_raw_data = []
-    for trk_node in doc.getElementsByTagName('trk'):
-        for trksegment in trk_node.getElementsByTagName('trkseg'):
-            for tkr_pt in trksegment.getElementsByTagName('trkpt'):
-                track_raw_data.append((tkr_pt.getAttribute("lat"),
-                                       tkr_pt.getAttribute("lon"),
-                                       tkr_pt.getElementsByTagName("ele")[0].childNodes[0].data,
-                                       tkr_pt.getElementsByTagName("time")[0].childNodes[0].data))
+    trkname, lats, lons, elevs, times = read_gpx_track(source_gpx_path)
 
     # reverse profile orientation if requested
     if invert_profile:
-        track_data = track_raw_data[::-1]
-    else:
-        track_data = track_raw_data
-
-    # create list of TrackPointGPX elements
-    track_points = []
-    for val in track_data:
-        gpx_trackpoint = TrackPointGPX(*val)
-        track_points.append(gpx_trackpoint)
+        lats, lons, elevs, times = lats[::-1], lons[::-1], elevs[::-1], times[::-1]
 
     # check for the presence of track points
-    if len(track_points) == 0:
+    if lats.size == 0:
         raise GPXIOException("No track point found in this file")
 
     # calculate delta elevations between consecutive points
-    delta_elev_values = [np.nan]
-    for ndx in range(1, len(track_points)):
-        delta_elev_values.append(track_points[ndx].elev - track_points[ndx - 1].elev)
+    delta_elevs = np.concatenate(([np.nan], np.diff(elevs)))
 
-    # convert original values into ECEF values (x, y, z in ECEF global coordinate system)
-    trk_ECEFpoints = [trck.as_pt3dt() for trck in track_points]
+    # convert original values into ECEF values (x, y in ECEF global coordinate system, z as elevation)
+    ecef_xs, ecef_ys, _ = geodetic2ecef(lats, lons, elevs)
 
     # calculate 3D distances between consecutive points
-    dist_3D_values = [np.nan]
-    for ndx in range(1, len(trk_ECEFpoints)):
-        dist_3D_values.append(trk_ECEFpoints[ndx].dist_3d(trk_ECEFpoints[ndx - 1]))
+    dists_3d = np.concatenate(([np.nan], np.sqrt(np.diff(ecef_xs) ** 2 + np.diff(ecef_ys) ** 2 + np.diff(elevs) ** 2)))
 
-    # calculate slope along track
-    dir_slopes = []
-    for delta_elev, dist_3D in zip(delta_elev_values, dist_3D_values):
-        try:
-            slope = degrees(asin(delta_elev / dist_3D))
-        except:
-            slope = 0.0
-        dir_slopes.append(slope)
+    # calculate slope along track, zero for coincident points
+    dir_slopes = np.zeros(lats.size)
+    valid_dists = dists_3d != 0.0
+    with np.errstate(invalid='ignore'):
+        dir_slopes[valid_dists] = np.degrees(np.arcsin(delta_elevs[valid_dists] / dists_3d[valid_dists]))
 
     # calculate horizontal distance along track
-    horiz_dist_values = []
-    for slope, dist_3D in zip(dir_slopes, dist_3D_values):
-        try:
-            horiz_dist_values.append(dist_3D * cos(radians(slope)))
-        except:
-            horiz_dist_values.append(np.nan)
+    horiz_dists = dists_3d * np.cos(np.radians(dir_slopes))
 
-    # defines the cumulative 2D distance values
-    cum_distances_2D = [0.0]
-    for ndx in range(1, len(horiz_dist_values)):
-        cum_distances_2D.append(cum_distances_2D[-1] + horiz_dist_values[ndx])
-
-    # defines the cumulative 3D distance values
-    cum_distances_3D = [0.0]
-    for ndx in range(1, len(dist_3D_values)):
-        cum_distances_3D.append(cum_distances_3D[-1] + dist_3D_values[ndx])
-
-    lat_values = [track.lat for track in track_points]
-    lon_values = [track.lon for track in track_points]
-    time_values = [track.time for track in track_points]
-    elevations = [track.elev for track in track_points]
+    # defines the cumulative 2D and 3D distance values
+    cum_distances_2D = np.concatenate(([0.0], np.cumsum(horiz_dists[1:])))
+    cum_distances_3D = np.concatenate(([0.0], np.cumsum(dists_3d[1:])))
 
     topo_profiles = ProfileElevations()
 
     topo_profiles.line_source = gpx_source
     topo_profiles.inverted = invert_profile
 
-    topo_profiles.lons = np.asarray(lon_values)
-    topo_profiles.lats = np.asarray(lat_values)
-    topo_profiles.times = time_values
+    topo_profiles.lons = lons
+    topo_profiles.lats = lats
+    topo_profiles.times = gpstimes_to_seconds(times)
     topo_profiles.surface_names = [trkname]  # [] required for compatibility with DEM case
-    topo_profiles.profile_s = np.asarray(cum_distances_2D)
-    topo_profiles.profile_s3ds = [np.asarray(cum_distances_3D)]  # [] required for compatibility with DEM case
-    topo_profiles.profile_zs = [np.asarray(elevations)]  # [] required for compatibility with DEM case
-    topo_profiles.profile_dirslopes = [np.asarray(dir_slopes)]  # [] required for compatibility with DEM case
+    topo_profiles.profile_s = cum_distances_2D
+    topo_profiles.profile_s3ds = [cum_distances_3D]  # [] required for compatibility with DEM case
+    topo_profiles.profile_zs = [elevs]  # [] required for compatibility with DEM case
+    topo_profiles.profile_dirslopes = [dir_slopes]  # [] required for compatibility with DEM case
 
     return topo_profiles
 
 
+def dem_zs_at_xy_arrays(demLayer, demParams, on_the_fly_projection, project_crs, xs, ys):
+    """
+    Array version of intersect_with_dem: elevations of points from a DEM,
+    with the points projected to the DEM CRS with a single transform call.
+
+    :param demLayer: qgis._core.QgsRasterLayer
+    :param demParams: QGisRasterParameters
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param xs: array-like of x values, in the project CRS
+    :param ys: array-like of y values, in the project CRS
+    :return: np.ndarray of z values
+    """
+
+    if on_the_fly_projection and demParams.crs != project_crs:
+        xs, ys = project_xy_arrays(xs, ys, project_crs, demParams.crs)
+
+    return interpolate_z_array(demLayer, demParams, xs, ys)
+
+
 def intersect_with_dem(demLayer, demParams, on_the_fly_projection, project_crs, lIntersPts):
     """
     
@@ -423,125 +857,402 @@ def intersect_with_dem(demLayer, demParams, on_the_fly_projection, project_crs,
     :return: a list of Point instances
     """
 
-    # project to Dem CRS
-    if on_the_fly_projection and demParams.crs != project_crs:
-        lQgsPoints = [QgsPointXY(pt.x, pt.y) for pt in lIntersPts]
-        lDemCrsIntersQgsPoints = [project_qgs_point(qgsPt, project_crs, demParams.crs) for qgsPt in
-                                               lQgsPoints]
-        lDemCrsIntersPts = [Point(qgispt.x(), qgispt.y()) for qgispt in lDemCrsIntersQgsPoints]
-    else:
-        lDemCrsIntersPts = lIntersPts
+    lZVals = dem_zs_at_xy_arrays(demLayer,
+                                 demParams,
+                                 on_the_fly_projection,
+                                 project_crs,
+                                 [pt.x for pt in lIntersPts],
+                                 [pt.y for pt in lIntersPts])
+
+    return [Point(pt2d.x, pt2d.y, z) for pt2d, z in zip(lIntersPts, lZVals)]
 
-    # interpolate z values from Dem
-    lZVals = [interpolate_z(demLayer, demParams, pt) for pt in lDemCrsIntersPts]
 
-    lXYZVals = [(pt2d.x, pt2d.y, z) for pt2d, z in zip(lIntersPts, lZVals)]
+def profile_lines_intersections(multilines2d_list, id_list, profile_line2d):
+    """
+    Intersections between the segments of a profile line, also with more than two vertices,
+    and the segments of a set of multilines, tested all at once.
+    Intersections are in multiline, line and segment order.
+
+    :param multilines2d_list: list of MultiLine
+    :param id_list: list of the multiline ids, or None
+    :param profile_line2d: Line
+    :return: tuple of intersection points (N x 2 np.ndarray), profile segment indices,
+             multiline segment indices (in the flattened multiline points, see multilines_to_array),
+             multiline ids (list) and distances along the profile from its start (np.ndarray)
+    """
 
-    return [Point(x, y, z) for x, y, z in lXYZVals]
+    profile_pts = profile_line2d.array[:, :2]
+    profile_segment_lengths = np.hypot(*np.diff(profile_pts, axis=0).T)
+    profile_segment_starts_s = np.concatenate(([0.0], np.cumsum(profile_segment_lengths)[:-1]))
 
+    lines_pts, line_offsets, multiline_offsets = multilines_to_array(multilines2d_list)
+    lines_pts = lines_pts[:, :2]
+    segment_ndxs = multilines_segments(lines_pts, line_offsets)
 
-def calculate_profile_lines_intersection(multilines2d_list, id_list, profile_line2d):
+    # index of the multiline of each flattened point
+    multiline_pts_nums = line_offsets[multiline_offsets[1:]] - line_offsets[multiline_offsets[:-1]]
+    pts_multiline_ndxs = np.repeat(np.arange(len(multilines2d_list)), multiline_pts_nums)
 
-    profile_segment2d_list = profile_line2d.as_segments()
+    # profile segments exclude their end point, apart from the last one,
+    # so that intersections at the profile vertices are found once
+    half_open = np.arange(profile_pts.shape[0] - 1) < profile_pts.shape[0] - 2
 
-    profile_segment2d = profile_segment2d_list[0]
+    profile_ndxs, candidate_ndxs, ts, _ = segments_intersections_2d(profile_pts[:-1],
+                                                                   profile_pts[1:],
+                                                                   lines_pts[segment_ndxs],
+                                                                   lines_pts[segment_ndxs + 1],
+                                                                   half_open)
 
-    intersection_list = []
-    for ndx, multiline2d in enumerate(multilines2d_list):
-        if id_list is None:
-            multiline_id = ''
-        else:
-            multiline_id = id_list[ndx]
-        for line2d in multiline2d.lines:
-            for line_segment2d in line2d.as_segments():
-                try:
-                    intersection_point2d = profile_segment2d.intersection_2d_pt(line_segment2d)
-                except ZeroDivisionError:
-                    continue
-                if intersection_point2d is None:
-                    continue
-                if line_segment2d.contains_2d_pt(intersection_point2d) and \
-                   profile_segment2d.contains_2d_pt(intersection_point2d):
-                    intersection_list.append([intersection_point2d, multiline_id])
+    order = np.lexsort((profile_ndxs, candidate_ndxs))
+    profile_ndxs, line_segment_ndxs, ts = profile_ndxs[order], segment_ndxs[candidate_ndxs[order]], ts[order]
 
-    return intersection_list
+    profile_deltas = profile_pts[profile_ndxs + 1] - profile_pts[profile_ndxs]
+    inters_pts = profile_pts[profile_ndxs] + profile_deltas * ts[:, np.newaxis]
+    profile_s = profile_segment_starts_s[profile_ndxs] + ts * profile_segment_lengths[profile_ndxs]
+
+    multiline_ndxs = pts_multiline_ndxs[line_segment_ndxs]
+    if id_list is None:
+        inters_ids = [''] * multiline_ndxs.size
+    else:
+        inters_ids = [id_list[ndx] for ndx in multiline_ndxs]
+
+    return inters_pts, profile_ndxs, line_segment_ndxs, inters_ids, profile_s
+
+
+def calculate_profile_lines_intersection(multilines2d_list, id_list, profile_line2d):
+
+    inters_pts, _, _, inters_ids, _ = profile_lines_intersections(multilines2d_list, id_list, profile_line2d)
+
+    return [[Point(x, y), multiline_id] for (x, y), multiline_id in zip(inters_pts.tolist(), inters_ids)]
 
 
 def intersection_distances_by_profile_start_list(profile_line, intersections):
+    """
+    Distances along a profile line, also with more than two vertices, of intersection points.
+
+    :param profile_line: Line
+    :param intersections: list of [Point, id] pairs, see calculate_profile_lines_intersection
+    :return: list of float
+    """
 
-    # convert the profile line
-    # from a CartesianLine2DT to a CartesianSegment2DT
-    profile_segment2d_list = profile_line.as_segments()
-    # debug
-    assert len(profile_segment2d_list) == 1
-    profile_segment2d = profile_segment2d_list[0]
+    if not intersections:
+        return []
 
-    # determine distances for each point in intersection list
-    # creating a list of float values
-    distance_from_profile_start_list = []
-    for intersection in intersections:
-        distance_from_profile_start_list.append(profile_segment2d.start_pt.dist_2d(intersection[0]))
+    xs = np.array([intersection[0].x for intersection in intersections], dtype=np.float64)
+    ys = np.array([intersection[0].y for intersection in intersections], dtype=np.float64)
 
-    return distance_from_profile_start_list
+    return distances_along_line(profile_line, xs, ys).tolist()
 
 
 def calculate_pts_in_projection(pts_in_orig_crs, srcCrs, destCrs):
 
-    pts_in_prj_crs = []
-    for pt in pts_in_orig_crs:
-        qgs_pt = QgsPointXY(pt.x, pt.y)
-        qgs_pt_prj_crs = project_qgs_point(qgs_pt, srcCrs, destCrs)
-        pts_in_prj_crs.append(Point(qgs_pt_prj_crs.x(), qgs_pt_prj_crs.y()))
-    return pts_in_prj_crs
+    prj_crs_xs, prj_crs_ys = project_xy_arrays([pt.x for pt in pts_in_orig_crs],
+                                               [pt.y for pt in pts_in_orig_crs],
+                                               srcCrs,
+                                               destCrs)
 
+    return [Point(x, y) for x, y in zip(prj_crs_xs, prj_crs_ys)]
 
-def profile_polygon_intersection(profile_qgsgeometry, polygon_layer, inters_polygon_classifaction_field_ndx):
 
-    intersection_polyline_polygon_crs_list = []
+def profile_line_in_layer_crs(layer, profile_line, on_the_fly_projection, project_crs):
+    """
+    Vertex coordinates of a profile line in the CRS of a layer.
+
+    :param layer: qgis._core.QgsMapLayer
+    :param profile_line: Line, in the project CRS
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :return: tuple of two np.ndarray: x and y values
+    """
 
-    if polygon_layer.selectedFeatureCount() > 0:
-        features = polygon_layer.selectedFeatures()
+    if on_the_fly_projection and layer.crs() != project_crs:
+        return project_xy_arrays(profile_line.x_array(), profile_line.y_array(), project_crs, layer.crs())
     else:
-        features = polygon_layer.getFeatures()
+        return profile_line.x_array(), profile_line.y_array()
 
-    for polygon_feature in features:
-        # retrieve every (selected) feature with its geometry and attributes
 
-        # fetch geometry
-        poly_geom = polygon_feature.geometry()
+def profile_corridor_rect(layer, profile_line, on_the_fly_projection, project_crs, half_width):
+    """
+    Rectangle enclosing a corridor around a profile line, in the CRS of a layer,
+    to be used as a feature request spatial filter.
+
+    :param layer: qgis._core.QgsVectorLayer
+    :param profile_line: Line, in the project CRS
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param half_width: float, the corridor half width
+    :return: qgis._core.QgsRectangle
+    """
 
-        intersection_qgsgeometry = poly_geom.intersection(profile_qgsgeometry)
+    xs, ys = profile_line_in_layer_crs(layer, profile_line, on_the_fly_projection, project_crs)
 
-        try:
-            if intersection_qgsgeometry.isEmpty():
-                continue
-        except:
-            try:
-                if intersection_qgsgeometry.isGeosEmpty():
-                    continue
-            except:
-                return False, "Missing function for checking empty geometries.\nPlease upgrade QGIS"
+    return QgsRectangle(np.nanmin(xs) - half_width,
+                        np.nanmin(ys) - half_width,
+                        np.nanmax(xs) + half_width,
+                        np.nanmax(ys) + half_width)
+
+
+def profile_candidate_fids(layer, profile_line, on_the_fly_projection, project_crs, half_width):
+    """
+    Ids of the features of a vector layer that may intersect a corridor around a profile line,
+    from the layer spatial index.
+
+    :param layer: qgis._core.QgsVectorLayer
+    :param profile_line: Line, in the project CRS
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param half_width: float, the corridor half width, also absorbing the bending of the profile
+                       when projected into the layer CRS
+    :return: np.ndarray of feature ids
+    """
+
+    xs, ys = profile_line_in_layer_crs(layer, profile_line, on_the_fly_projection, project_crs)
+
+    return vector_layer_spatial_index(layer).query_polyline(xs, ys, half_width)
+
+
+def polygon_classified_geometries(polygon_layer, inters_polygon_classifaction_field_ndx, fids=None, filter_rect=None):
+    """
+    Geometries and classification values of the polygons of a layer, read in a single layer pass.
+
+    :param polygon_layer: qgis._core.QgsVectorLayer
+    :param inters_polygon_classifaction_field_ndx: int, the classification field index, negative for none
+    :param fids: iterable of feature ids, or None for all the features
+    :param filter_rect: qgis._core.QgsRectangle or None
+    :return: list of (classification, qgis._core.QgsGeometry) tuples
+    """
+
+    if inters_polygon_classifaction_field_ndx >= 0:
+        attributes = [inters_polygon_classifaction_field_ndx]
+    else:
+        attributes = []
+
+    polygons = []
+    for polygon_feature in layer_features(polygon_layer, fids, filter_rect, attributes):
+
+        poly_geom = polygon_feature.geometry()
+        if poly_geom.isNull():
+            continue
 
         if inters_polygon_classifaction_field_ndx >= 0:
-            attrs = polygon_feature.attributes()
-            polygon_classification = attrs[inters_polygon_classifaction_field_ndx]
+            polygon_classification = polygon_feature.attributes()[inters_polygon_classifaction_field_ndx]
         else:
             polygon_classification = None
 
+        polygons.append((polygon_classification, poly_geom))
+
+    return polygons
+
+
+def profile_polygons_intersection_lines(profile_qgsgeometry, polygons):
+    """
+    Intersections of a profile geometry with polygons.
+    The profile is converted and prepared once, and reused for all the polygons.
+
+    :param profile_qgsgeometry: qgis._core.QgsGeometry, in the polygons CRS
+    :param polygons: list of (classification, qgis._core.QgsGeometry) tuples, see polygon_classified_geometries
+    :return: list of [classification, list of qgis._core.QgsPointXY] pairs
+    """
+
+    intersection_polyline_polygon_crs_list = []
+
+    profile_engine = prepared_geometry_engine(profile_qgsgeometry)
+    profile_bbox = profile_qgsgeometry.boundingBox()
+
+    for polygon_classification, poly_geom in polygons:
+
+        # cheap tests first: bounding boxes, then the prepared profile
+        if not profile_bbox.intersects(poly_geom.boundingBox()):
+            continue
+        if not profile_engine.intersects(poly_geom.constGet()):
+            continue
+
+        intersection_geometry = profile_engine.intersection(poly_geom.constGet())
+        if intersection_geometry is None:
+            continue
+        intersection_qgsgeometry = QgsGeometry(intersection_geometry)
+        if intersection_qgsgeometry.isEmpty():
+            continue
+
         if intersection_qgsgeometry.isMultipart():
             lines = intersection_qgsgeometry.asMultiPolyline()
         else:
             lines = [intersection_qgsgeometry.asPolyline()]
 
         for line in lines:
-            intersection_polyline_polygon_crs_list.append([polygon_classification, line])
+            if len(line) > 1:
+                intersection_polyline_polygon_crs_list.append([polygon_classification, line])
+
+    return intersection_polyline_polygon_crs_list
+
+
+def profile_polygon_intersection(profile_qgsgeometry, polygon_layer, inters_polygon_classifaction_field_ndx, fids=None,
+                                 filter_rect=None):
+
+    polygons = polygon_classified_geometries(polygon_layer, inters_polygon_classifaction_field_ndx, fids, filter_rect)
+
+    return True, profile_polygons_intersection_lines(profile_qgsgeometry, polygons)
+
+
+def profiles_polygon_intersections(profile_lines, polygon_layer, inters_polygon_classifaction_field_ndx,
+                                   on_the_fly_projection, project_crs, half_width, max_threads=1):
+    """
+    Intersections of several profile lines with the polygons of a layer.
+    The candidate polygons of all the profiles are read in a single layer pass,
+    then each profile is intersected with them, on a bounded thread pool when more threads are allowed,
+    each thread working on its own copies of the polygon geometries.
+    The intersection vertices are projected back to the project CRS with a single transform call.
+
+    :param profile_lines: list of Line, densified, in the project CRS
+    :param polygon_layer: qgis._core.QgsVectorLayer
+    :param inters_polygon_classifaction_field_ndx: int, the classification field index, negative for none
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param half_width: float, the half width of the corridor where candidate polygons are searched
+    :param max_threads: int, maximum number of profiles intersected concurrently
+    :return: list, in profile order, of lists of [classification, Line] pairs, with lines in the project CRS
+    """
+
+    if not profile_lines:
+        return []
+
+    profiles_xys = [profile_line_in_layer_crs(polygon_layer, profile_line, on_the_fly_projection, project_crs)
+                    for profile_line in profile_lines]
+
+    # candidate polygons of all the profiles, from the layer spatial index and within the union of the corridors
+
+    spatial_index = vector_layer_spatial_index(polygon_layer)
+    candidate_fids = np.unique(np.concatenate(
+        [np.asarray(spatial_index.query_polyline(xs, ys, half_width), dtype=np.int64) for xs, ys in profiles_xys]))
+
+    all_xs = np.concatenate([xs for xs, _ in profiles_xys])
+    all_ys = np.concatenate([ys for _, ys in profiles_xys])
+    corridors_rect = QgsRectangle(np.nanmin(all_xs) - half_width,
+                                  np.nanmin(all_ys) - half_width,
+                                  np.nanmax(all_xs) + half_width,
+                                  np.nanmax(all_ys) + half_width)
+
+    polygons = polygon_classified_geometries(polygon_layer,
+                                             inters_polygon_classifaction_field_ndx,
+                                             candidate_fids,
+                                             corridors_rect)
+
+    profile_qgsgeometries = [QgsGeometry.fromPolyline([QgsPoint(x, y) for x, y in zip(xs, ys)])
+                             for xs, ys in profiles_xys]
+
+    # each thread works on its own copies of the polygons,
+    # since a geometry object is not to be used by several threads at once
 
-    return True, intersection_polyline_polygon_crs_list
+    def copy_polygons(polygons):
 
+        return [(polygon_classification, QgsGeometry(poly_geom.constGet().clone()))
+                for polygon_classification, poly_geom in polygons]
 
-def extract_multiline2d_list(structural_line_layer, on_the_fly_projection, project_crs):
+    profiles_lines = map_with_thread_copies(profile_polygons_intersection_lines,
+                                            profile_qgsgeometries,
+                                            polygons,
+                                            copy_polygons,
+                                            max_threads)
 
-    line_orig_crs_geoms_attrs = line_geoms_attrs(structural_line_layer)
+    # back to the project CRS, all the intersection vertices at once
+
+    lines_xys = [(pt.x(), pt.y()) for profile_lines_crs in profiles_lines
+                 for _, line in profile_lines_crs for pt in line]
+    if not lines_xys:
+        return [[] for _ in profiles_lines]
+
+    lines_xs, lines_ys = np.array(lines_xys, dtype=np.float64).T
+    if on_the_fly_projection and polygon_layer.crs() != project_crs:
+        lines_xs, lines_ys = project_xy_arrays(lines_xs, lines_ys, polygon_layer.crs(), project_crs)
+
+    profiles_intersections = []
+    pt_ndx = 0
+    for profile_lines_crs in profiles_lines:
+        profile_intersections = []
+        for polygon_classification, line in profile_lines_crs:
+            next_pt_ndx = pt_ndx + len(line)
+            profile_intersections.append([polygon_classification,
+                                          Line.from_arrays(lines_xs[pt_ndx:next_pt_ndx], lines_ys[pt_ndx:next_pt_ndx])])
+            pt_ndx = next_pt_ndx
+        profiles_intersections.append(profile_intersections)
+
+    return profiles_intersections
+
+
+def drape_profiles_intersections(geoprofiles, profiles_intersections, on_the_fly_projection, project_crs):
+    """
+    Drape the profile-polygon intersection lines of several profiles on the profile DEMs.
+    Each profile uses its first DEM, the outcrop lines storing a single elevation for each vertex.
+    The intersection vertices of the profiles sharing a DEM are interpolated all at once.
+
+    :param geoprofiles: list of GeoProfile
+    :param profiles_intersections: list, in profile order, of lists of [classification, Line] pairs,
+                                   see profiles_polygon_intersections
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :return: list, in profile order, of (classification list, 3D Line list, distances list) tuples,
+             see GeoProfile.add_intersections_lines
+    """
+
+    # intersection vertices grouped by the first DEM of their profile
+
+    dems_profile_ndxs = OrderedDict()
+    for profile_ndx, geoprofile in enumerate(geoprofiles):
+        dem_params = geoprofile.topo_profiles.dem_params[0]
+        dems_profile_ndxs.setdefault(dem_params.layer.id(), []).append(profile_ndx)
+
+    profiles_zs = [None] * len(geoprofiles)
+    for profile_ndxs in dems_profile_ndxs.values():
+
+        lines = [line for profile_ndx in profile_ndxs for _, line in profiles_intersections[profile_ndx]]
+        if not lines:
+            continue
+
+        dem_params = geoprofiles[profile_ndxs[0]].topo_profiles.dem_params[0]
+        zs = dem_zs_at_xy_arrays(dem_params.layer,
+                                 dem_params.params,
+                                 on_the_fly_projection,
+                                 project_crs,
+                                 np.concatenate([line.x_array() for line in lines]),
+                                 np.concatenate([line.y_array() for line in lines]))
+
+        pt_ndx = 0
+        for profile_ndx in profile_ndxs:
+            pts_num = sum(line.num_pts for _, line in profiles_intersections[profile_ndx])
+            profiles_zs[profile_ndx] = zs[pt_ndx:pt_ndx + pts_num]
+            pt_ndx += pts_num
+
+    profiles_outcrops = []
+    for geoprofile, profile_intersections, profile_zs in zip(geoprofiles, profiles_intersections, profiles_zs):
+
+        formation_list = []
+        intersection_line3d_list = []
+        intersection_polygon_s_list2 = []
+
+        if profile_intersections:
+
+            xs = np.concatenate([line.x_array() for _, line in profile_intersections])
+            ys = np.concatenate([line.y_array() for _, line in profile_intersections])
+            profile_s = distances_along_line(geoprofile.original_line, xs, ys)
+
+            pt_ndx = 0
+            for polygon_classification, line in profile_intersections:
+                next_pt_ndx = pt_ndx + line.num_pts
+                formation_list.append(polygon_classification)
+                intersection_line3d_list.append(Line.from_arrays(xs[pt_ndx:next_pt_ndx],
+                                                                 ys[pt_ndx:next_pt_ndx],
+                                                                 profile_zs[pt_ndx:next_pt_ndx]))
+                intersection_polygon_s_list2.append(profile_s[pt_ndx:next_pt_ndx].tolist())
+                pt_ndx = next_pt_ndx
+
+        profiles_outcrops.append((formation_list, intersection_line3d_list, intersection_polygon_s_list2))
+
+    return profiles_outcrops
+
+
+def extract_multiline2d_list(structural_line_layer, on_the_fly_projection, project_crs, fids=None, filter_rect=None):
+
+    line_orig_crs_geoms_attrs = line_geoms_attrs(structural_line_layer, fids=fids, filter_rect=filter_rect)
 
     line_orig_geom_list3 = [geom_data[0] for geom_data in line_orig_crs_geoms_attrs]
     line_orig_crs_MultiLine2D_list = [xytuple_l2_to_MultiLine(xy_list2) for xy_list2 in line_orig_geom_list3]
@@ -597,7 +1308,22 @@ def define_plot_structural_segment(structural_attitude, profile_length, vertical
     return structural_segment_s, structural_segment_z
 
 
-def calculate_projected_3d_pts(canvas, struct_pts, structural_pts_crs, demObj):
+def projected_3d_arrays(canvas, xs, ys, structural_pts_crs, demObj):
+    """
+    Batch version of calculate_projected_3d_pts:
+    point coordinates are projected with one transform call for each CRS,
+    and the elevations are interpolated from the DEM blocks covering all the points.
+
+    :param canvas: the map canvas
+    :param xs: array-like of x values, in the point layer CRS
+    :param ys: array-like of y values, in the point layer CRS
+    :param structural_pts_crs: qgis._core.QgsCoordinateReferenceSystem, the point layer CRS
+    :param demObj: DEMParams
+    :return: tuple of three np.ndarray: x and y values in the project CRS, and the DEM elevations
+    """
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
 
     demCrs = demObj.params.crs
 
@@ -606,20 +1332,30 @@ def calculate_projected_3d_pts(canvas, struct_pts, structural_pts_crs, demObj):
 
     # set points in the project crs
     if on_the_fly_projection and structural_pts_crs != project_crs:
-        struct_pts_in_prj_crs = calculate_pts_in_projection(struct_pts, structural_pts_crs, project_crs)
+        prj_xs, prj_ys = project_xy_arrays(xs, ys, structural_pts_crs, project_crs)
     else:
-        struct_pts_in_prj_crs = copy.deepcopy(struct_pts)
+        prj_xs, prj_ys = xs, ys
 
-        # project the source points from point layer crs to DEM crs
+    # project the source points from point layer crs to DEM crs
     # if the two crs are different
-    if structural_pts_crs != demCrs:
-        struct_pts_in_dem_crs = calculate_pts_in_projection(struct_pts, structural_pts_crs, demCrs)
+    if structural_pts_crs == demCrs:
+        dem_xs, dem_ys = xs, ys
+    elif on_the_fly_projection and project_crs == demCrs:
+        dem_xs, dem_ys = prj_xs, prj_ys
     else:
-        struct_pts_in_dem_crs = copy.deepcopy(struct_pts)
+        dem_xs, dem_ys = project_xy_arrays(xs, ys, structural_pts_crs, demCrs)
 
-        # - 3D structural points, with x, y, and z extracted from the current DEM
-    struct_pts_z = get_zs_from_dem(struct_pts_in_dem_crs, demObj)
+    zs = interpolate_z_array(demObj.layer, demObj.params, dem_xs, dem_ys)
+
+    return prj_xs, prj_ys, zs
+
+
+def calculate_projected_3d_pts(canvas, struct_pts, structural_pts_crs, demObj):
 
-    assert len(struct_pts_in_prj_crs) == len(struct_pts_z)
+    prj_xs, prj_ys, zs = projected_3d_arrays(canvas,
+                                             [pt.x for pt in struct_pts],
+                                             [pt.y for pt in struct_pts],
+                                             structural_pts_crs,
+                                             demObj)
 
-    return [Point(pt.x, pt.y, z) for (pt, z) in zip(struct_pts_in_prj_crs, struct_pts_z)]
\ No newline at end of file
+    return [Point(x, y, z) for (x, y, z) in zip(prj_xs, prj_ys, zs)]
\ No newline at end of file
@@ -0,0 +1,405 @@
+
+from builtins import zip
+from builtins import range
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+
+from ..gsf.geometry import Point, GPlane
+
+from .features import Line
+from .geoprofiles import GeoProfilesSet, GeoProfile, ProfileElevations, DEMParams, PlaneAttitude, GeologicalInput
+from .layer_signatures import get_on_the_fly_projection, crs_key, vector_layer_signature
+from .profile_memo import ProfileSamplesMemo
+from .swath import SwathElevations
+
+
+# This module does not depend on QGIS:
+# layers and the map canvas are only accessed through their methods.
+
+
+PROFILES_CACHE_VERSION = 3
+UNSAVED_PROJECT_CACHE_NAME = "unsaved_project"
+
+
+def geoprofiles_fingerprint(canvas, profile_lines, sample_distance, dems, invert_profile, swath_params=None,
+                            overview_sampling_ratio=0.0):
+    """
+    Fingerprint of the inputs of a set of DEM-line profiles:
+    line vertices, sampling distance, inversion, swath, projection settings and DEM sources.
+
+    :param canvas: the map canvas
+    :param profile_lines: list of Line
+    :param sample_distance: float
+    :param dems: list of qgis._core.QgsRasterLayer
+    :param invert_profile: bool
+    :param swath_params: tuple of swath half width and across samples number, or None for no swath
+    :param overview_sampling_ratio: float, see qProf.gis_utils.profile.sample_dems
+    :return: str
+    """
+
+    on_the_fly_projection, project_crs = get_on_the_fly_projection(canvas)
+
+    fingerprint = hashlib.sha1()
+    fingerprint.update(repr(swath_params).encode('utf-8'))
+    for line in profile_lines:
+        line_key = ProfileSamplesMemo.line_key(line, sample_distance, invert_profile, on_the_fly_projection, project_crs,
+                                               overview_sampling_ratio)
+        fingerprint.update(repr(line_key).encode('utf-8'))
+    for dem in dems:
+        fingerprint.update(repr(ProfileSamplesMemo.dem_key(dem)).encode('utf-8'))
+
+    return fingerprint.hexdigest()
+
+
+def geological_fingerprint(profiles_fingerprint, layer, parameters):
+    """
+    Fingerprint of the inputs of a geological element added to a set of profiles
+    (a set of plane attitudes, or the outcrops): the profiles fingerprint,
+    the layer id, contents and CRS, and the element parameters.
+
+    :param profiles_fingerprint: str, see geoprofiles_fingerprint
+    :param layer: qgis._core.QgsVectorLayer, or None for a missing layer
+    :param parameters: JSON-serializable value, e.g. the used fields and options
+    :return: str, or None when the layer is missing or has pending edits
+    """
+
+    if profiles_fingerprint is None or layer is None or layer.isModified():
+        return None
+
+    fingerprint = hashlib.sha1()
+    fingerprint.update(profiles_fingerprint.encode('utf-8'))
+    fingerprint.update(repr((layer.id(), vector_layer_signature(layer), crs_key(layer.crs()))).encode('utf-8'))
+    fingerprint.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+
+    return fingerprint.hexdigest()
+
+
+def geoprofiles_cache_path(cache_dir, project_path):
+    """
+    Path of the profiles cache file of a project.
+    Unsaved projects share a single cache file.
+
+    :param cache_dir: str, the cache directory
+    :param project_path: str, the project file path, empty for an unsaved project
+    :return: str
+    """
+
+    if project_path:
+        cache_name = hashlib.sha1(os.path.abspath(project_path).encode('utf-8')).hexdigest()
+    else:
+        cache_name = UNSAVED_PROJECT_CACHE_NAME
+
+    return os.path.join(cache_dir, "{}.npz".format(cache_name))
+
+
+def stacked_arrays(arrays, size):
+    """
+    Stack equal-length arrays as the rows of a 2D array.
+
+    :param arrays: list of np.ndarray
+    :param size: int, the length of the arrays
+    :return: np.ndarray
+    """
+
+    if len(arrays) == 0:
+        return np.empty((0, size))
+
+    return np.vstack([np.asarray(array, dtype=np.float64) for array in arrays])
+
+
+def json_value(value):
+    """
+    Value stored in the JSON metadata: JSON-native values are kept, others are stored as strings.
+
+    :param value: any
+    :return: JSON-serializable value
+    """
+
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    return str(value)
+
+
+def json_color(color):
+    """
+    Plot color stored in the JSON metadata: color tuples are stored as lists,
+    other values (e.g. color names) as JSON values.
+
+    :param color: tuple of floats, or str
+    :return: JSON-serializable value
+    """
+
+    if isinstance(color, (tuple, list)):
+        return [float(value) for value in color]
+
+    return json_value(color)
+
+
+def geological_input_metadata(geological_input):
+    """
+    JSON metadata of the input of a geological element.
+
+    :param geological_input: GeologicalInput
+    :return: dict
+    """
+
+    return dict(
+        layer_id=geological_input.layer_id,
+        parameters=geological_input.parameters,
+        fingerprint=geological_input.fingerprint)
+
+
+def valid_geological_input(input_metadata, fingerprint, layers):
+    """
+    Return the input of a cached geological element when it is still valid,
+    i.e. when the fingerprint of the current inputs matches the stored one.
+
+    :param input_metadata: dict, see geological_input_metadata
+    :param fingerprint: str, see geoprofiles_fingerprint
+    :param layers: dict of the current layers by id
+    :return: GeologicalInput, or None
+    """
+
+    current_fingerprint = geological_fingerprint(fingerprint,
+                                                 layers.get(input_metadata["layer_id"]),
+                                                 input_metadata["parameters"])
+
+    if current_fingerprint is None or current_fingerprint != input_metadata["fingerprint"]:
+        return None
+
+    return GeologicalInput(input_metadata["layer_id"], input_metadata["parameters"], current_fingerprint)
+
+
+def save_geoprofiles(geoprofiles_set, file_path, fingerprint, plane_attitudes_colors=None,
+                     polygon_classification_colors=None):
+    """
+    Save a set of geoprofiles into a binary NPZ container,
+    with the profile arrays stored natively and the remaining values as JSON metadata.
+    Plane attitudes and outcrops are stored with the fingerprints of their inputs
+    (see geological_fingerprint), elements whose inputs cannot be fingerprinted are not stored.
+    Lineaments and projected surfaces are not stored.
+    DEM layers are not stored: they are re-linked at loading.
+    Profiles with failed DEM reads are not saved, so that the DEMs are read again next time.
+
+    :param geoprofiles_set: GeoProfilesSet
+    :param file_path: str
+    :param fingerprint: str, see geoprofiles_fingerprint
+    :param plane_attitudes_colors: list of the plot colors of the plane attitude sets
+    :param polygon_classification_colors: dict of the plot colors of the outcrop classifications, or None
+    :return: bool, whether the profiles were saved
+    """
+
+    for geoprofile in geoprofiles_set.geoprofiles:
+        if any(error is not None for error in geoprofile.topo_profiles.surface_errors):
+            return False
+
+    arrays = dict()
+    profiles_metadata = []
+
+    for profile_ndx, geoprofile in enumerate(geoprofiles_set.geoprofiles):
+
+        prefix = "p{}_".format(profile_ndx)
+        topo_profiles = geoprofile.topo_profiles
+        profile_size = len(topo_profiles.profile_s)
+
+        if isinstance(geoprofile.original_line, Line):
+            arrays[prefix + "original_line"] = geoprofile.original_line.array
+
+        for name in ("planar_xs", "planar_ys", "lons", "lats", "times", "profile_s"):
+            values = getattr(topo_profiles, name)
+            if values is not None:
+                arrays[prefix + name] = np.asarray(values, dtype=np.float64)
+
+        arrays[prefix + "profile_zs"] = stacked_arrays(topo_profiles.profile_zs, profile_size)
+        arrays[prefix + "profile_s3ds"] = stacked_arrays(topo_profiles.profile_s3ds, profile_size)
+        arrays[prefix + "profile_dirslopes"] = stacked_arrays(topo_profiles.profile_dirslopes, profile_size)
+
+        for surface_ndx, swath in enumerate(topo_profiles.profile_swaths):
+            arrays[prefix + "swath_{}".format(surface_ndx)] = stacked_arrays(
+                [swath.min_zs, swath.max_zs, swath.mean_zs] + list(swath.percentile_zs), profile_size)
+
+        attitudes_metadata = []
+        for set_ndx, (plane_attitudes, geological_input) in enumerate(zip(geoprofile.geoplane_attitudes,
+                                                                          geoprofile.geoplane_attitudes_inputs)):
+            if geological_input is None or geological_input.fingerprint is None:
+                continue
+            arrays[prefix + "attitudes_{}".format(set_ndx)] = np.array(
+                [[plane_attitude.src_pt_3d.x, plane_attitude.src_pt_3d.y, plane_attitude.src_pt_3d.z,
+                  plane_attitude.src_geol_plane.dd, plane_attitude.src_geol_plane.da,
+                  plane_attitude.pt_3d.x, plane_attitude.pt_3d.y, plane_attitude.pt_3d.z,
+                  plane_attitude.slope_rad, plane_attitude.sign_hor_dist] for plane_attitude in plane_attitudes],
+                dtype=np.float64).reshape(-1, 10)
+            attitudes_metadata.append(dict(
+                set_ndx=set_ndx,
+                input=geological_input_metadata(geological_input),
+                ids=[json_value(plane_attitude.id) for plane_attitude in plane_attitudes],
+                dwnwrd_senses=[plane_attitude.dwnwrd_sense for plane_attitude in plane_attitudes]))
+
+        outcrops_metadata = None
+        if geoprofile.outcrops_input is not None and geoprofile.outcrops_input.fingerprint is not None:
+            outcrop_lines = [line_3d.array for _, line_3d, _ in geoprofile.outcrops]
+            outcrop_s = [np.asarray(s_list, dtype=np.float64) for _, _, s_list in geoprofile.outcrops]
+            arrays[prefix + "outcrops_offsets"] = np.cumsum([0] + [len(array) for array in outcrop_lines])
+            arrays[prefix + "outcrops_pts"] = np.vstack(outcrop_lines) if outcrop_lines else np.empty((0, 4))
+            arrays[prefix + "outcrops_s"] = np.concatenate(outcrop_s) if outcrop_s else np.empty(0)
+            outcrops_metadata = dict(
+                input=geological_input_metadata(geoprofile.outcrops_input),
+                formations=[json_value(formation) for formation, _, _ in geoprofile.outcrops])
+
+        profiles_metadata.append(dict(
+            source_data_type=geoprofile.source_data_type,
+            sample_distance=geoprofile.sample_distance,
+            surface_names=list(topo_profiles.surface_names),
+            surface_errors=list(topo_profiles.surface_errors),
+            inverted=topo_profiles.inverted,
+            swath_half_width=topo_profiles.swath_half_width,
+            swath_percentiles=[list(swath.percentiles) for swath in topo_profiles.profile_swaths],
+            plane_attitudes=attitudes_metadata,
+            outcrops=outcrops_metadata))
+
+    metadata = dict(
+        version=PROFILES_CACHE_VERSION,
+        fingerprint=fingerprint,
+        name=geoprofiles_set.name,
+        profiles=profiles_metadata,
+        plane_attitudes_colors=[json_color(color) for color in (plane_attitudes_colors or [])],
+        polygon_classification_colors=None if polygon_classification_colors is None else dict(
+            (str(classification), json_color(color)) for classification, color in polygon_classification_colors.items()))
+
+    arrays["metadata"] = np.array(json.dumps(metadata))
+
+    # written to a temporary file first, so that an interrupted save does not leave a truncated cache
+
+    cache_dir = os.path.dirname(file_path)
+    if cache_dir and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    temp_path = file_path + ".tmp"
+    with io.open(temp_path, 'wb') as cache_file:
+        np.savez(cache_file, **arrays)
+    os.replace(temp_path, file_path)
+
+    return True
+
+
+def load_geoprofiles(file_path, fingerprint, dems, dem_parameters, layers=None):
+    """
+    Load a set of geoprofiles saved with save_geoprofiles.
+    The cache is considered stale, and not loaded, when its fingerprint
+    differs from the fingerprint of the current inputs.
+    Plane attitudes and outcrops are restored only when the fingerprints of their current inputs
+    match the stored ones, together with their plot colors (see GeoProfilesSet).
+
+    :param file_path: str
+    :param fingerprint: str, see geoprofiles_fingerprint
+    :param dems: list of qgis._core.QgsRasterLayer, the DEMs the profiles were created from
+    :param dem_parameters: list of QGisRasterParameters, one for each DEM
+    :param layers: dict of the current vector layers by id, None to restore no geological element
+    :return: GeoProfilesSet, or None when the cache is missing, unreadable, stale or with failed DEM reads
+    """
+
+    if file_path is None or not os.path.isfile(file_path):
+        return None
+
+    try:
+
+        with np.load(file_path, allow_pickle=False) as cache:
+
+            metadata = json.loads(str(cache["metadata"]))
+            if metadata.get("version") != PROFILES_CACHE_VERSION or metadata.get("fingerprint") != fingerprint:
+                return None
+
+            # profiles with failed DEM reads are never reused
+            for profile_metadata in metadata["profiles"]:
+                if any(error is not None for error in profile_metadata["surface_errors"]):
+                    return None
+
+            if layers is None:
+                layers = dict()
+
+            geoprofiles_set = GeoProfilesSet(metadata["name"])
+            plane_attitudes_colors = metadata.get("plane_attitudes_colors", [])
+
+            for profile_ndx, profile_metadata in enumerate(metadata["profiles"]):
+
+                prefix = "p{}_".format(profile_ndx)
+
+                topo_profiles = ProfileElevations()
+                topo_profiles.dem_params = [DEMParams(dem, params) for dem, params in zip(dems, dem_parameters)]
+
+                for name in ("planar_xs", "planar_ys", "lons", "lats", "times", "profile_s"):
+                    if prefix + name in cache:
+                        setattr(topo_profiles, name, cache[prefix + name])
+
+                topo_profiles.surface_names = profile_metadata["surface_names"]
+                topo_profiles.surface_errors = profile_metadata["surface_errors"]
+                topo_profiles.profile_zs = list(cache[prefix + "profile_zs"])
+                topo_profiles.profile_s3ds = list(cache[prefix + "profile_s3ds"])
+                topo_profiles.profile_dirslopes = list(cache[prefix + "profile_dirslopes"])
+                topo_profiles.inverted = profile_metadata["inverted"]
+
+                topo_profiles.swath_half_width = profile_metadata.get("swath_half_width")
+                for surface_ndx, percentiles in enumerate(profile_metadata.get("swath_percentiles", [])):
+                    swath_zs = cache[prefix + "swath_{}".format(surface_ndx)]
+                    topo_profiles.profile_swaths.append(
+                        SwathElevations(swath_zs[0], swath_zs[1], swath_zs[2], tuple(percentiles), list(swath_zs[3:])))
+                topo_profiles.profile_created = True
+
+                geoprofile = GeoProfile()
+                geoprofile.source_data_type = profile_metadata["source_data_type"]
+                geoprofile.sample_distance = profile_metadata["sample_distance"]
+                if prefix + "original_line" in cache:
+                    geoprofile.original_line = Line.from_array(cache[prefix + "original_line"])
+                geoprofile.set_topo_profiles(topo_profiles)
+
+                for attitudes_metadata in profile_metadata.get("plane_attitudes", []):
+                    geological_input = valid_geological_input(attitudes_metadata["input"], fingerprint, layers)
+                    if geological_input is None:
+                        continue
+                    geoprofile.add_plane_attitudes([
+                        PlaneAttitude(rec_id,
+                                      Point(*values[0:3]),
+                                      GPlane(values[3], values[4]),
+                                      Point(*values[5:8]),
+                                      values[8],
+                                      dwnwrd_sense,
+                                      values[9]) for rec_id, dwnwrd_sense, values in zip(
+                            attitudes_metadata["ids"],
+                            attitudes_metadata["dwnwrd_senses"],
+                            cache[prefix + "attitudes_{}".format(attitudes_metadata["set_ndx"])].tolist())],
+                        geological_input)
+                    if attitudes_metadata["set_ndx"] < len(plane_attitudes_colors):
+                        geoprofiles_set.plane_attitudes_colors.append(
+                            tuple(plane_attitudes_colors[attitudes_metadata["set_ndx"]]))
+
+                outcrops_metadata = profile_metadata.get("outcrops")
+                if outcrops_metadata is not None:
+                    geological_input = valid_geological_input(outcrops_metadata["input"], fingerprint, layers)
+                    if geological_input is not None:
+                        offsets = cache[prefix + "outcrops_offsets"]
+                        outcrops_pts = cache[prefix + "outcrops_pts"]
+                        outcrops_s = cache[prefix + "outcrops_s"]
+                        geoprofile.add_intersections_lines(
+                            outcrops_metadata["formations"],
+                            [Line.from_array(outcrops_pts[offsets[ndx]:offsets[ndx + 1]])
+                             for ndx in range(len(offsets) - 1)],
+                            [outcrops_s[offsets[ndx]:offsets[ndx + 1]].tolist() for ndx in range(len(offsets) - 1)],
+                            geological_input)
+                        polygon_classification_colors = metadata.get("polygon_classification_colors")
+                        if polygon_classification_colors is not None:
+                            geoprofiles_set.polygon_classification_colors = dict(
+                                (classification, tuple(color))
+                                for classification, color in polygon_classification_colors.items())
+
+                geoprofiles_set.append(geoprofile)
+
+    except (IOError, OSError, ValueError, KeyError):
+
+        return None
+
+    return geoprofiles_set
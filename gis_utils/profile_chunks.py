@@ -0,0 +1,121 @@
+
+from builtins import zip
+from builtins import range
+import tempfile
+
+import numpy as np
+
+from .features import Line
+from .geoprofiles import ProfileElevations
+
+
+# This module does not depend on QGIS:
+# DEM sampling is delegated to a function of plain coordinate arrays.
+
+
+def profile_array(size, use_memmap):
+    """
+    Allocate a float array for profile values,
+    optionally backed by an anonymous temporary file.
+
+    :param size: int
+    :param use_memmap: bool
+    :return: np.ndarray or np.memmap
+    """
+
+    if use_memmap:
+        # the memory map keeps its own handle of the temporary file,
+        # that is deleted when the map is released
+        with tempfile.TemporaryFile() as array_file:
+            return np.memmap(array_file, dtype=np.float64, mode='w+', shape=(max(size, 1),))
+    else:
+        return np.empty(size, dtype=np.float64)
+
+
+def chunked_profile_elevations(chunks, max_pts_num, surfaces_num, sample_points, use_memmap=False):
+    """
+    Create the topographic profiles of a line densified in consecutive chunks.
+    Distances and slopes are accumulated across chunks, so that results
+    are the same as for the whole line processed at once.
+    Results are written into preallocated (possibly memory-mapped) arrays.
+
+    :param chunks: iterable of Line instances, the consecutive chunks of the densified line
+    :param max_pts_num: int, upper limit of the number of points of the densified line
+    :param surfaces_num: int, number of sampled surfaces
+    :param sample_points: callable receiving point x and y arrays and returning two lists, in surface order:
+      elevation arrays and error messages (None for no error)
+    :param use_memmap: bool
+    :return: ProfileElevations instance, with no surface names and DEM parameters
+    """
+
+    planar_xs = profile_array(max_pts_num, use_memmap)
+    planar_ys = profile_array(max_pts_num, use_memmap)
+    profile_s = profile_array(max_pts_num, use_memmap)
+    profile_s3ds = [profile_array(max_pts_num, use_memmap) for _ in range(surfaces_num)]
+    profile_zs = [profile_array(max_pts_num, use_memmap) for _ in range(surfaces_num)]
+    profile_dirslopes = [profile_array(max_pts_num, use_memmap) for _ in range(surfaces_num)]
+
+    # state carried over from the previous chunk: the last point of the chunk
+    # and, for each surface, its elevation
+    pts_num = 0
+    last_xy = None
+    last_zs = [None for _ in range(surfaces_num)]
+    surfaces_errors = [None for _ in range(surfaces_num)]
+
+    for chunk in chunks:
+
+        chunk_start, chunk_end = pts_num, pts_num + chunk.num_pts
+        chunk_xs, chunk_ys = chunk.x_array(), chunk.y_array()
+
+        planar_xs[chunk_start:chunk_end] = chunk_xs
+        planar_ys[chunk_start:chunk_end] = chunk_ys
+
+        # segments from the last point of the previous chunk are included,
+        # so that values are continuous across chunks
+        if last_xy is None:
+            first_ndx = chunk_start
+            xs, ys = chunk_xs, chunk_ys
+            s_start = 0.0
+        else:
+            first_ndx = chunk_start - 1
+            xs, ys = np.concatenate(([last_xy[0]], chunk_xs)), np.concatenate(([last_xy[1]], chunk_ys))
+            s_start = profile_s[first_ndx]
+
+        profile_s[first_ndx:chunk_end] = s_start + Line.from_arrays(xs, ys).incremental_length_2d_array()
+
+        chunk_surfaces_zs, chunk_surfaces_errors = sample_points(chunk_xs, chunk_ys)
+
+        for surface_ndx, (chunk_zs, error) in enumerate(zip(chunk_surfaces_zs, chunk_surfaces_errors)):
+
+            if error is not None and surfaces_errors[surface_ndx] is None:
+                surfaces_errors[surface_ndx] = error
+
+            profile_zs[surface_ndx][chunk_start:chunk_end] = chunk_zs
+
+            if last_zs[surface_ndx] is None:
+                zs = chunk_zs
+                s3d_start = 0.0
+            else:
+                zs = np.concatenate(([last_zs[surface_ndx]], chunk_zs))
+                s3d_start = profile_s3ds[surface_ndx][first_ndx]
+
+            topoline3d = Line.from_arrays(xs, ys, zs)
+            profile_s3ds[surface_ndx][first_ndx:chunk_end] = s3d_start + topoline3d.incremental_length_3d_array()
+            profile_dirslopes[surface_ndx][first_ndx:chunk_end] = topoline3d.slopes_array()
+
+            last_zs[surface_ndx] = chunk_zs[-1]
+
+        last_xy = (chunk_xs[-1], chunk_ys[-1])
+        pts_num = chunk_end
+
+    topo_profiles = ProfileElevations()
+
+    topo_profiles.planar_xs = planar_xs[:pts_num]
+    topo_profiles.planar_ys = planar_ys[:pts_num]
+    topo_profiles.profile_s = profile_s[:pts_num]
+    topo_profiles.profile_s3ds = [s3ds[:pts_num] for s3ds in profile_s3ds]
+    topo_profiles.profile_zs = [zs[:pts_num] for zs in profile_zs]
+    topo_profiles.profile_dirslopes = [slopes[:pts_num] for slopes in profile_dirslopes]
+    topo_profiles.surface_errors = surfaces_errors
+
+    return topo_profiles
@@ -0,0 +1,131 @@
+
+from builtins import object
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+from .layer_signatures import crs_key, layer_source_signature
+
+
+# This module does not depend on QGIS:
+# lines are keyed by their vertices, DEMs and CRSs through their methods.
+
+
+PROFILE_MEMO_MAX_ENTRIES = 64
+
+
+class ProfileSamplesMemo(object):
+    """
+    Memo of the DEM elevations sampled along resampled profile lines,
+    keyed by fingerprints of the inputs, so that recomputed profiles
+    only sample the (line, DEM) pairs not already sampled.
+    Least recently used entries are discarded when the maximum number of entries is exceeded.
+    """
+
+    def __init__(self, max_entries=PROFILE_MEMO_MAX_ENTRIES):
+        """
+        :param max_entries: int, maximum number of stored (line, DEM) samples
+        """
+
+        self.max_entries = max_entries
+
+        self._resampled_lines = OrderedDict()
+        self._samples = OrderedDict()
+
+    @staticmethod
+    def line_key(line, sample_distance, invert_profile, on_the_fly_projection, project_crs, overview_sampling_ratio=0.0):
+        """
+        Fingerprint of a profile line and of its sampling settings.
+
+        :param line: Line, already in the profile direction
+        :param sample_distance: float
+        :param invert_profile: bool
+        :param on_the_fly_projection: bool
+        :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+        :param overview_sampling_ratio: float, see sample_dems
+        :return: tuple
+        """
+
+        line_hash = hashlib.sha1(np.ascontiguousarray(line.array[:, :2]).tobytes()).hexdigest()
+
+        return line_hash, float(sample_distance), bool(invert_profile), bool(on_the_fly_projection), \
+               crs_key(project_crs), float(overview_sampling_ratio)
+
+    @staticmethod
+    def dem_key(dem):
+        """
+        Fingerprint of a DEM: its id, data source, source modification time and CRS.
+
+        :param dem: qgis._core.QgsRasterLayer
+        :return: tuple
+        """
+
+        return dem.id(), layer_source_signature(dem), crs_key(dem.crs())
+
+    def resampled_line(self, line_key, line, sample_distance):
+        """
+        Return the line densified with the sample distance, reusing the stored one when available.
+
+        :param line_key: tuple, see line_key
+        :param line: Line
+        :param sample_distance: float
+        :return: Line
+        """
+
+        resampled_line = self._resampled_lines.get(line_key)
+        if resampled_line is None:
+            resampled_line = line.densify_2d_line(sample_distance)
+            self._resampled_lines[line_key] = resampled_line
+        else:
+            self._resampled_lines.move_to_end(line_key)
+
+        return resampled_line
+
+    def samples(self, line_key, dem_keys):
+        """
+        Return the stored elevations of the DEMs along a resampled line.
+
+        :param line_key: tuple, see line_key
+        :param dem_keys: list of tuples, see dem_key
+        :return: tuple of the list of elevation arrays (None when missing) and the list of the missing DEM indices
+        """
+
+        dems_zs = []
+        missing_ndxs = []
+        for dem_ndx, dem_key in enumerate(dem_keys):
+            zs = self._samples.get((line_key, dem_key))
+            if zs is None:
+                missing_ndxs.append(dem_ndx)
+            else:
+                self._samples.move_to_end((line_key, dem_key))
+            dems_zs.append(zs)
+
+        return dems_zs, missing_ndxs
+
+    def store_samples(self, line_key, dem_key, zs):
+        """
+        Store the elevations of a DEM along a resampled line.
+
+        :param line_key: tuple, see line_key
+        :param dem_key: tuple, see dem_key
+        :param zs: np.ndarray
+        """
+
+        self._samples[(line_key, dem_key)] = zs
+
+        while len(self._samples) > self.max_entries:
+            self._samples.popitem(last=False)
+
+        # resampled lines without samples are no longer needed
+        sampled_line_keys = set(key[0] for key in self._samples)
+        for key in [key for key in self._resampled_lines if key not in sampled_line_keys and key != line_key]:
+            del self._resampled_lines[key]
+
+    def clear(self):
+
+        self._resampled_lines.clear()
+        self._samples.clear()
+
+
+profile_samples_memo = ProfileSamplesMemo()
@@ -0,0 +1,305 @@
+
+from builtins import object
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from .dem_interpolation import GridInterpolator
+from .raster_backends import file_raster_backend
+
+
+# This module is imported by worker processes:
+# it must not depend on QGIS objects, only on plain arrays, raster paths and GDAL.
+
+
+WORKERS_PROBE_TIMEOUT = 60.0  # seconds allowed to a first worker process to start and import this module
+WORKERS_POLL_INTERVAL = 0.1  # seconds between the checks of cancellation while waiting for the workers
+
+_process_pool_usable = None  # whether worker processes can be used, once probed
+
+
+class RasterWindowInterpolator(GridInterpolator):
+    """
+    Interpolates raster values from a single read
+    of the window covering a set of points.
+    With a decimation factor, the window is read at a coarser resolution,
+    so that GDAL reads it from the matching overview level, when available.
+    """
+
+    def __init__(self, raster_path, params, xs, ys, margin=1, decimation=1):
+        """
+        :param raster_path: str
+        :param params: qProf.gis_utils.dem_interpolation.GridParameters
+        :param xs: np.ndarray of x values, in the raster CRS
+        :param ys: np.ndarray of y values, in the raster CRS
+        :param margin: int, number of cells added around the points window
+        :param decimation: int, the decimation factor of the sampled grid (1 for full resolution)
+        """
+
+        if decimation > 1:
+            super(RasterWindowInterpolator, self).__init__(params.decimated(decimation), params)
+        else:
+            super(RasterWindowInterpolator, self).__init__(params)
+
+        source_params = params
+        params = self.params  # the sampled grid, possibly decimated
+
+        self.array = None
+        self.col_offset = 0
+        self.top_row_offset = 0
+
+        valid = np.isfinite(xs) & np.isfinite(ys)
+        if not valid.any():
+            return
+
+        # window cell indices, with rows counted from the top of the raster
+        col_start = max(0, int(np.floor((np.min(xs[valid]) - params.xMin) / params.cellsizeEW)) - margin)
+        col_end = min(params.cols, int(np.floor((np.max(xs[valid]) - params.xMin) / params.cellsizeEW)) + 1 + margin)
+        top_row_start = max(0, int(np.floor((params.yMax - np.max(ys[valid])) / params.cellsizeNS)) - margin)
+        top_row_end = min(params.rows, int(np.floor((params.yMax - np.min(ys[valid])) / params.cellsizeNS)) + 1 + margin)
+
+        if col_end <= col_start or top_row_end <= top_row_start:
+            return
+
+        backend = file_raster_backend(raster_path, source_params)
+        try:
+            self.array = backend.read_window(col_start,
+                                             top_row_start,
+                                             col_end - col_start,
+                                             top_row_end - top_row_start,
+                                             decimation)
+        finally:
+            backend.close()
+
+        self.col_offset = col_start
+        self.top_row_offset = top_row_start
+
+    def cell_values(self, cols, rows):
+
+        values = np.full(cols.shape, np.nan)
+        if self.array is None:
+            return values
+
+        window_rows = self.params.rows - 1 - rows - self.top_row_offset
+        window_cols = cols - self.col_offset
+
+        inside = (0 <= window_cols) & (window_cols < self.array.shape[1]) & \
+                 (0 <= window_rows) & (window_rows < self.array.shape[0])
+
+        values[inside] = self.array[window_rows[inside], window_cols[inside]]
+
+        return values
+
+
+def sample_rasters(dem_tasks):
+    """
+    Interpolate the elevations of points from rasters.
+    A raster that fails does not stop the sampling of the others.
+
+    :param dem_tasks: list of (raster path, GridParameters, xs, ys, decimation factor) tuples,
+                      with xs and ys in the raster CRS
+    :return: tuple of two lists, in raster order: elevation arrays and error messages (None for no error)
+    """
+
+    dems_zs = []
+    dems_errors = []
+
+    for raster_path, params, xs, ys, decimation in dem_tasks:
+        try:
+            interpolator = RasterWindowInterpolator(raster_path, params, xs, ys, decimation=decimation)
+            dems_zs.append(interpolator.interpolate_z_array(xs, ys))
+            dems_errors.append(None)
+        except Exception as e:
+            dems_zs.append(np.full(np.shape(xs), np.nan))
+            dems_errors.append(str(e))
+
+    return dems_zs, dems_errors
+
+
+def profile_samples_worker(profile_ndx, dem_tasks):
+    """
+    Worker-process entry point: sample the rasters for a profile.
+
+    :param profile_ndx: int
+    :param dem_tasks: see sample_rasters
+    :return: tuple of profile index, elevation arrays and error messages
+    """
+
+    dems_zs, dems_errors = sample_rasters(dem_tasks)
+
+    return profile_ndx, dems_zs, dems_errors
+
+
+def python_executable():
+    """
+    Python interpreter to start the worker processes with.
+    When embedded (e.g. in the QGIS executable), sys.executable is not a Python interpreter.
+
+    :return: str, or None when not found
+    """
+
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+
+    for folder in (sys.exec_prefix, os.path.join(sys.exec_prefix, "bin")):
+        for name in ("pythonw.exe", "python.exe", "python3", "python"):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                return path
+
+    return None
+
+
+def process_pool_context():
+    """
+    Multiprocessing context for the worker processes,
+    using spawned processes so that no QGIS state is inherited.
+
+    :return: multiprocessing context, or None when no Python interpreter is available
+    """
+
+    executable = python_executable()
+    if executable is None:
+        return None
+
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(executable)
+
+    return context
+
+
+def worker_probe():
+    """
+    Worker-process entry point checking that a worker can start and import this module.
+
+    :return: int, the worker process id
+    """
+
+    return os.getpid()
+
+
+def profile_executor(max_workers=None):
+    """
+    Executor for the profile sampling tasks.
+    A pool of worker processes is used when a probe task runs successfully in it,
+    i.e. when the interpreter found by python_executable starts and imports this module:
+    the probe is run once per session. Otherwise a pool of threads is used,
+    the tasks opening their own raster datasets.
+
+    :param max_workers: int or None
+    :return: concurrent.futures.Executor
+    """
+
+    global _process_pool_usable
+
+    if _process_pool_usable is not False:
+
+        context = process_pool_context()
+
+        if context is not None:
+
+            executor = None
+            try:
+                executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+                if not _process_pool_usable:
+                    executor.submit(worker_probe).result(timeout=WORKERS_PROBE_TIMEOUT)
+                    _process_pool_usable = True
+                return executor
+            except Exception:
+                if executor is not None:
+                    executor.shutdown(wait=False)
+
+        _process_pool_usable = False
+
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+def run_profile_tasks(executor, profiles_tasks, add_profile, progress_callback=None, cancel_requested=None,
+                      poll_interval=WORKERS_POLL_INTERVAL):
+    """
+    Sample the rasters of several profiles on an executor.
+    A failed task (e.g. a crashed worker process) only fails the rasters of its profile:
+    their elevations are set to NaN with the task error message.
+    Cancellation is checked while waiting for the tasks: when requested,
+    the tasks not yet started are cancelled and the running ones are no longer waited for.
+    The executor is not shut down.
+
+    :param executor: concurrent.futures.Executor
+    :param profiles_tasks: list of (profile index, raster tasks) tuples, see sample_rasters for the raster tasks
+    :param add_profile: callable receiving the profile index, the elevation arrays and the error messages
+    :param progress_callback: callable receiving the number of sampled profiles and the total number,
+      called at every check of cancellation
+    :param cancel_requested: callable returning True when the processing has to be stopped
+    :param poll_interval: float, seconds between the checks of cancellation
+    :return: bool, False when cancelled
+    """
+
+    futures = dict((executor.submit(profile_samples_worker, profile_ndx, dem_tasks), (profile_ndx, dem_tasks))
+                   for profile_ndx, dem_tasks in profiles_tasks)
+
+    pending = set(futures)
+    while pending:
+
+        if cancel_requested is not None and cancel_requested():
+            for future in pending:
+                future.cancel()
+            return False
+
+        done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+
+        for future in done:
+
+            try:
+                profile_samples = future.result()
+            except Exception as e:
+                profile_ndx, dem_tasks = futures[future]
+                profile_samples = (profile_ndx,
+                                   [np.full(np.shape(xs), np.nan) for _, _, xs, _, _ in dem_tasks],
+                                   [str(e) or type(e).__name__ for _ in dem_tasks])
+
+            add_profile(*profile_samples)
+
+        # also called with no completed task, so that a progress dialog can process the cancel requests
+        if progress_callback is not None:
+            progress_callback(len(futures) - len(pending), len(futures))
+
+    return True
+
+
+def map_with_thread_copies(function, items, shared_data, copy_shared_data, max_threads):
+    """
+    Apply a function to items, with a shared argument, on a bounded thread pool.
+    Items are split among the threads, each one calling the function
+    with its own copy of the shared argument, made once per thread:
+    for objects that are not to be used by several threads at once (e.g. QGIS geometries).
+
+    :param function: callable receiving an item and the (copied) shared argument
+    :param items: list of items
+    :param shared_data: the shared argument
+    :param copy_shared_data: callable returning a copy of the shared argument
+    :param max_threads: int, maximum number of threads; with one thread or item, no copy is made
+    :return: list of the function results, in item order
+    """
+
+    threads_num = min(max_threads, len(items))
+    if threads_num <= 1:
+        return [function(item, shared_data) for item in items]
+
+    def process_items(item_ndxs):
+
+        thread_shared_data = copy_shared_data(shared_data)
+
+        return [function(items[item_ndx], thread_shared_data) for item_ndx in item_ndxs]
+
+    threads_item_ndxs = [list(range(thread_ndx, len(items), threads_num)) for thread_ndx in range(threads_num)]
+
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=threads_num) as executor:
+        for item_ndxs, thread_results in zip(threads_item_ndxs, executor.map(process_items, threads_item_ndxs)):
+            for item_ndx, result in zip(item_ndxs, thread_results):
+                results[item_ndx] = result
+
+    return results
@@ -1,5 +1,6 @@
 from typing import Optional, Tuple
 import numbers
+import os
 
 #from __future__ import division
 
@@ -18,22 +19,16 @@ from qgis.PyQt.QtCore import *
 from qgis.PyQt.QtGui import *
 from qgis.PyQt.QtWidgets import *
 
-from .errors import VectorIOException
+from .dem_interpolation import GridParameters
+from .errors import VectorIOException, RasterIOException
+from .layer_signatures import get_on_the_fly_projection, crs_key, layer_source_signature, \
+    vector_layer_edits_signature
+from .raster_backends import RasterBackend, RasterBlockSampler, file_raster_backend
+from .spatial_index import GridSpatialIndex, layer_index_cache
+from .tile_cache import dem_tile_cache
 from ..gsf.geometry import Point
 
 
-def get_on_the_fly_projection(canvas):
-
-    on_the_fly_projection = True
-
-    if on_the_fly_projection:
-        project_crs = canvas.mapSettings().destinationCrs()
-    else:
-        project_crs = None
-
-    return on_the_fly_projection, project_crs
-
-
 def vector_type(layer):
 
     if not layer.type() == QgsMapLayer.VectorLayer:
@@ -84,15 +79,103 @@ def loaded_monoband_raster_layers():
     return [layer for layer in loaded_raster_layers() if layer.bandCount() == 1]
 
 
-def pt_geoms_attrs(pt_layer, field_list=None):
+def layer_features(layer, fids=None, filter_rect=None, attributes=None, with_geometry=True):
+    """
+    Return the selected features of a layer, when there is a selection, otherwise all the features,
+    optionally restricted to a set of feature ids (e.g. the candidates from a spatial index)
+    and to the features intersecting a rectangle, pruned by the provider spatial index.
+    Only the requested attributes, and the geometries when required, are fetched.
+
+    :param layer: qgis._core.QgsVectorLayer
+    :param fids: iterable of feature ids, or None for no restriction
+    :param filter_rect: qgis._core.QgsRectangle in the layer CRS, or None for no spatial filter
+    :param attributes: list of field names or of field indices to fetch, or None for all the attributes
+    :param with_geometry: bool, whether the feature geometries are fetched
+    :return: iterable of qgis._core.QgsFeature
+    """
+
+    if fids is None and filter_rect is None and attributes is None and with_geometry:
+        if layer.selectedFeatureCount() > 0:
+            return layer.selectedFeatures()
+        else:
+            return layer.getFeatures()
+
+    request = QgsFeatureRequest()
+
+    if fids is not None:
+        fids = set(int(fid) for fid in fids)
+        if layer.selectedFeatureCount() > 0:
+            fids &= set(layer.selectedFeatureIds())
+        request.setFilterFids(sorted(fids))
+    elif layer.selectedFeatureCount() > 0:
+        request.setFilterFids(sorted(layer.selectedFeatureIds()))
+
+    if filter_rect is not None:
+        request.setFilterRect(filter_rect)
+
+    if attributes is not None:
+        if all(isinstance(attribute, str) for attribute in attributes):
+            request.setSubsetOfAttributes(list(attributes), layer.fields())
+        else:
+            request.setSubsetOfAttributes([int(attribute) for attribute in attributes])
+
+    # the spatial filter is applied on the geometries, that are then always fetched
+    if not with_geometry and filter_rect is None:
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+
+    return layer.getFeatures(request)
+
+
+def vector_layer_spatial_index(layer):
+    """
+    Return the spatial index of the feature bounding boxes of a vector layer,
+    built once for each layer version and kept in the process-wide index cache.
+    Layers with pending edits are cached too, keyed on their count of geometry edits.
+
+    :param layer: qgis._core.QgsVectorLayer
+    :return: qProf.gis_utils.spatial_index.GridSpatialIndex, in the layer CRS
+    """
+
+    def build_index():
+
+        bboxes = []
+        fids = []
+        for feature in layer.getFeatures(QgsFeatureRequest().setNoAttributes()):
+            geom = feature.geometry()
+            if geom is None or geom.isNull():
+                continue
+            bbox = geom.boundingBox()
+            bboxes.append((bbox.xMinimum(), bbox.yMinimum(), bbox.xMaximum(), bbox.yMaximum()))
+            fids.append(feature.id())
+
+        return GridSpatialIndex(np.array(bboxes, dtype=np.float64).reshape(-1, 4), np.array(fids, dtype=np.int64))
+
+    return layer_index_cache.index(layer.id(), vector_layer_edits_signature(layer), build_index)
+
+
+def prepared_geometry_engine(qgsgeometry):
+    """
+    Return a geometry engine for a geometry, prepared for repeated tests against other geometries.
+    The geometry must be kept alive while the engine is used.
+
+    :param qgsgeometry: qgis._core.QgsGeometry
+    :return: qgis._core.QgsGeometryEngine
+    """
+
+    engine = QgsGeometry.createGeometryEngine(qgsgeometry.constGet())
+    engine.prepareGeometry()
+
+    return engine
+
+
+def pt_geoms_attrs(pt_layer, field_list=None, filter_rect=None):
 
     if field_list is None:
         field_list = []
 
-    if pt_layer.selectedFeatureCount() > 0:
-        features = pt_layer.selectedFeatures()
-    else:
-        features = pt_layer.getFeatures()
+    features = layer_features(pt_layer,
+                              filter_rect=filter_rect,
+                              attributes=[field_name for field_name in field_list if field_name])
 
     provider = pt_layer.dataProvider()
     field_indices = [provider.fieldNameIndex(field_name) for field_name in field_list if field_name]
@@ -117,17 +200,14 @@ def pt_geoms_attrs(pt_layer, field_list=None):
     return rec_list
 
 
-def line_geoms_attrs(line_layer, field_list=None):
+def line_geoms_attrs(line_layer, field_list=None, fids=None, filter_rect=None):
 
     if field_list is None:
         field_list = []
 
     lines = []
 
-    if line_layer.selectedFeatureCount() > 0:
-        features = line_layer.selectedFeatures()
-    else:
-        features = line_layer.getFeatures()
+    features = layer_features(line_layer, fids, filter_rect, attributes=list(field_list))
 
     provider = line_layer.dataProvider()
     field_indices = [provider.fieldNameIndex(field_name) for field_name in field_list]
@@ -196,27 +276,19 @@ def multipolyline_to_xytuple_list2(qgspolyline):
     return [polyline_to_xytuple_list(qgsline) for qgsline in qgspolyline]
 
 
-def field_values(layer, curr_field_ndx):
+def field_values(layer, curr_field_ndx, fids=None, filter_rect=None):
 
     values = []
 
-    if layer.selectedFeatureCount() > 0:
-        features = layer.selectedFeatures()
-    else:
-        features = layer.getFeatures()
-
-    for feature in features:
+    for feature in layer_features(layer, fids, filter_rect, attributes=[curr_field_ndx], with_geometry=False):
         values.append(feature.attributes()[curr_field_ndx])
 
     return values
 
 
-def vect_attrs(layer, field_list):
+def vect_attrs(layer, field_list, filter_rect=None):
 
-    if layer.selectedFeatureCount() > 0:
-        features = layer.selectedFeatures()
-    else:
-        features = layer.getFeatures()
+    features = layer_features(layer, filter_rect=filter_rect, attributes=list(field_list), with_geometry=False)
 
     provider = layer.dataProvider()
     field_indices = [provider.fieldNameIndex(field_name) for field_name in field_list]
@@ -266,9 +338,64 @@ def qgs_pt(x, y):
     return QgsPointXY(x, y)
 
 
+_coordinate_transforms = {}
+
+
+def coordinate_transform(srcCrs, destCrs):
+    """
+    Return the coordinate transform between two CRSs,
+    reusing the transform already created for the same CRS pair.
+
+    :param srcCrs: qgis._core.QgsCoordinateReferenceSystem
+    :param destCrs: qgis._core.QgsCoordinateReferenceSystem
+    :return: qgis._core.QgsCoordinateTransform
+    """
+
+    key = (crs_key(srcCrs), crs_key(destCrs))
+
+    transform = _coordinate_transforms.get(key)
+    if transform is None:
+        transform = QgsCoordinateTransform(srcCrs, destCrs, QgsProject.instance())
+        _coordinate_transforms[key] = transform
+
+    return transform
+
+
+def clear_coordinate_transforms():
+    """
+    Discard the stored coordinate transforms,
+    e.g. when the project transform context changes.
+    """
+
+    _coordinate_transforms.clear()
+
+
 def project_qgs_point(qgsPt, srcCrs, destCrs):
 
-    return QgsCoordinateTransform(srcCrs, destCrs, QgsProject.instance()).transform(qgsPt)
+    return coordinate_transform(srcCrs, destCrs).transform(qgsPt)
+
+
+def project_xy_arrays(xs, ys, srcCrs, destCrs):
+    """
+    Project arrays of x and y coordinates with a single transform call.
+
+    :param xs: array-like of x values
+    :param ys: array-like of y values
+    :param srcCrs: qgis._core.QgsCoordinateReferenceSystem
+    :param destCrs: qgis._core.QgsCoordinateReferenceSystem
+    :return: tuple of two np.ndarray: projected x and y values
+    """
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+
+    if xs.size == 0:
+        return xs.copy(), ys.copy()
+
+    line = QgsLineString(xs.tolist(), ys.tolist())
+    line.transform(coordinate_transform(srcCrs, destCrs))
+
+    return np.array(line.xVector(), dtype=np.float64), np.array(line.yVector(), dtype=np.float64)
 
 
 def project_point(pt, srcCrs, destCrs):
@@ -282,13 +409,13 @@ def project_point(pt, srcCrs, destCrs):
 
 def project_xy_list(src_crs_xy_list, srcCrs, destCrs):
 
-    pt_list_dest_crs = []
-    for x, y in src_crs_xy_list.pts:
-        srcPt = QgsPointXY(x, y)
-        destPt = project_qgs_point(srcPt, srcCrs, destCrs)
-        pt_list_dest_crs = pt_list_dest_crs.append([destPt.x(), destPt.y()])
+    if not src_crs_xy_list:
+        return []
+
+    xs, ys = zip(*src_crs_xy_list)
+    dest_xs, dest_ys = project_xy_arrays(xs, ys, srcCrs, destCrs)
 
-    return pt_list_dest_crs
+    return [[x, y] for x, y in zip(dest_xs, dest_ys)]
 
 
 def qcolor2rgbmpl(qcolor):
@@ -390,20 +517,12 @@ class MapDigitizeTool(QgsMapTool):
         self.cursor = QCursor(cursor)
 
 
-class QGisRasterParameters(object):
+class QGisRasterParameters(GridParameters):
 
     def __init__(self, name, cellsizeEW, cellsizeNS, rows, cols, xMin, xMax, yMin, yMax, nodatavalue, crs):
 
-        self.name = name
-        self.cellsizeEW = cellsizeEW
-        self.cellsizeNS = cellsizeNS
-        self.rows = rows
-        self.cols = cols
-        self.xMin = xMin
-        self.xMax = xMax
-        self.yMin = yMin
-        self.yMax = yMax
-        self.nodatavalue = nodatavalue
+        super(QGisRasterParameters, self).__init__(name, cellsizeEW, cellsizeNS, rows, cols, xMin, xMax, yMin, yMax,
+                                                   nodatavalue)
         self.crs = crs
 
     def point_in_dem_area(self, point):
@@ -469,59 +588,258 @@ class QGisRasterParameters(object):
         return Point(x, y)
 
 
-def get_z(dem_layer, point):
+qgis_numpy_dtypes = {
+    Qgis.Byte: np.uint8,
+    Qgis.UInt16: np.uint16,
+    Qgis.Int16: np.int16,
+    Qgis.UInt32: np.uint32,
+    Qgis.Int32: np.int32,
+    Qgis.Float32: np.float32,
+    Qgis.Float64: np.float64}
+
+
+def raster_block_to_array(block):
+    """
+    Convert a raster block into a float array,
+    with no-data cells set to NaN.
+    Array row 0 is the top (northern) row of the block.
+
+    :param block: qgis._core.QgsRasterBlock
+    :return: 2D np.ndarray
+    """
 
-    identification = dem_layer.dataProvider().identify(QgsPointXY(point.x, point.y), QgsRaster.IdentifyFormatValue)
-    if not identification.isValid():
-        return np.nan
+    rows, cols = block.height(), block.width()
+
+    dtype = qgis_numpy_dtypes.get(block.dataType())
+    if dtype is not None:
+        array = np.frombuffer(bytes(block.data()), dtype=dtype).reshape(rows, cols).astype(np.float64)
     else:
+        array = np.array([[block.value(i, j) for j in range(cols)] for i in range(rows)], dtype=np.float64)
+
+    if block.hasNoDataValue():
+        array[array == block.noDataValue()] = np.nan
+
+    return array
+
+
+def read_dem_block(dem_layer, window_params, provider=None):
+    """
+    Read the DEM cells of the provided window with a single provider request.
+    Cells with the DEM no-data value are set to NaN.
+
+    :param dem_layer: qgis._core.QgsRasterLayer
+    :param window_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :param provider: qgis._core.QgsRasterDataProvider, to use instead of the layer one (e.g. a clone for another thread)
+    :return: 2D np.ndarray
+    """
+
+    if provider is None:
+        provider = dem_layer.dataProvider()
+
+    extent = QgsRectangle(window_params.xMin,
+                          window_params.yMin,
+                          window_params.xMax,
+                          window_params.yMax)
+
+    block = provider.block(1,
+                           extent,
+                           window_params.cols,
+                           window_params.rows)
+
+    array = raster_block_to_array(block)
+    array[array == window_params.nodatavalue] = np.nan
+
+    return array
+
+
+class QGisProviderBackend(RasterBackend):
+    """
+    Raster backend reading windows through the QGIS data provider of a layer,
+    for layers that are not plain raster files (e.g. WMS or virtual rasters).
+    Decimated windows are requested at a coarser resolution,
+    so that the data provider reads them from the matching overview level, when available.
+    """
+
+    def __init__(self, dem_layer, dem_params, provider=None):
+        """
+        :param dem_layer: qgis._core.QgsRasterLayer
+        :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+        :param provider: qgis._core.QgsRasterDataProvider, to use instead of the layer one (e.g. a clone for another thread)
+        """
+
+        super(QGisProviderBackend, self).__init__(dem_params)
+
+        self.layer = dem_layer
+        self.provider = provider
+
+        # the layer data provider belongs to the main thread, a clone can be used by another thread
+        self.thread_safe = provider is not None
+
+    def read_window(self, col_start, top_row_start, cols, rows, decimation=1):
+
+        cellsizeEW = self.params.cellsizeEW * decimation
+        cellsizeNS = self.params.cellsizeNS * decimation
+
+        window_params = QGisRasterParameters(
+            self.params.name,
+            cellsizeEW,
+            cellsizeNS,
+            rows,
+            cols,
+            self.params.xMin + col_start * cellsizeEW,
+            self.params.xMin + (col_start + cols) * cellsizeEW,
+            self.params.yMax - (top_row_start + rows) * cellsizeNS,
+            self.params.yMax - top_row_start * cellsizeNS,
+            self.params.nodatavalue,
+            self.params.crs)
+
+        return read_dem_block(self.layer, window_params, self.provider)
+
+    def close(self):
+
+        self.provider = None
+
+
+def dem_raster_backend(dem_layer, dem_params, provider=None):
+    """
+    Raster backend of a DEM layer.
+    Layers with a raster file source are read directly with GDAL (memory-mapped when uncompressed),
+    other layers, or when GDAL cannot read the file, through the QGIS data provider.
+
+    :param dem_layer: qgis._core.QgsRasterLayer
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :param provider: qgis._core.QgsRasterDataProvider, used by the QGIS provider backend
+    :return: qProf.gis_utils.raster_backends.RasterBackend
+    """
+
+    source = dem_layer.source()
+
+    if dem_layer.providerType() == "gdal" and os.path.isfile(source):
         try:
-            result_map = identification.results()
-            return float(result_map[1])
-        except:
-            return np.nan
+            return file_raster_backend(source, dem_params)
+        except (ImportError, RasterIOException, EnvironmentError, ValueError):
+            pass
 
+    return QGisProviderBackend(dem_layer, dem_params, provider)
 
-def interpolate_bilinear(dem, qrpDemParams, point):
-    """        
-    :param dem: qgis._core.QgsRasterLayer
-    :param qrpDemParams: qProf.gis_utils.qgs_tools.QGisRasterParameters
-    :param point: qProf.gis_utils.features.Point
-    :return: float
+
+class DEMBlockSampler(RasterBlockSampler):
+    """
+    Samples DEM values from blocks of cells read from the DEM raster backend
+    (see dem_raster_backend), instead of querying the provider for each point.
+    Blocks are cached by layer id in the process-wide tile cache.
+    """
+
+    def __init__(self, dem_layer, dem_params, tile_cache=dem_tile_cache, provider=None, decimation=1, backend=None):
+        """
+        :param dem_layer: qgis._core.QgsRasterLayer
+        :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+        :param tile_cache: qProf.gis_utils.tile_cache.DEMTileCache
+        :param provider: qgis._core.QgsRasterDataProvider, to use instead of the layer one
+        :param decimation: int, the decimation factor of the sampled grid (1 for full resolution)
+        :param backend: qProf.gis_utils.raster_backends.RasterBackend, to share the backend of another sampler
+        """
+
+        if backend is None:
+            backend = dem_raster_backend(dem_layer, dem_params, provider)
+
+        super(DEMBlockSampler, self).__init__(backend,
+                                              dem_params,
+                                              dem_layer.id(),
+                                              layer_source_signature(dem_layer),
+                                              tile_cache,
+                                              decimation)
+
+        self.layer = dem_layer
+        self.provider = provider
+
+
+_dem_samplers = {}
+
+
+def dem_params_key(dem_params):
+
+    return (dem_params.cellsizeEW, dem_params.cellsizeNS, dem_params.rows, dem_params.cols,
+            dem_params.xMin, dem_params.yMax, dem_params.nodatavalue)
+
+
+def dem_sampler(dem_layer, dem_params=None, decimation=1):
+    """
+    Return a block sampler of a DEM layer, reusing the one already created
+    for the same layer source, parameters and decimation, so that repeated queries
+    do not open the raster again. Samplers of the same layer with different
+    decimation factors share the raster backend.
+    The returned sampler must be used by the calling (main) thread only,
+    unless its backend is thread safe (see RasterBackend.thread_safe).
+
+    :param dem_layer: qgis._core.QgsRasterLayer
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters, or None for the layer parameters
+    :param decimation: int, the decimation factor of the sampled grid (1 for full resolution)
+    :return: DEMBlockSampler
     """
 
-    dArrayCoords = qrpDemParams.geogr2raster(point)
+    signature = layer_source_signature(dem_layer)
+    if dem_params is None:
+        params_key = None
+    else:
+        params_key = dem_params_key(dem_params)
 
-    floor_x_raster = floor(dArrayCoords["x"])
-    ceil_x_raster = ceil(dArrayCoords["x"])
-    floor_y_raster = floor(dArrayCoords["y"])
-    ceil_y_raster = ceil(dArrayCoords["y"])
+    cached = _dem_samplers.get(dem_layer.id())
+    if cached is not None:
+        cached_signature, cached_params_key, samplers = cached
+        if cached_signature == signature and params_key in (None, cached_params_key):
+            sampler = samplers.get(decimation)
+            if sampler is None:
+                some_sampler = next(iter(samplers.values()))
+                sampler = DEMBlockSampler(dem_layer, some_sampler.params, decimation=decimation,
+                                          backend=some_sampler.backend)
+                samplers[decimation] = sampler
+            return sampler
+        next(iter(samplers.values())).backend.close()
 
-    # bottom-left center
-    p1 = qrpDemParams.raster2geogr(dict(x=floor_x_raster,
-                                        y=floor_y_raster))
-    # bottom-right center
-    p2 = qrpDemParams.raster2geogr(dict(x=ceil_x_raster,
-                                        y=floor_y_raster))
-    # top-left center
-    p3 = qrpDemParams.raster2geogr(dict(x=floor_x_raster,
-                                        y=ceil_y_raster))
-    # top-right center
-    p4 = qrpDemParams.raster2geogr(dict(x=ceil_x_raster,
-                                        y=ceil_y_raster))
+    if dem_params is None:
+        dem_params = QGisRasterParameters(*raster_qgis_params(dem_layer))
+        params_key = dem_params_key(dem_params)
 
-    z1 = get_z(dem, p1)
-    z2 = get_z(dem, p2)
-    z3 = get_z(dem, p3)
-    z4 = get_z(dem, p4)
+    sampler = DEMBlockSampler(dem_layer, dem_params, decimation=decimation)
+    _dem_samplers[dem_layer.id()] = (signature, params_key, {decimation: sampler})
 
-    delta_x = point.x - p1.x
-    delta_y = point.y - p1.y
+    return sampler
 
-    z_x_a = z1 + (z2 - z1) * delta_x / qrpDemParams.cellsizeEW
-    z_x_b = z3 + (z4 - z3) * delta_x / qrpDemParams.cellsizeEW
 
-    return z_x_a + (z_x_b - z_x_a) * delta_y / qrpDemParams.cellsizeNS
+def clear_dem_samplers(layer_id=None):
+    """
+    Discard the stored DEM samplers, or the samplers of a layer,
+    e.g. when the layer is removed from the project.
+
+    :param layer_id: str, or None for all the layers
+    """
+
+    if layer_id is None:
+        layer_ids = list(_dem_samplers.keys())
+    else:
+        layer_ids = [layer_id]
+
+    for cached_layer_id in layer_ids:
+        cached = _dem_samplers.pop(cached_layer_id, None)
+        if cached is not None:
+            next(iter(cached[2].values())).backend.close()
+
+
+def get_z(dem_layer, point):
+
+    return dem_sampler(dem_layer).get_z_array(np.array([point.x]), np.array([point.y]))[0]
+
+
+def interpolate_bilinear(dem, qrpDemParams, point):
+    """        
+    :param dem: qgis._core.QgsRasterLayer
+    :param qrpDemParams: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :param point: qProf.gis_utils.features.Point
+    :return: float
+    """
+
+    return dem_sampler(dem, qrpDemParams).interpolate_bilinear_array(np.array([point.x]), np.array([point.y]))[0]
 
 
 def interpolate_z(dem, dem_params, point):
@@ -530,22 +848,32 @@ def interpolate_z(dem, dem_params, point):
         point: type qProf.gis_utils.features.Point
     """
 
-    if dem_params.point_in_interpolation_area(point):
-        return interpolate_bilinear(dem, dem_params, point)
-    elif dem_params.point_in_dem_area(point):
-        return get_z(dem, point)
-    else:
-        return np.nan
+    return interpolate_z_array(dem, dem_params, [point.x], [point.y])[0]
 
 
-def get_zs_from_dem(struct_pts_2d, demObj):
+def interpolate_z_array(dem, dem_params, xs, ys):
+    """
+    Array version of interpolate_z.
+
+    :param dem: qgis._core.QgsRasterLayer
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :param xs: array-like of x values, in the DEM CRS
+    :param ys: array-like of y values, in the DEM CRS
+    :return: np.ndarray of float
+    """
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+
+    return dem_sampler(dem, dem_params).interpolate_z_array(xs, ys)
 
-    z_list = []
-    for point_2d in struct_pts_2d:
-        interp_z = interpolate_z(demObj.layer, demObj.params, point_2d)
-        z_list.append(interp_z)
 
-    return z_list
+def get_zs_from_dem(struct_pts_2d, demObj):
+
+    return interpolate_z_array(demObj.layer,
+                               demObj.params,
+                               [point_2d.x for point_2d in struct_pts_2d],
+                               [point_2d.y for point_2d in struct_pts_2d])
 
 
 def xy_from_canvas(canvas, position):
@@ -0,0 +1,523 @@
+
+from builtins import object
+import os
+
+import numpy as np
+
+from .dem_interpolation import GridInterpolator
+from .errors import RasterIOException
+from .tile_cache import dem_tile_cache
+
+
+# This module does not depend on QGIS:
+# rasters are read directly from their files with GDAL or through memory maps.
+
+
+gdal_numpy_dtypes = {
+    1: np.uint8,  # GDT_Byte
+    2: np.uint16,  # GDT_UInt16
+    3: np.int16,  # GDT_Int16
+    4: np.uint32,  # GDT_UInt32
+    5: np.int32,  # GDT_Int32
+    6: np.float32,  # GDT_Float32
+    7: np.float64}  # GDT_Float64
+
+
+def aggregate_cells(array, decimation):
+    """
+    Average the cells of an array in blocks of decimation x decimation cells,
+    ignoring NaN cells. Partial blocks along the bottom and right borders are averaged too.
+
+    :param array: 2D np.ndarray of float
+    :param decimation: int
+    :return: 2D np.ndarray of float
+    """
+
+    rows = -(-array.shape[0] // decimation)
+    cols = -(-array.shape[1] // decimation)
+
+    padded = np.full((rows * decimation, cols * decimation), np.nan)
+    padded[:array.shape[0], :array.shape[1]] = array
+
+    blocks = padded.reshape(rows, decimation, cols, decimation)
+    valid_nums = np.sum(np.isfinite(blocks), axis=(1, 3))
+    sums = np.nansum(blocks, axis=(1, 3))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid_nums > 0, sums / valid_nums, np.nan)
+
+
+class RasterBackend(object):
+    """
+    Read access to the cells of a single-band raster.
+    Windows are defined in cells of the raster decimated by a factor,
+    with rows counted from the top of the raster.
+    A backend is never used by several threads at once: thread_safe tells whether
+    it can be used by a thread other than the one that created it.
+    """
+
+    thread_safe = True
+
+    def __init__(self, params):
+        """
+        :param params: qProf.gis_utils.dem_interpolation.GridParameters, of the full-resolution raster
+        """
+
+        self.params = params
+
+    def read_window(self, col_start, top_row_start, cols, rows, decimation=1):
+        """
+        Read a window of cells, with no-data cells set to NaN.
+        Cells outside the raster are NaN.
+
+        :param col_start: int, in decimated cells
+        :param top_row_start: int, in decimated cells, counted from the top of the raster
+        :param cols: int, number of decimated cells
+        :param rows: int, number of decimated cells
+        :param decimation: int, the decimation factor (1 for full resolution)
+        :return: (rows, cols) np.ndarray of float, with array row 0 at the top of the window
+        """
+
+        raise NotImplementedError
+
+    def source_window(self, col_start, top_row_start, cols, rows, decimation):
+        """
+        Full-resolution window covered by a decimated window, clipped to the raster.
+
+        :return: tuple of col start, col end, top row start and top row end, in full-resolution cells
+        """
+
+        source_col_start = max(0, col_start * decimation)
+        source_col_end = min(self.params.cols, (col_start + cols) * decimation)
+        source_top_row_start = max(0, top_row_start * decimation)
+        source_top_row_end = min(self.params.rows, (top_row_start + rows) * decimation)
+
+        return source_col_start, source_col_end, source_top_row_start, source_top_row_end
+
+    def mask_nodata(self, array, band_nodata=None):
+        """
+        Set the no-data cells of an array to NaN.
+
+        :param array: np.ndarray of float
+        :param band_nodata: the band no-data value, if any
+        :return: np.ndarray of float
+        """
+
+        if band_nodata is not None:
+            array[array == band_nodata] = np.nan
+        if self.params.nodatavalue is not None:
+            array[array == self.params.nodatavalue] = np.nan
+
+        return array
+
+    def close(self):
+
+        pass
+
+
+class GDALRasterBackend(RasterBackend):
+    """
+    Raster backend reading windows from a raster file with GDAL.
+    Decimated windows are read into smaller buffers, so that GDAL uses the matching overview level.
+    A backend instance must not be used concurrently by several threads,
+    but it can be used by a thread other than the creating one.
+    """
+
+    def __init__(self, raster_path, params):
+        """
+        :param raster_path: str
+        :param params: qProf.gis_utils.dem_interpolation.GridParameters
+        """
+
+        from osgeo import gdal
+
+        super(GDALRasterBackend, self).__init__(params)
+
+        self.dataset = gdal.Open(raster_path, gdal.GA_ReadOnly)
+        if self.dataset is None:
+            raise RasterIOException("Unable to open raster {}".format(raster_path))
+
+        self.band = self.dataset.GetRasterBand(1)
+        self.band_nodata = self.band.GetNoDataValue()
+
+    def read_window(self, col_start, top_row_start, cols, rows, decimation=1):
+
+        window = np.full((rows, cols), np.nan)
+
+        source_col_start, source_col_end, source_top_row_start, source_top_row_end = \
+            self.source_window(col_start, top_row_start, cols, rows, decimation)
+
+        if source_col_end <= source_col_start or source_top_row_end <= source_top_row_start:
+            return window
+
+        buffer_cols = -(-(source_col_end - source_col_start) // decimation)
+        buffer_rows = -(-(source_top_row_end - source_top_row_start) // decimation)
+
+        array = self.band.ReadAsArray(source_col_start,
+                                      source_top_row_start,
+                                      source_col_end - source_col_start,
+                                      source_top_row_end - source_top_row_start,
+                                      buf_xsize=buffer_cols,
+                                      buf_ysize=buffer_rows)
+        if array is None:
+            raise RasterIOException("Unable to read raster window")
+
+        window_col = source_col_start // decimation - col_start
+        window_row = source_top_row_start // decimation - top_row_start
+        window[window_row:window_row + buffer_rows, window_col:window_col + buffer_cols] = \
+            self.mask_nodata(array.astype(np.float64), self.band_nodata)
+
+        return window
+
+    def close(self):
+
+        self.band = None
+        self.dataset = None
+
+
+class MemmapRasterBackend(RasterBackend):
+    """
+    Raster backend reading the cells of an uncompressed single-band raster
+    through a read-only memory map of its data file, without going through GDAL:
+    only the pages of the requested windows are read, by the operating system.
+    Decimated windows are delegated to an optional overview backend (e.g. GDALRasterBackend),
+    otherwise they are averaged from the full-resolution cells.
+    """
+
+    def __init__(self, data_path, params, offset, dtype, band_nodata=None, overview_backend=None):
+        """
+        :param data_path: str, the file storing the raster cells
+        :param params: qProf.gis_utils.dem_interpolation.GridParameters
+        :param offset: int, byte offset of the first cell in the data file
+        :param dtype: np.dtype, with the byte order of the data file
+        :param band_nodata: the band no-data value, if any
+        :param overview_backend: RasterBackend or None, used for decimated windows
+        """
+
+        super(MemmapRasterBackend, self).__init__(params)
+
+        self.array = np.memmap(data_path, dtype=dtype, mode='r', offset=offset, shape=(params.rows, params.cols))
+        self.band_nodata = band_nodata
+        self.overview_backend = overview_backend
+
+    def read_window(self, col_start, top_row_start, cols, rows, decimation=1):
+
+        if decimation > 1 and self.overview_backend is not None:
+            return self.overview_backend.read_window(col_start, top_row_start, cols, rows, decimation)
+
+        window = np.full((rows, cols), np.nan)
+
+        source_col_start, source_col_end, source_top_row_start, source_top_row_end = \
+            self.source_window(col_start, top_row_start, cols, rows, decimation)
+
+        if source_col_end <= source_col_start or source_top_row_end <= source_top_row_start:
+            return window
+
+        array = self.mask_nodata(
+            np.array(self.array[source_top_row_start:source_top_row_end, source_col_start:source_col_end],
+                     dtype=np.float64),
+            self.band_nodata)
+
+        if decimation > 1:
+            array = aggregate_cells(array, decimation)
+
+        window_col = source_col_start // decimation - col_start
+        window_row = source_top_row_start // decimation - top_row_start
+        window[window_row:window_row + array.shape[0], window_col:window_col + array.shape[1]] = array
+
+        return window
+
+    def close(self):
+
+        if self.overview_backend is not None:
+            self.overview_backend.close()
+
+        self.array = None
+
+
+def ehdr_header(header_path):
+    """
+    Read the keys of an ESRI .hdr header file.
+
+    :param header_path: str
+    :return: dict, with upper-case keys and string values
+    """
+
+    header = dict()
+    with open(header_path) as header_file:
+        for line in header_file:
+            tokens = line.split()
+            if len(tokens) >= 2:
+                header[tokens[0].upper()] = tokens[1]
+
+    return header
+
+
+def raw_raster_layout(dataset):
+    """
+    Layout of the cells of an uncompressed single-band raster, stored row by row in a single block of bytes.
+    Recognized formats are flat (stripped, uncompressed) GeoTIFF, ENVI and ESRI BIL (EHdr).
+
+    :param dataset: osgeo.gdal.Dataset
+    :return: tuple of data file path, byte offset and np.dtype, or None when not memory-mappable
+    """
+
+    if dataset.RasterCount != 1:
+        return None
+
+    band = dataset.GetRasterBand(1)
+    dtype = gdal_numpy_dtypes.get(band.DataType)
+    if dtype is None:
+        return None
+
+    rows, cols = dataset.RasterYSize, dataset.RasterXSize
+    row_bytes = cols * np.dtype(dtype).itemsize
+    driver_name = dataset.GetDriver().ShortName
+    file_list = dataset.GetFileList() or []
+
+    if driver_name == "GTiff":
+
+        compression = dataset.GetMetadataItem("COMPRESSION", "IMAGE_STRUCTURE")
+        if compression not in (None, "NONE"):
+            return None
+
+        block_cols, block_rows = band.GetBlockSize()
+        if block_cols != cols:
+            return None  # tiled
+
+        data_path = dataset.GetDescription()
+        blocks_num = -(-rows // block_rows)
+
+        offsets = []
+        for block_ndx in sorted(set([0, 1, blocks_num - 1])):
+            if block_ndx >= blocks_num:
+                continue
+            offset = band.GetMetadataItem("BLOCK_OFFSET_0_{}".format(block_ndx), "TIFF")
+            if offset is None:
+                return None
+            offsets.append((block_ndx, int(offset)))
+
+        first_offset = offsets[0][1]
+        if any(offset != first_offset + block_ndx * block_rows * row_bytes for block_ndx, offset in offsets):
+            return None  # strips not contiguous
+
+        with open(data_path, 'rb') as tiff_file:
+            byte_order = tiff_file.read(2)
+        big_endian = byte_order == b"MM"
+
+    elif driver_name == "ENVI":
+
+        envi_header = dataset.GetMetadata("ENVI") or {}
+        if not file_list:
+            return None
+
+        data_path = file_list[0]
+        first_offset = int(envi_header.get("header_offset", 0))
+        big_endian = str(envi_header.get("byte_order", "0")).strip() == "1"
+
+    elif driver_name == "EHdr":
+
+        header_paths = [path for path in file_list if path.lower().endswith(".hdr")]
+        if not file_list or not header_paths:
+            return None
+
+        data_path = file_list[0]
+        header = ehdr_header(header_paths[0])
+        if int(header.get("TOTALROWBYTES", row_bytes)) != row_bytes:
+            return None
+
+        first_offset = int(header.get("SKIPBYTES", 0))
+        big_endian = header.get("BYTEORDER", "I").upper().startswith("M")
+
+    else:
+
+        return None
+
+    if not os.path.isfile(data_path) or os.path.getsize(data_path) < first_offset + rows * row_bytes:
+        return None
+
+    return data_path, first_offset, np.dtype(dtype).newbyteorder('>' if big_endian else '<')
+
+
+def file_raster_backend(raster_path, params, use_memmap=True):
+    """
+    Backend for a raster file: memory-mapped when the raster is uncompressed
+    (with GDAL reads for the overview levels), read with GDAL otherwise.
+
+    :param raster_path: str
+    :param params: qProf.gis_utils.dem_interpolation.GridParameters
+    :param use_memmap: bool
+    :return: RasterBackend
+    """
+
+    gdal_backend = GDALRasterBackend(raster_path, params)
+
+    if use_memmap:
+        layout = raw_raster_layout(gdal_backend.dataset)
+        if layout is not None:
+            data_path, offset, dtype = layout
+            return MemmapRasterBackend(data_path,
+                                       params,
+                                       offset,
+                                       dtype,
+                                       band_nodata=gdal_backend.band_nodata,
+                                       overview_backend=gdal_backend)
+
+    return gdal_backend
+
+
+class RasterBlockSampler(GridInterpolator):
+    """
+    Samples raster values from blocks of cells read from a raster backend,
+    instead of querying the raster for each point.
+    Blocks are fixed-size tiles, read through the process-wide tile cache,
+    so that areas already read by other operations are not read again.
+    With a decimation factor, blocks are read at a coarser resolution (e.g. from overviews).
+    """
+
+    def __init__(self, backend, params, cache_id, cache_signature, tile_cache=dem_tile_cache, decimation=1):
+        """
+        :param backend: RasterBackend
+        :param params: qProf.gis_utils.dem_interpolation.GridParameters, of the full-resolution raster
+        :param cache_id: the raster id in the tile cache
+        :param cache_signature: hashable value changing when the raster data source changes
+        :param tile_cache: qProf.gis_utils.tile_cache.DEMTileCache
+        :param decimation: int, the decimation factor of the sampled grid (1 for full resolution)
+        """
+
+        if decimation > 1:
+            super(RasterBlockSampler, self).__init__(params.decimated(decimation), params)
+        else:
+            super(RasterBlockSampler, self).__init__(params)
+
+        self.backend = backend
+        self.tile_cache = tile_cache
+        self.decimation = decimation
+
+        self.layer_id = cache_id
+        self.layer_signature = cache_signature
+
+    def tile(self, tile_row, tile_col):
+        """
+        Return the array of a raster tile, with array row 0 at the top of the tile.
+
+        :param tile_row: int, counted from the bottom of the raster
+        :param tile_col: int
+        :return: 2D np.ndarray
+        """
+
+        def load_tile():
+
+            tile_size = self.tile_cache.tile_size
+
+            col_start = tile_col * tile_size
+            col_end = min(self.params.cols, col_start + tile_size)
+            row_start = tile_row * tile_size
+            row_end = min(self.params.rows, row_start + tile_size)
+
+            return self.backend.read_window(col_start,
+                                            self.params.rows - row_end,
+                                            col_end - col_start,
+                                            row_end - row_start,
+                                            self.decimation)
+
+        return self.tile_cache.tile(self.layer_id,
+                                    self.layer_signature,
+                                    (self.decimation, tile_row, tile_col),
+                                    load_tile)
+
+    def load_tiles(self, tile_rows, tile_cols):
+        """
+        Read the missing tiles among a set of tiles with a single backend read
+        of the window enclosing them, and store them in the tile cache.
+        Scattered tiles, whose enclosing window would mostly contain unneeded tiles,
+        are left to be read one at a time.
+
+        :param tile_rows: np.ndarray of int, counted from the bottom of the raster
+        :param tile_cols: np.ndarray of int
+        """
+
+        missing = [(tile_row, tile_col) for tile_row, tile_col in set(zip(tile_rows.tolist(), tile_cols.tolist()))
+                   if not self.tile_cache.contains(self.layer_id,
+                                                   self.layer_signature,
+                                                   (self.decimation, tile_row, tile_col))]
+        if len(missing) < 2:
+            return
+
+        min_tile_row = min(tile_row for tile_row, _ in missing)
+        max_tile_row = max(tile_row for tile_row, _ in missing)
+        min_tile_col = min(tile_col for _, tile_col in missing)
+        max_tile_col = max(tile_col for _, tile_col in missing)
+
+        window_tiles_num = (max_tile_row - min_tile_row + 1) * (max_tile_col - min_tile_col + 1)
+        if window_tiles_num > 2 * len(missing):
+            return
+
+        tile_size = self.tile_cache.tile_size
+
+        col_start = min_tile_col * tile_size
+        col_end = min(self.params.cols, (max_tile_col + 1) * tile_size)
+        row_start = min_tile_row * tile_size
+        row_end = min(self.params.rows, (max_tile_row + 1) * tile_size)
+        top_row_start = self.params.rows - row_end
+
+        window = self.backend.read_window(col_start,
+                                          top_row_start,
+                                          col_end - col_start,
+                                          row_end - row_start,
+                                          self.decimation)
+
+        for tile_row, tile_col in missing:
+
+            tile_top_row = self.params.rows - min(self.params.rows, (tile_row + 1) * tile_size) - top_row_start
+            tile_bottom_row = self.params.rows - tile_row * tile_size - top_row_start
+            tile_left_col = tile_col * tile_size - col_start
+            tile_right_col = min(self.params.cols, (tile_col + 1) * tile_size) - col_start
+
+            # copied, so that the cached tile does not keep the whole window alive
+            tile_array = window[tile_top_row:tile_bottom_row, tile_left_col:tile_right_col].copy()
+
+            self.tile_cache.tile(self.layer_id,
+                                 self.layer_signature,
+                                 (self.decimation, tile_row, tile_col),
+                                 lambda: tile_array)
+
+    def cell_values(self, cols, rows):
+        """
+        Return the values of raster cells,
+        with rows counted from the bottom of the raster.
+        Cells outside the raster are returned as NaN.
+
+        :param cols: np.ndarray of int
+        :param rows: np.ndarray of int
+        :return: np.ndarray of float
+        """
+
+        values = np.full(cols.shape, np.nan)
+
+        inside = np.flatnonzero((0 <= cols) & (cols < self.params.cols) & (0 <= rows) & (rows < self.params.rows))
+        if inside.size == 0:
+            return values
+
+        tile_size = self.tile_cache.tile_size
+        tile_rows = rows[inside] // tile_size
+        tile_cols = cols[inside] // tile_size
+
+        self.load_tiles(tile_rows, tile_cols)
+
+        # group the cells by tile, so that each tile is fetched once
+        tile_ids = tile_rows * (self.params.cols // tile_size + 1) + tile_cols
+        order = np.argsort(tile_ids, kind='stable')
+        group_starts = np.flatnonzero(np.diff(tile_ids[order])) + 1
+
+        for group in np.split(order, group_starts):
+
+            tile_row, tile_col = int(tile_rows[group[0]]), int(tile_cols[group[0]])
+            tile_array = self.tile(tile_row, tile_col)
+
+            cells = inside[group]
+            local_rows = rows[cells] - tile_row * tile_size
+            local_cols = cols[cells] - tile_col * tile_size
+            values[cells] = tile_array[tile_array.shape[0] - 1 - local_rows, local_cols]
+
+        return values
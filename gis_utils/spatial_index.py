@@ -0,0 +1,303 @@
+
+from builtins import object
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+
+# This module does not depend on QGIS:
+# indices are built from plain arrays of feature bounding boxes.
+
+
+DEFAULT_MAX_CELLS = 1000000  # maximum number of grid cells of an index
+OVERSIZED_ITEM_CELLS = 1024  # items covering more cells are not gridded, and always tested
+MAX_CORRIDOR_CELLS_RADIUS = 16  # corridors wider than these cells are queried by their extent
+DEFAULT_CACHED_INDICES = 8
+
+
+class GridSpatialIndex(object):
+    """
+    Uniform-grid spatial index over item bounding boxes.
+
+    Each item is registered in the grid cells covered by its bounding box,
+    stored as a cell-sorted array of item positions with the start offset of each cell,
+    so that queries return candidate items with array operations only.
+    Items covering many cells (e.g. very large polygons) are kept aside and always tested.
+    """
+
+    def __init__(self, bboxes, ids, cell_size=None, max_cells=DEFAULT_MAX_CELLS):
+        """
+        :param bboxes: N x 4 np.ndarray of (xmin, ymin, xmax, ymax) bounding boxes
+        :param ids: N np.ndarray of item ids (e.g. feature ids)
+        :param cell_size: float, the grid cell size, or None for a size suited to the bounding boxes
+        :param max_cells: int, maximum number of grid cells
+        """
+
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        ids = np.asarray(ids)
+
+        valid = np.isfinite(bboxes).all(axis=1)
+        self.bboxes = bboxes[valid]
+        self.ids = ids[valid]
+
+        self.x_min, self.y_min = 0.0, 0.0
+        self.cell_size = 1.0
+        self.cols, self.rows = 0, 0
+        self.cell_starts = np.zeros(1, dtype=np.int64)
+        self.cell_items = np.empty(0, dtype=np.int64)
+        self.oversized_items = np.empty(0, dtype=np.int64)
+
+        if self.ids.size == 0:
+            return
+
+        self.x_min, self.y_min = self.bboxes[:, 0].min(), self.bboxes[:, 1].min()
+        width = self.bboxes[:, 2].max() - self.x_min
+        height = self.bboxes[:, 3].max() - self.y_min
+
+        if cell_size is None:
+            # about one item per cell, without splitting the typical item among many cells;
+            # the item density is estimated from the central spread of the items,
+            # so that a few very large or outlying items do not coarsen the grid
+            centers_xs = (self.bboxes[:, 0] + self.bboxes[:, 2]) / 2.0
+            centers_ys = (self.bboxes[:, 1] + self.bboxes[:, 3]) / 2.0
+            spread_width = np.subtract(*np.percentile(centers_xs, [99.0, 1.0]))
+            spread_height = np.subtract(*np.percentile(centers_ys, [99.0, 1.0]))
+            item_sizes = np.maximum(self.bboxes[:, 2] - self.bboxes[:, 0], self.bboxes[:, 3] - self.bboxes[:, 1])
+            cell_size = max(np.sqrt(spread_width * spread_height / self.ids.size), np.median(item_sizes))
+
+        if not cell_size > 0.0:
+            cell_size = max(width, height, 1.0)
+
+        # coarser cells when the grid would be too large
+        cell_size = max(cell_size, np.sqrt(width * height / max_cells))
+
+        self.cell_size = float(cell_size)
+        self.cols = int(width // self.cell_size) + 1
+        self.rows = int(height // self.cell_size) + 1
+
+        col_starts, row_starts = self.cell_indices(self.bboxes[:, 0], self.bboxes[:, 1])
+        col_ends, row_ends = self.cell_indices(self.bboxes[:, 2], self.bboxes[:, 3])
+        cols_nums = col_ends - col_starts + 1
+        cells_nums = cols_nums * (row_ends - row_starts + 1)
+
+        oversized = cells_nums > OVERSIZED_ITEM_CELLS
+        self.oversized_items = np.flatnonzero(oversized)
+
+        # one entry for each covered cell of each gridded item
+        gridded_items = np.flatnonzero(~ oversized)
+        entries_items = np.repeat(gridded_items, cells_nums[gridded_items])
+        entries_firsts = np.repeat(np.cumsum(cells_nums[gridded_items]) - cells_nums[gridded_items],
+                                   cells_nums[gridded_items])
+        entries_offsets = np.arange(entries_items.size) - entries_firsts
+        entries_cols = col_starts[entries_items] + entries_offsets % cols_nums[entries_items]
+        entries_rows = row_starts[entries_items] + entries_offsets // cols_nums[entries_items]
+        entries_cells = entries_rows * self.cols + entries_cols
+
+        order = np.argsort(entries_cells, kind='stable')
+        self.cell_items = entries_items[order]
+        self.cell_starts = np.searchsorted(entries_cells[order], np.arange(self.cols * self.rows + 1))
+
+    def __len__(self):
+
+        return self.ids.size
+
+    def cell_indices(self, xs, ys):
+        """
+        Grid cell columns and rows of points, clipped to the grid.
+
+        :param xs: np.ndarray of float
+        :param ys: np.ndarray of float
+        :return: tuple of two np.ndarray of int
+        """
+
+        cols = np.clip(np.floor((np.asarray(xs) - self.x_min) / self.cell_size), 0, max(self.cols - 1, 0))
+        rows = np.clip(np.floor((np.asarray(ys) - self.y_min) / self.cell_size), 0, max(self.rows - 1, 0))
+
+        return cols.astype(np.int64), rows.astype(np.int64)
+
+    def cells_items(self, cells):
+        """
+        Positions of the items registered in a set of grid cells, plus the oversized items.
+
+        :param cells: np.ndarray of cell indices
+        :return: np.ndarray of unique item positions
+        """
+
+        cells = np.unique(cells)
+        starts, ends = self.cell_starts[cells], self.cell_starts[cells + 1]
+        counts = ends - starts
+
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+
+        return np.union1d(self.cell_items[positions], self.oversized_items)
+
+    def bboxes_overlapping(self, items, x_min, y_min, x_max, y_max):
+        """
+        Filter items whose bounding boxes overlap a rectangle.
+
+        :param items: np.ndarray of item positions
+        :return: np.ndarray of item positions
+        """
+
+        bboxes = self.bboxes[items]
+
+        return items[(bboxes[:, 0] <= x_max) & (bboxes[:, 2] >= x_min) &
+                     (bboxes[:, 1] <= y_max) & (bboxes[:, 3] >= y_min)]
+
+    def query_rect(self, x_min, y_min, x_max, y_max):
+        """
+        Ids of the items whose bounding boxes overlap a rectangle.
+
+        :param x_min: float
+        :param y_min: float
+        :param x_max: float
+        :param y_max: float
+        :return: np.ndarray of ids
+        """
+
+        if self.ids.size == 0:
+            return self.ids[:0]
+
+        col_start, row_start = self.cell_indices(x_min, y_min)
+        col_end, row_end = self.cell_indices(x_max, y_max)
+
+        cols, rows = np.meshgrid(np.arange(col_start, col_end + 1), np.arange(row_start, row_end + 1))
+        items = self.cells_items((rows * self.cols + cols).ravel())
+
+        return self.ids[self.bboxes_overlapping(items, x_min, y_min, x_max, y_max)]
+
+    def query_polyline(self, xs, ys, half_width=0.0):
+        """
+        Ids of the candidate items for a corridor around a polyline:
+        the items whose bounding boxes are within the corridor half width from the polyline,
+        up to a quarter of the cell size, plus the oversized items overlapping the corridor extent.
+        The polyline is sampled at points spaced at most half a cell apart,
+        and each sample is tested only against the items registered in the grid cells around it.
+
+        :param xs: np.ndarray of the polyline vertex x values
+        :param ys: np.ndarray of the polyline vertex y values
+        :param half_width: float, the corridor half width
+        :return: np.ndarray of ids
+        """
+
+        xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+        valid = np.isfinite(xs) & np.isfinite(ys)
+        xs, ys = xs[valid], ys[valid]
+
+        if self.ids.size == 0 or xs.size == 0:
+            return self.ids[:0]
+
+        # a corridor much wider than the cells is queried by its extent
+        if half_width > MAX_CORRIDOR_CELLS_RADIUS * self.cell_size:
+            return self.query_rect(xs.min() - half_width, ys.min() - half_width,
+                                   xs.max() + half_width, ys.max() + half_width)
+
+        # points along the polyline, spaced at most half a cell apart
+        if xs.size > 1:
+            segment_lengths = np.hypot(np.diff(xs), np.diff(ys))
+            segment_samples = np.maximum(np.ceil(2.0 * segment_lengths / self.cell_size), 1).astype(np.int64)
+            segment_ndxs = np.repeat(np.arange(segment_lengths.size), segment_samples)
+            fractions = (np.arange(segment_ndxs.size) - np.repeat(np.cumsum(segment_samples) - segment_samples,
+                                                                  segment_samples)) / segment_samples[segment_ndxs]
+            sample_xs = np.append(xs[segment_ndxs] + (xs[segment_ndxs + 1] - xs[segment_ndxs]) * fractions, xs[-1])
+            sample_ys = np.append(ys[segment_ndxs] + (ys[segment_ndxs + 1] - ys[segment_ndxs]) * fractions, ys[-1])
+        else:
+            sample_xs, sample_ys = xs, ys
+
+        # every polyline point is within a quarter of cell from a sample
+        reach = half_width + self.cell_size / 4.0
+
+        # grid cells around each sample, as (sample, cell) pairs
+        col_starts, row_starts = self.cell_indices(sample_xs - reach, sample_ys - reach)
+        col_ends, row_ends = self.cell_indices(sample_xs + reach, sample_ys + reach)
+        span = int(max((col_ends - col_starts).max(), (row_ends - row_starts).max())) + 1
+        offsets = np.arange(span)
+        pairs_cols = col_starts[:, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]
+        pairs_rows = row_starts[:, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]
+        in_range = (pairs_cols <= col_ends[:, np.newaxis, np.newaxis]) & \
+                   (pairs_rows <= row_ends[:, np.newaxis, np.newaxis])
+        pairs_samples = np.broadcast_to(np.arange(sample_xs.size)[:, np.newaxis, np.newaxis], in_range.shape)[in_range]
+        pairs_cells = (pairs_rows * self.cols + pairs_cols)[in_range]
+
+        # (sample, item) pairs, from the items registered in the cells
+        starts, ends = self.cell_starts[pairs_cells], self.cell_starts[pairs_cells + 1]
+        counts = ends - starts
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        candidate_samples = np.repeat(pairs_samples, counts)
+        candidate_items = self.cell_items[positions]
+
+        bboxes = self.bboxes[candidate_items]
+        near = (bboxes[:, 0] - reach <= sample_xs[candidate_samples]) & \
+               (bboxes[:, 2] + reach >= sample_xs[candidate_samples]) & \
+               (bboxes[:, 1] - reach <= sample_ys[candidate_samples]) & \
+               (bboxes[:, 3] + reach >= sample_ys[candidate_samples])
+
+        # the oversized items are only tested against the corridor extent
+        oversized_items = self.bboxes_overlapping(self.oversized_items,
+                                                  xs.min() - half_width, ys.min() - half_width,
+                                                  xs.max() + half_width, ys.max() + half_width)
+
+        return self.ids[np.union1d(candidate_items[near], oversized_items)]
+
+
+class SpatialIndexCache(object):
+    """
+    Process-wide cache of layer spatial indices,
+    keyed by layer id and rebuilt when the layer signature changes.
+    Least-recently-used indices are discarded beyond the maximum number of indices.
+    """
+
+    def __init__(self, max_indices=DEFAULT_CACHED_INDICES):
+        """
+        :param max_indices: int, maximum number of cached indices
+        """
+
+        self.max_indices = max_indices
+
+        self._indices = OrderedDict()
+        self._lock = threading.RLock()
+
+    def index(self, layer_id, layer_signature, builder):
+        """
+        Return the spatial index of a layer, building it when missing or stale.
+        A None signature (a layer whose contents cannot be identified)
+        always rebuilds the index, without caching it.
+
+        :param layer_id: the layer id
+        :param layer_signature: a hashable value that changes when the layer contents change
+        :param builder: a callable returning the GridSpatialIndex
+        :return: GridSpatialIndex
+        """
+
+        if layer_signature is None:
+            return builder()
+
+        with self._lock:
+            cached = self._indices.get(layer_id)
+            if cached is not None and cached[0] == layer_signature:
+                self._indices.move_to_end(layer_id)
+                return cached[1]
+
+        index = builder()
+
+        with self._lock:
+            self._indices[layer_id] = (layer_signature, index)
+            self._indices.move_to_end(layer_id)
+            while len(self._indices) > self.max_indices:
+                self._indices.popitem(last=False)
+
+        return index
+
+    def invalidate(self, layer_id):
+
+        with self._lock:
+            self._indices.pop(layer_id, None)
+
+    def clear(self):
+
+        with self._lock:
+            self._indices.clear()
+
+
+layer_index_cache = SpatialIndexCache()
@@ -0,0 +1,126 @@
+
+from builtins import object
+from builtins import range
+import warnings
+
+import numpy as np
+
+
+# This module does not depend on QGIS:
+# DEM sampling is delegated to a function of plain coordinate arrays.
+
+
+SWATH_CHUNK_MAX_PTS = 1000000  # maximum number of swath points sampled at once
+
+
+class SwathElevations(object):
+    """
+    Statistics of the elevations sampled across a profile corridor,
+    one value for each profile station.
+    """
+
+    def __init__(self, min_zs, max_zs, mean_zs, percentiles, percentile_zs):
+        """
+        :param min_zs: np.ndarray
+        :param max_zs: np.ndarray
+        :param mean_zs: np.ndarray
+        :param percentiles: tuple of floats, in the 0-100 range
+        :param percentile_zs: list of np.ndarray, one for each percentile
+        """
+
+        self.min_zs = min_zs
+        self.max_zs = max_zs
+        self.mean_zs = mean_zs
+        self.percentiles = percentiles
+        self.percentile_zs = percentile_zs
+
+
+def swath_points(xs, ys, offsets):
+    """
+    Points across a profile, along the normals at the profile stations.
+    The normal at a station is orthogonal to the mean direction of its adjacent segments.
+
+    :param xs: np.ndarray of the station x values
+    :param ys: np.ndarray of the station y values
+    :param offsets: np.ndarray of the across-profile offsets, positive to the left of the profile
+    :return: tuple of two (stations number, offsets number) np.ndarray, the x and y values
+    """
+
+    dxs = np.gradient(xs)
+    dys = np.gradient(ys)
+
+    lengths = np.hypot(dxs, dys)
+    lengths[lengths == 0.0] = np.nan
+
+    normal_xs = - dys / lengths
+    normal_ys = dxs / lengths
+
+    return xs[:, np.newaxis] + normal_xs[:, np.newaxis] * offsets, \
+           ys[:, np.newaxis] + normal_ys[:, np.newaxis] * offsets
+
+
+def swath_statistics(zs, percentiles):
+    """
+    Reduce the elevations sampled across the profile stations.
+    Stations without valid elevations get NaN statistics.
+
+    :param zs: (stations number, offsets number) np.ndarray
+    :param percentiles: tuple of floats, in the 0-100 range
+    :return: SwathElevations instance
+    """
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN stations
+
+        min_zs = np.nanmin(zs, axis=1)
+        max_zs = np.nanmax(zs, axis=1)
+        mean_zs = np.nanmean(zs, axis=1)
+
+        if percentiles:
+            percentile_zs = list(np.nanpercentile(zs, percentiles, axis=1))
+        else:
+            percentile_zs = []
+
+    return SwathElevations(min_zs, max_zs, mean_zs, tuple(percentiles), percentile_zs)
+
+
+def swath_elevations(xs, ys, surfaces_num, half_width, across_samples_num, percentiles, sample_points,
+                     chunk_max_pts=SWATH_CHUNK_MAX_PTS):
+    """
+    Statistics of the surface elevations across a corridor centered on a profile.
+    For each profile station, the surfaces are sampled at equally-spaced points along the station normal:
+    stations are processed in chunks of at most chunk_max_pts points.
+
+    :param xs: np.ndarray of the station x values
+    :param ys: np.ndarray of the station y values
+    :param surfaces_num: int, number of sampled surfaces
+    :param half_width: float, the corridor half width
+    :param across_samples_num: int, number of samples across the corridor
+    :param percentiles: tuple of floats, in the 0-100 range
+    :param sample_points: callable receiving point x and y arrays and returning two lists, in surface order:
+      elevation arrays and error messages (None for no error)
+    :param chunk_max_pts: int
+    :return: tuple of two lists, in surface order: SwathElevations instances and error messages (None for no error)
+    """
+
+    offsets = np.linspace(-half_width, half_width, across_samples_num)
+    stations_num = len(xs)
+    chunk_stations_num = max(1, chunk_max_pts // across_samples_num)
+
+    swaths_zs = [np.full((stations_num, across_samples_num), np.nan) for _ in range(surfaces_num)]
+    swaths_errors = [None for _ in range(surfaces_num)]
+
+    for start in range(0, stations_num, chunk_stations_num):
+
+        end = min(start + chunk_stations_num, stations_num)
+
+        swath_xs, swath_ys = swath_points(xs[start:end], ys[start:end], offsets)
+
+        chunk_zs, chunk_errors = sample_points(swath_xs.ravel(), swath_ys.ravel())
+
+        for surface_ndx, (zs, error) in enumerate(zip(chunk_zs, chunk_errors)):
+            swaths_zs[surface_ndx][start:end] = zs.reshape(swath_xs.shape)
+            if swaths_errors[surface_ndx] is None:
+                swaths_errors[surface_ndx] = error
+
+    return [swath_statistics(zs, percentiles) for zs in swaths_zs], swaths_errors
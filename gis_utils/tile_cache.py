@@ -0,0 +1,129 @@
+
+from builtins import object
+from collections import OrderedDict
+import threading
+
+
+DEFAULT_TILE_SIZE = 256  # tile side, in cells
+DEFAULT_CACHE_SIZE_MB = 256
+
+
+class DEMTileCache(object):
+    """
+    Process-wide LRU cache of DEM tiles,
+    keyed by layer id and tile index.
+
+    Tiles are evicted in least-recently-used order
+    when the total size of the stored arrays exceeds the memory budget.
+    The tiles of a layer are discarded when the layer source signature changes.
+    """
+
+    def __init__(self, max_mb=DEFAULT_CACHE_SIZE_MB, tile_size=DEFAULT_TILE_SIZE):
+        """
+        :param max_mb: memory budget, in megabytes
+        :param tile_size: tile side, in cells
+        """
+
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.tile_size = tile_size
+
+        self._tiles = OrderedDict()
+        self._layer_signatures = {}
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self):
+
+        return self._nbytes
+
+    @property
+    def tiles_num(self):
+
+        return len(self._tiles)
+
+    def tile(self, layer_id, layer_signature, tile_ndx, loader):
+        """
+        Return a tile array, reading it with the loader when not cached.
+
+        :param layer_id: the layer id
+        :param layer_signature: a hashable value that changes when the layer data source changes
+        :param tile_ndx: hashable tile index, e.g. a tuple of (decimation, tile row, tile column)
+        :param loader: a callable returning the tile np.ndarray
+        :return: np.ndarray
+        """
+
+        key = (layer_id, tile_ndx)
+
+        with self._lock:
+
+            if self._layer_signatures.get(layer_id) != layer_signature:
+                self._discard_layer(layer_id)
+                self._layer_signatures[layer_id] = layer_signature
+
+            array = self._tiles.get(key)
+            if array is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return array
+
+            self.misses += 1
+
+        array = loader()
+
+        with self._lock:
+
+            if self._layer_signatures.get(layer_id) == layer_signature and key not in self._tiles:
+                self._tiles[key] = array
+                self._nbytes += array.nbytes
+                self._evict()
+
+        return array
+
+    def contains(self, layer_id, layer_signature, tile_ndx):
+        """
+        Check whether a tile is cached, without updating the tile use order or the statistics.
+
+        :param layer_id: the layer id
+        :param layer_signature: the current layer data source signature
+        :param tile_ndx: hashable tile index
+        :return: bool
+        """
+
+        with self._lock:
+            return self._layer_signatures.get(layer_id) == layer_signature and (layer_id, tile_ndx) in self._tiles
+
+    def invalidate(self, layer_id):
+        """
+        Discard the cached tiles of a layer.
+
+        :param layer_id: the layer id
+        """
+
+        with self._lock:
+            self._discard_layer(layer_id)
+            self._layer_signatures.pop(layer_id, None)
+
+    def clear(self):
+
+        with self._lock:
+            self._tiles.clear()
+            self._layer_signatures.clear()
+            self._nbytes = 0
+
+    def _discard_layer(self, layer_id):
+
+        for key in [key for key in self._tiles if key[0] == layer_id]:
+            self._nbytes -= self._tiles.pop(key).nbytes
+
+    def _evict(self):
+
+        while self._nbytes > self.max_bytes and len(self._tiles) > 1:
+            _, array = self._tiles.popitem(last=False)
+            self._nbytes -= array.nbytes
+
+
+dem_tile_cache = DEMTileCache()
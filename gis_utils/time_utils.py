@@ -1,6 +1,9 @@
 
 from builtins import map
 import calendar
+import re
+
+import numpy as np
 
 
 def standard_gpstime_to_seconds(time_str):
@@ -33,6 +36,172 @@ def standard_gpstime_to_seconds(time_str):
     return secs
 
 
+iso8601_pattern = re.compile(
+    r"^\s*(\d{4})-(\d{1,2})-(\d{1,2})[T ](\d{1,2}):(\d{1,2}):(\d{1,2}(?:\.\d*)?)"
+    r"\s*(Z|[+-]\d{2}(?::?\d{2})?)?\s*$")
+
+
+def days_from_civil(years, months, days):
+    """
+    Number of days since January 1, 1970 of proleptic Gregorian dates,
+    from integer arrays.
+    Algorithm from H. Hinnant, "chrono-Compatible Low-Level Date Algorithms".
+
+    Example:
+      >>> days_from_civil(np.array([1970, 2000]), np.array([1, 3]), np.array([1, 1])).tolist()
+      [0, 11017]
+    """
+
+    years = years - (months <= 2)
+    eras = np.floor_divide(years, 400)
+    years_of_era = years - eras * 400
+    days_of_year = (153 * np.where(months > 2, months - 3, months + 9) + 2) // 5 + days - 1
+    days_of_era = years_of_era * 365 + years_of_era // 4 - years_of_era // 100 + days_of_year
+
+    return eras * 146097 + days_of_era - 719468
+
+
+canonical_digit_ndxs = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+
+
+def character_codes(time_strs):
+    """
+    Character codes of stripped time strings, one row for each string,
+    padded with zeros to at least 20 characters, plus two more columns.
+
+    :param time_strs: sequence of str (None for missing values)
+    :return: tuple of the stripped strings np.ndarray and the (strings number, width) np.ndarray of uint32
+    """
+
+    time_strs = np.char.strip(np.array([time_str or "" for time_str in time_strs], dtype=str))
+
+    width = max(time_strs.dtype.itemsize // 4, 20) + 2
+    chars = time_strs.astype("U{}".format(width)).view(np.uint32).reshape(time_strs.size, width)
+
+    return time_strs, chars
+
+
+def gpstimes_to_seconds(time_strs):
+    """
+    Convert ISO-8601 date-time strings, as found in GPX files,
+    into float seconds since January 1, 1970 (UTC).
+    Fractional seconds and 'Z' or '+/-hh:mm' offsets are supported,
+    times without offset are considered UTC.
+    Malformed values are converted into NaN.
+    Strings in the canonical GPX layout 'YYYY-MM-DDThh:mm:ss[.s...][Z]' are parsed at once,
+    from their character codes, while other layouts (e.g. with offsets or one-digit fields)
+    are matched one string at a time.
+
+    Example:
+      >>> gpstimes_to_seconds(["1970-01-01T01:00:00.5Z", "1970-01-01T02:00:00+01:00", "none"]).tolist()
+      [3600.5, 3600.0, nan]
+    """
+
+    time_strs, chars = character_codes(time_strs)
+
+    size = time_strs.size
+    seconds = np.full(size, np.nan)
+    if size == 0:
+        return seconds
+
+    digits = chars.astype(np.float64) - ord("0")
+    is_digit = (0 <= digits) & (digits <= 9)
+
+    def number(start, end):
+        return np.dot(digits[:, start:end], 10.0 ** np.arange(end - start - 1, -1, -1))
+
+    # canonical layout: fixed-position fields, optional fraction and optional 'Z'
+
+    canonical = is_digit[:, canonical_digit_ndxs].all(axis=1) & \
+                (chars[:, 4] == ord("-")) & (chars[:, 7] == ord("-")) & \
+                ((chars[:, 10] == ord("T")) | (chars[:, 10] == ord(" "))) & \
+                (chars[:, 13] == ord(":")) & (chars[:, 16] == ord(":"))
+
+    with_fraction = chars[:, 19] == ord(".")
+    fraction_digits = np.logical_and.accumulate(is_digit[:, 20:], axis=1) & with_fraction[:, np.newaxis]
+    fractions = np.dot(digits[:, 20:] * fraction_digits, 10.0 ** - np.arange(1, chars.shape[1] - 19))
+
+    rows = np.arange(size)
+    end_ndxs = np.where(with_fraction, 20 + fraction_digits.sum(axis=1), 19)
+    end_chars = chars[rows, end_ndxs]
+    next_chars = chars[rows, np.minimum(end_ndxs + 1, chars.shape[1] - 1)]
+    canonical &= (end_chars == 0) | ((end_chars == ord("Z")) & (next_chars == 0))
+
+    years, months, days = number(0, 4), number(5, 7), number(8, 10)
+    hours, minutes = number(11, 13), number(14, 16)
+    secs = number(17, 19) + fractions
+    offsets = np.zeros(size)
+
+    # other layouts
+
+    parsed = canonical.copy()
+    for ndx in np.flatnonzero(~canonical & (time_strs != "")):
+
+        match = iso8601_pattern.match(time_strs[ndx])
+        if match is None:
+            continue
+
+        years[ndx], months[ndx], days[ndx], hours[ndx], minutes[ndx] = list(map(int, match.groups()[:5]))
+        secs[ndx] = float(match.group(6))
+
+        offset = match.group(7)
+        if offset and offset != "Z":
+            offset = offset.replace(":", "")
+            sign = -1.0 if offset[0] == "-" else 1.0
+            offsets[ndx] = sign * (int(offset[1:3]) * 3600 + int(offset[3:5] or 0) * 60)
+
+        parsed[ndx] = True
+
+    # 24:00:00 is the end of the day, i.e. the start of the next day
+    valid = parsed & (1 <= months) & (months <= 12) & (1 <= days) & (days <= 31) & \
+            ((hours <= 23) | ((hours == 24) & (minutes == 0) & (secs == 0.0))) & \
+            (minutes <= 59) & (secs < 61.0)
+
+    values = days_from_civil(years[valid], months[valid], days[valid]) * 86400.0 + \
+             hours[valid] * 3600.0 + minutes[valid] * 60.0 + secs[valid] - offsets[valid]
+
+    seconds[valid] = values
+
+    return seconds
+
+
+def seconds_to_datetime64(seconds):
+    """
+    Convert float seconds since January 1, 1970 (UTC) into datetime64 values,
+    with microsecond resolution. NaN values are converted into NaT.
+    """
+
+    seconds = np.asarray(seconds, dtype=np.float64)
+
+    microseconds = np.where(np.isnan(seconds), 0, np.round(seconds * 1e6)).astype(np.int64)
+    datetimes = microseconds.astype("datetime64[us]")
+    datetimes[np.isnan(seconds)] = np.datetime64("NaT")
+
+    return datetimes
+
+
+def seconds_to_iso8601(seconds):
+    """
+    Convert float seconds since January 1, 1970 (UTC) into ISO-8601 UTC strings,
+    with fractional seconds only when present. NaN values are converted into empty strings.
+
+    Example:
+      >>> seconds_to_iso8601([3600.5, 0.0, np.nan]).tolist()
+      ['1970-01-01T01:00:00.5Z', '1970-01-01T00:00:00Z', '']
+    """
+
+    datetimes = seconds_to_datetime64(seconds)
+
+    fractional = datetimes.astype(np.int64) % 1000000 != 0
+    time_strs = np.where(
+        fractional,
+        np.char.add(np.char.rstrip(np.datetime_as_string(datetimes, unit='us'), "0"), "Z"),
+        np.datetime_as_string(datetimes, unit='s', timezone='UTC'))
+    time_strs[np.isnat(datetimes)] = ""
+
+    return time_strs
+
+
 if __name__ == "__main__":
 
     import doctest
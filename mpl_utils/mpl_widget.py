@@ -114,3 +114,17 @@ def plot_filled_line(axes, x_list, y_list, plot_y_min, facecolor, alpha=0.1):
                           y_values_array[val_int['start']: val_int['end'] + 1],
                           facecolor=facecolor,
                           alpha=alpha)
+
+
+def plot_envelope(axes, x_list, y_min_list, y_max_list, facecolor, alpha=0.2):
+
+    x_values_array = np.asarray(x_list)
+    y_min_values_array = np.asarray(y_min_list)
+    y_max_values_array = np.asarray(y_max_list)
+    axes.fill_between(x_values_array,
+                      y_min_values_array,
+                      y_max_values_array,
+                      where=np.isfinite(y_min_values_array) & np.isfinite(y_max_values_array),
+                      facecolor=facecolor,
+                      alpha=alpha,
+                      linewidth=0)
@@ -15,22 +15,28 @@ from qgis.PyQt.QtWidgets import QTextBrowser
 
 from qgis.core import *
 
-from .gsf.geometry import Plane, GPlane, GAxis
+from .gsf.geometry import Plane, GPlane
 from .gsf.array_utils import to_float
 from .gsf.sorting import *
 
 from .gis_utils.features import Segment, MultiLine, Line, \
-    merge_line, merge_lines, ParamLine3D, xytuple_list_to_Line
-from .gis_utils.intersections import map_struct_pts_on_section, calculate_distance_with_sign
-from .gis_utils.profile import GeoProfilesSet, GeoProfile, topoprofiles_from_dems, topoprofiles_from_gpxfile, \
-    intersect_with_dem, calculate_profile_lines_intersection, intersection_distances_by_profile_start_list, \
-    extract_multiline2d_list, profile_polygon_intersection, calculate_projected_3d_pts
+    merge_line, merge_lines, xytuple_list_to_Line, multilines_to_array, multilines_from_array
+from .gis_utils.intersections import map_struct_pts_on_section, project_pts_on_section_along_axis
+from .gis_utils.profile import GeoProfilesSet, GeoProfile, GeologicalInput, topoprofiles_from_dems, topoprofiles_from_dems_batch, \
+    swath_profiles_from_dems, add_profile_swaths, build_dems_overviews, profile_chunking, \
+    topoprofiles_from_gpxfile, profile_samples_memo, intersect_with_dem, profile_lines_intersections, \
+    extract_multiline2d_list, profiles_polygon_intersections, drape_profiles_intersections, profile_candidate_fids, \
+    profile_corridor_rect, projected_3d_arrays
+from .gis_utils.profile_cache import geoprofiles_fingerprint, geological_fingerprint, geoprofiles_cache_path, \
+    save_geoprofiles, load_geoprofiles
 from .gis_utils.qgs_tools import *
 from .gis_utils.statistics import get_statistics
-from .gis_utils.errors import VectorInputException, VectorIOException
+from .gis_utils.tile_cache import dem_tile_cache
+from .gis_utils.time_utils import seconds_to_iso8601
+from .gis_utils.errors import VectorInputException, VectorIOException, FunInputException
 
 from .qt_utils.filesystem import update_directory_key, new_file_path, old_file_path
-from .qt_utils.tools import info, warn, error, update_ComboBox
+from .qt_utils.tools import info, warn, error, confirm, update_ComboBox
 
 from .string_utils.utils_string import clean_string
 
@@ -71,6 +77,7 @@ class qprof_QWidget(QWidget):
         self.polygon_classification_colors = None
 
         self.input_geoprofiles = GeoProfilesSet()  # main instance for the geoprofiles
+        self.input_geoprofiles_fingerprint = None  # fingerprint of the DEM-line profiles inputs, for the profiles cache
 
         self.profile_windows = []  # used to maintain alive the plots, i.e. to avoid the C++ objects being destroyed
 
@@ -112,6 +119,10 @@ class qprof_QWidget(QWidget):
         QgsProject.instance().layerRemoved.connect(self.struct_line_refresh_lyr_combobox)
         QgsProject.instance().layerRemoved.connect(self.struct_polygon_refresh_lyr_combobox)
 
+        QgsProject.instance().layerWillBeRemoved[str].connect(dem_tile_cache.invalidate)
+        QgsProject.instance().layerWillBeRemoved[str].connect(clear_dem_samplers)
+        QgsProject.instance().transformContextChanged.connect(clear_coordinate_transforms)
+
         self.dialog_layout.addWidget(self.main_widget)
         self.setLayout(self.dialog_layout)
         self.adjustSize()
@@ -150,6 +161,7 @@ class qprof_QWidget(QWidget):
                 return
 
             self.input_geoprofiles = GeoProfilesSet()  # reset any previous created profiles
+            self.input_geoprofiles_fingerprint = None
 
             if topo_source_type == self.demline_source:
 
@@ -171,6 +183,20 @@ class qprof_QWidget(QWidget):
                          "Sample distance value not correct: {}".format(e))
                     return
 
+                swath_params = None
+                if self.qcbxSwathProfile.isChecked():
+                    try:
+                        swath_half_width = float(self.qledSwathHalfWidth.text())
+                        assert swath_half_width > 0.0
+                        swath_samples_num = int(self.qledSwathSamplesNumber.text())
+                        assert swath_samples_num >= 2
+                    except Exception as e:
+                        warn(self,
+                             self.plugin_name,
+                             "Swath parameters not correct: {}".format(e))
+                        return
+                    swath_params = (swath_half_width, swath_samples_num)
+
                 if self.qcbxDigitizeLineSource.isChecked():
                     if self.digitized_profile_line2dt is None or \
                        self.digitized_profile_line2dt.num_pts < 2:
@@ -222,44 +248,174 @@ class qprof_QWidget(QWidget):
 
             if topo_source_type == self.demline_source:  # sources are DEM(s) and line
 
-                # check total number of points in line(s) to create
-                estimated_total_num_pts = 0
-                for profile_line in source_profile_lines:
+                # profiles computed from the same inputs are read from the profiles cache
+
+                profiles_fingerprint = geoprofiles_fingerprint(self.canvas,
+                                                               source_profile_lines,
+                                                               sample_distance,
+                                                               selected_dems,
+                                                               invert_profile,
+                                                               swath_params,
+                                                               dem_overview_sampling_ratio)
+
+                cached_geoprofiles = load_geoprofiles(self.profiles_cache_path(),
+                                                      profiles_fingerprint,
+                                                      selected_dems,
+                                                      selected_dem_parameters,
+                                                      QgsProject.instance().mapLayers())
+
+                if cached_geoprofiles is not None:
+                    self.input_geoprofiles = cached_geoprofiles
+                    self.input_geoprofiles_fingerprint = profiles_fingerprint
+                    self.plane_attitudes_colors = list(cached_geoprofiles.plane_attitudes_colors)
+                    self.polygon_classification_colors = cached_geoprofiles.polygon_classification_colors
+                    info(self,
+                         self.plugin_name,
+                         "Data profile read from cache")
+                    return
 
-                    profile_length = profile_line.length_2d
-                    profile_num_pts = profile_length / sample_distance
-                    estimated_total_num_pts += profile_num_pts
+                if dem_overview_build:
 
-                estimated_total_num_pts = int(ceil(estimated_total_num_pts))
+                    def confirm_overviews_build(dem_paths):
+                        return confirm(self,
+                                       self.plugin_name,
+                                       "Overview files (.ovr) will be written next to these DEMs:\n{}\n\nBuild them?".format(
+                                           "\n".join(dem_paths)))
 
-                if estimated_total_num_pts > pt_num_threshold:
-                    warn(
-                        parent=self,
-                        header=self.plugin_name,
-                        msg="There are {} estimated points (limit is {}) in profile(s) to create.".format(estimated_total_num_pts, pt_num_threshold) +
-                            "\nPlease increase sample distance value"
-                    )
-                    return
+                    try:
+                        build_dems_overviews(self.canvas,
+                                             selected_dems,
+                                             selected_dem_parameters,
+                                             sample_distance,
+                                             dem_overview_sampling_ratio,
+                                             confirm_overviews_build)
+                    except Exception as e:
+                        warn(self,
+                             self.plugin_name,
+                             "Unable to build DEM overviews: {}".format(e))
 
-                for profile_line in source_profile_lines:
+                # large profiles are processed in chunks, possibly with memory-mapped results,
+                # as decided on the estimated number of points of each line (see profile_chunking)
+
+                if len(source_profile_lines) > 1:
+
+                    # multiple profiles are created by workers, large ones in chunks in this process,
+                    # swath profiles are then added in this process
+
+                    progress_dialog = QProgressDialog("Creating profiles", "Cancel", 0, len(source_profile_lines), self)
+                    progress_dialog.setWindowTitle(self.plugin_name)
+                    progress_dialog.setWindowModality(Qt.WindowModal)
+                    progress_dialog.setMinimumDuration(0)
+
+                    def update_progress(created_num, total_num):
+
+                        progress_dialog.setValue(created_num)
+                        QApplication.processEvents()
 
                     try:
 
-                        topo_profiles = topoprofiles_from_dems(
+                        topo_profiles_list = topoprofiles_from_dems_batch(
                             self.canvas,
-                            profile_line,
+                            source_profile_lines,
                             sample_distance,
                             selected_dems,
                             selected_dem_parameters,
-                            invert_profile
+                            invert_profile,
+                            progress_callback=update_progress,
+                            cancel_requested=progress_dialog.wasCanceled,
+                            memo=profile_samples_memo,
+                            overview_sampling_ratio=dem_overview_sampling_ratio,
+                            chunk_pt_num_threshold=pt_num_threshold,
+                            chunk_size=profile_chunk_size,
+                            memmap_pt_num_threshold=memmap_pt_num_threshold
                         )
 
                     except Exception as e:
 
-                         warn(self,
+                        progress_dialog.close()
+                        warn(self,
                              self.plugin_name,
                              "Error with data source read: {}".format(e))
-                         return
+                        return
+
+                    progress_dialog.close()
+
+                    if topo_profiles_list is None:
+                        warn(self,
+                             self.plugin_name,
+                             "Profile creation cancelled")
+                        return
+
+                    if swath_params is not None:
+
+                        try:
+
+                            for topo_profiles in topo_profiles_list:
+                                add_profile_swaths(
+                                    self.canvas,
+                                    topo_profiles,
+                                    selected_dems,
+                                    selected_dem_parameters,
+                                    swath_params[0],
+                                    swath_params[1],
+                                    overview_sampling_ratio=dem_overview_sampling_ratio
+                                )
+
+                        except Exception as e:
+
+                            warn(self,
+                                 self.plugin_name,
+                                 "Error with data source read: {}".format(e))
+                            return
+
+                else:
+
+                    topo_profiles_list = []
+                    for profile_line in source_profile_lines:
+
+                        chunk_size, use_memmap = profile_chunking(profile_line,
+                                                                  sample_distance,
+                                                                  pt_num_threshold,
+                                                                  profile_chunk_size,
+                                                                  memmap_pt_num_threshold)
+
+                        try:
+
+                            if swath_params is None:
+                                topo_profiles_list.append(topoprofiles_from_dems(
+                                    self.canvas,
+                                    profile_line,
+                                    sample_distance,
+                                    selected_dems,
+                                    selected_dem_parameters,
+                                    invert_profile,
+                                    chunk_size,
+                                    use_memmap,
+                                    profile_samples_memo,
+                                    dem_overview_sampling_ratio
+                                ))
+                            else:
+                                topo_profiles_list.append(swath_profiles_from_dems(
+                                    self.canvas,
+                                    profile_line,
+                                    sample_distance,
+                                    selected_dems,
+                                    selected_dem_parameters,
+                                    invert_profile,
+                                    swath_params[0],
+                                    swath_params[1],
+                                    memo=profile_samples_memo,
+                                    overview_sampling_ratio=dem_overview_sampling_ratio
+                                ))
+
+                        except Exception as e:
+
+                             warn(self,
+                                 self.plugin_name,
+                                 "Error with data source read: {}".format(e))
+                             return
+
+                for profile_line, topo_profiles in zip(source_profile_lines, topo_profiles_list):
 
                     if topo_profiles is None:
                         warn(self,
@@ -267,6 +423,13 @@ class qprof_QWidget(QWidget):
                              "Debug: profile not created")
                         return
 
+                    failed_dems = ["{}: {}".format(name, error) for name, error in
+                                   zip(topo_profiles.surface_names, topo_profiles.surface_errors) if error is not None]
+                    if failed_dems:
+                        warn(self,
+                             self.plugin_name,
+                             "Error with DEM read:\n{}".format("\n".join(failed_dems)))
+
                     geoprofile = GeoProfile()
                     geoprofile.source_data_type = topo_source_type
                     geoprofile.original_line = profile_line
@@ -275,6 +438,9 @@ class qprof_QWidget(QWidget):
 
                     self.input_geoprofiles.append(geoprofile)
 
+                self.input_geoprofiles_fingerprint = profiles_fingerprint
+                self.save_profiles_cache()
+
             elif topo_source_type == self.gpxfile_source:  # source is GPX file
 
                 try:
@@ -509,8 +675,8 @@ class qprof_QWidget(QWidget):
                 self.input_geoprofiles.geoprofile(ndx).topo_profiles.profile_length = self.input_geoprofiles.geoprofile(ndx).topo_profiles.profile_s[-1] - self.input_geoprofiles.geoprofile(ndx).topo_profiles.profile_s[0]
                 statistics_elev = self.input_geoprofiles.geoprofile(ndx).topo_profiles.statistics_elev
                 self.input_geoprofiles.geoprofile(ndx).topo_profiles.natural_elev_range = (
-                    np.nanmin(np.array([ds_stats["min"] for ds_stats in statistics_elev])),
-                    np.nanmax(np.array([ds_stats["max"] for ds_stats in statistics_elev])))
+                    np.nanmin(np.array([ds_stats["min"] for ds_stats in statistics_elev] + [np.nanmin(swath.min_zs) for swath in self.input_geoprofiles.geoprofile(ndx).topo_profiles.profile_swaths])),
+                    np.nanmax(np.array([ds_stats["max"] for ds_stats in statistics_elev] + [np.nanmax(swath.max_zs) for swath in self.input_geoprofiles.geoprofile(ndx).topo_profiles.profile_swaths])))
 
                 self.input_geoprofiles.geoprofile(ndx).topo_profiles.statistics_calculated = True
 
@@ -897,6 +1063,18 @@ class qprof_QWidget(QWidget):
         self.qledProfileDensifyDistance = QLineEdit()
         qlytInputLine.addWidget(self.qledProfileDensifyDistance, 3, 1, 1, 3)
 
+        # swath profile corridor
+        self.qcbxSwathProfile = QCheckBox(self.tr("Swath profile"))
+        self.qcbxSwathProfile.setToolTip("Add the min, max, mean and percentile elevations\n"
+                                         "across a corridor centered on the profile line")
+        qlytInputLine.addWidget(self.qcbxSwathProfile, 4, 0, 1, 1)
+        qlytInputLine.addWidget(QLabel(self.tr("half width")), 4, 1, 1, 1)
+        self.qledSwathHalfWidth = QLineEdit()
+        qlytInputLine.addWidget(self.qledSwathHalfWidth, 4, 2, 1, 2)
+        qlytInputLine.addWidget(QLabel(self.tr("across samples")), 5, 1, 1, 1)
+        self.qledSwathSamplesNumber = QLineEdit("21")
+        qlytInputLine.addWidget(self.qledSwathSamplesNumber, 5, 2, 1, 2)
+
         qgbxInputLine.setLayout(qlytInputLine)
 
         qlytDEMInput.addWidget(qgbxInputLine)
@@ -1708,7 +1886,7 @@ class qprof_QWidget(QWidget):
                         topo_profile = geoprofile.topo_profiles
                         lats = topo_profile.lats
                         lons = topo_profile.lons
-                        times = topo_profile.times
+                        times = seconds_to_iso8601(topo_profile.times)
                         cumdist2Ds = topo_profile.profile_s
                         elevs = topo_profile.profile_zs[0]  # [0] required for compatibility with DEM processing
                         cumdist3Ds = topo_profile.profile_s3ds[0]  # [0] required for compatibility with DEM processing
@@ -2056,15 +2234,15 @@ class qprof_QWidget(QWidget):
     def reset_polygon_intersections(self):
 
         try:
-            geoprofile = self.input_geoprofiles.geoprofile(0)
-            if geoprofile is not None:
+            for geoprofile in self.input_geoprofiles.geoprofiles:
                 geoprofile.outcrops = []
+                geoprofile.outcrops_input = None
         except:
             pass
 
     def check_intersection_polygon_inputs(self):
 
-        if not self.check_for_struc_process():
+        if not self.check_for_struc_process(single_segment_constrain=False, single_profile_constrain=False):
             return False
 
         # polygon layer with parameter fields
@@ -2079,7 +2257,7 @@ class qprof_QWidget(QWidget):
 
     def check_intersection_line_inputs(self):
 
-        if not self.check_for_struc_process():
+        if not self.check_for_struc_process(single_segment_constrain=False):
             return False
 
         # line structural layer with parameter fields
@@ -2098,87 +2276,44 @@ class qprof_QWidget(QWidget):
         if not self.check_intersection_polygon_inputs():
             return
 
-        # get dem parameters
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        demLayer = geoprofile.topo_profiles.dem_params[0].layer
-        demParams = geoprofile.topo_profiles.dem_params[0].params
+        geoprofiles = self.input_geoprofiles.geoprofiles
 
-        # profile line2d, in project CRS and densified
-        profile_line2d_prjcrs_densif = geoprofile.original_line.densify_2d_line(geoprofile.sample_distance)
+        # profile lines, in project CRS and densified
+        profile_lines_prjcrs_densif = [geoprofile.original_line.densify_2d_line(geoprofile.sample_distance)
+                                       for geoprofile in geoprofiles]
 
         # polygon layer
         intersection_polygon_qgis_ndx = self.inters_input_polygon_comboBox.currentIndex() - 1  # minus 1 to account for initial text in combo box
         inters_polygon_classifaction_field_ndx = self.inters_polygon_classifaction_field_comboBox.currentIndex() - 1  # minus 1 to account for initial text in combo box
         polygon_layer = self.current_polygon_layers[intersection_polygon_qgis_ndx]
-        polygon_layer_crs = polygon_layer.crs()
 
         on_the_fly_projection, project_crs = get_on_the_fly_projection(self.canvas)
 
-        if on_the_fly_projection and polygon_layer_crs != project_crs:
-            profile_line2d_polycrs_densif = profile_line2d_prjcrs_densif.crs_project(project_crs,
-                                                                                     polygon_layer_crs)
-        else:
-            profile_line2d_polycrs_densif = profile_line2d_prjcrs_densif
-
-        profile_qgsgeometry = QgsGeometry.fromPolyline(
-            [QgsPoint(pt2d.x, pt2d.y) for pt2d in profile_line2d_polycrs_densif.pts])
-
-        success, return_data = profile_polygon_intersection(profile_qgsgeometry,
-                                                            polygon_layer,
-                                                            inters_polygon_classifaction_field_ndx)
-
-        if not success:
-            error(self,
-                  self.plugin_name,
-                  return_data)
-            return
-
-        lIntersectPolylinePolygonCrs = return_data
+        # intersections of all the profiles, in project CRS, with a single pass on the polygon layer
+        profiles_intersections = profiles_polygon_intersections(profile_lines_prjcrs_densif,
+                                                                polygon_layer,
+                                                                inters_polygon_classifaction_field_ndx,
+                                                                on_the_fly_projection,
+                                                                project_crs,
+                                                                max(geoprofile.sample_distance for geoprofile in geoprofiles),
+                                                                polygon_intersection_max_threads)
 
-        if len(lIntersectPolylinePolygonCrs) == 0:
+        if not any(profiles_intersections):
             warn(self,
                  self.plugin_name,
                  "No intersection found")
             return
 
-        # transform polyline intersections into prj crs line2d & classification list
-        lIntersLine2dPrjCrs = []
-        for intersection_polyline_polygon_crs in lIntersectPolylinePolygonCrs:
-            rec_classification, xy_tuple_list = intersection_polyline_polygon_crs
-            intersection_polygon_crs_line2d = xytuple_list_to_Line(xy_tuple_list)
-            if on_the_fly_projection and polygon_layer_crs != project_crs:
-                intersection_prj_crs_line2d = intersection_polygon_crs_line2d.crs_project(polygon_layer_crs,
-                                                                                          project_crs)
-            else:
-                intersection_prj_crs_line2d = intersection_polygon_crs_line2d
-            lIntersLine2dPrjCrs.append([rec_classification, intersection_prj_crs_line2d])
+        # create 3D intersection lines with the source DEMs
 
-        # create Point lists from intersection with source DEM
+        profiles_outcrops = drape_profiles_intersections(geoprofiles,
+                                                         profiles_intersections,
+                                                         on_the_fly_projection,
+                                                         project_crs)
 
         polygon_classification_set = set()
-        sect_pt_1, sect_pt_2 = geoprofile.original_line.pts
-        formation_list = []
-        intersection_line3d_list = []
-        intersection_polygon_s_list2 = []
-        for polygon_classification, line2d in lIntersLine2dPrjCrs:
-            polygon_classification_set.add(polygon_classification)
-
-            lptIntersPts3d = intersect_with_dem(demLayer, demParams, on_the_fly_projection, project_crs, line2d.pts)
-            lineIntersectionLine3d = Line(lptIntersPts3d)
-
-            s0_list = lineIntersectionLine3d.incremental_length_2d()
-            s_start = sect_pt_1.dist_2d(lineIntersectionLine3d.pts[0])
-            s_list = [s + s_start for s in s0_list]
-
-            formation_list.append(polygon_classification)
-            intersection_line3d_list.append(lineIntersectionLine3d)
-            intersection_polygon_s_list2.append(s_list)
-
-        if len(intersection_polygon_s_list2) == 0:
-            warn(self,
-                 self.plugin_name,
-                 "No reprojected intersection")
-            return
+        for formation_list, _, _ in profiles_outcrops:
+            polygon_classification_set.update(formation_list)
 
         # create windows for user_definition of intersection colors in profile
         if polygon_classification_set != set() and polygon_classification_set != set([None]):
@@ -2202,7 +2337,21 @@ class qprof_QWidget(QWidget):
         else:
             self.polygon_classification_colors = None
 
-        geoprofile.add_intersections_lines(formation_list, intersection_line3d_list, intersection_polygon_s_list2)
+        outcrops_parameters = dict(classification_field_ndx=inters_polygon_classifaction_field_ndx)
+        outcrops_input = GeologicalInput(polygon_layer.id(),
+                                         outcrops_parameters,
+                                         geological_fingerprint(self.input_geoprofiles_fingerprint,
+                                                                polygon_layer,
+                                                                outcrops_parameters))
+
+        for geoprofile, (formation_list, intersection_line3d_list, intersection_polygon_s_list2) in zip(geoprofiles,
+                                                                                                       profiles_outcrops):
+            geoprofile.add_intersections_lines(formation_list,
+                                               intersection_line3d_list,
+                                               intersection_polygon_s_list2,
+                                               outcrops_input)
+
+        self.save_profiles_cache()
 
         # plot profiles
         plot_addit_params = dict()
@@ -2253,27 +2402,37 @@ class qprof_QWidget(QWidget):
 
         on_the_fly_projection, project_crs = get_on_the_fly_projection(self.canvas)
 
+        # candidate lines, from the layer spatial index and within the profile corridor extent
+        profile_line2d_prjcrs_densif = geoprofile.original_line.densify_2d_line(geoprofile.sample_distance)
+        candidate_fids = profile_candidate_fids(structural_line_layer,
+                                                profile_line2d_prjcrs_densif,
+                                                on_the_fly_projection,
+                                                project_crs,
+                                                geoprofile.sample_distance)
+        corridor_rect = profile_corridor_rect(structural_line_layer,
+                                              profile_line2d_prjcrs_densif,
+                                              on_the_fly_projection,
+                                              project_crs,
+                                              geoprofile.sample_distance)
+
         # read structural line values
         if intersection_line_id_field_ndx == -1:
             id_list = None
         else:
-            id_list = field_values(structural_line_layer, intersection_line_id_field_ndx)
+            id_list = field_values(structural_line_layer, intersection_line_id_field_ndx, candidate_fids, corridor_rect)
 
         line_proj_crs_MultiLine2D_list = extract_multiline2d_list(structural_line_layer, on_the_fly_projection,
-                                                                       project_crs)
+                                                                       project_crs, candidate_fids, corridor_rect)
 
-        # calculated Point intersection list
-        intersection_point_id_list = calculate_profile_lines_intersection(line_proj_crs_MultiLine2D_list,
-                                                                          id_list,
-                                                                          geoprofile.original_line)
-
-        # sort intersection points by spat_distance from profile start point
-        lstDistancesFromProfileStart = intersection_distances_by_profile_start_list(geoprofile.original_line,
-                                                                                         intersection_point_id_list)
+        # calculated intersections, with their distances from profile start point
+        inters_pts, _, _, lstIntersectionIds, inters_profile_s = profile_lines_intersections(
+            line_proj_crs_MultiLine2D_list,
+            id_list,
+            geoprofile.original_line)
+        lstDistancesFromProfileStart = inters_profile_s.tolist()
 
         # create CartesianPoint from intersection with source DEM
-        lstIntersectionPoints = [pt2d for pt2d, _ in intersection_point_id_list]
-        lstIntersectionIds = [id for _, id in intersection_point_id_list]
+        lstIntersectionPoints = [Point(x, y) for x, y in inters_pts.tolist()]
         lstIntersectionPoints3d = intersect_with_dem(demLayer, demParams, on_the_fly_projection, project_crs,
                                                             lstIntersectionPoints)
         lstIntersectionColors = [color] * len(lstIntersectionPoints)
@@ -2402,7 +2561,7 @@ class qprof_QWidget(QWidget):
                     'trend field': str(self.proj_point_indivax_trend_fld_comboBox.currentText()),
                     'plunge field': str(self.proj_point_indivax_plunge_fld_comboBox.currentText())}
 
-    def check_for_struc_process(self, single_segment_constrain=True):
+    def check_for_struc_process(self, single_segment_constrain=True, single_profile_constrain=True):
 
         def check_post_profile():
 
@@ -2422,7 +2581,7 @@ class qprof_QWidget(QWidget):
 
         # check that just one profile is set
 
-        if self.input_geoprofiles.geoprofiles_num != 1:
+        if single_profile_constrain and self.input_geoprofiles.geoprofiles_num != 1:
             warn(self,
                  self.plugin_name,
                  "Profile lines must be one and just one")
@@ -2442,11 +2601,12 @@ class qprof_QWidget(QWidget):
 
         # check that source dem is just one
 
-        if len(geoprofile.topo_profiles.profile_s3ds) != 1:
-            warn(self,
-                 self.plugin_name,
-                 "One (and only) topographic surface has to be used in the profile section")
-            return False
+        for geoprofile in self.input_geoprofiles.geoprofiles:
+            if len(geoprofile.topo_profiles.profile_s3ds) != 1:
+                warn(self,
+                     self.plugin_name,
+                     "One (and only) topographic surface has to be used in the profile section")
+                return False
 
         return True
 
@@ -2483,8 +2643,9 @@ class qprof_QWidget(QWidget):
         # retrieve selected structural points with their attributes
         structural_pts_attrs = pt_geoms_attrs(structural_layer, structural_field_list)
 
-        # list of structural points with original crs
-        struct_pts_in_orig_crs = [Point(float(rec[0]), float(rec[1])) for rec in structural_pts_attrs]
+        # coordinates of structural points with original crs
+        struct_pts_xs = np.array([rec[0] for rec in structural_pts_attrs], dtype=np.float64)
+        struct_pts_ys = np.array([rec[1] for rec in structural_pts_attrs], dtype=np.float64)
 
         # IDs of structural points
         struct_pts_ids = [rec[2] for rec in structural_pts_attrs]
@@ -2499,10 +2660,12 @@ class qprof_QWidget(QWidget):
             return
 
         geoprofile = self.input_geoprofiles.geoprofile(0)
-        struct_pts_3d = calculate_projected_3d_pts(self.canvas,
-                                                   struct_pts_in_orig_crs,
-                                                   structural_layer_crs,
-                                                   geoprofile.topo_profiles.dem_params[0])
+        struct_pts_prj_xs, struct_pts_prj_ys, struct_pts_zs = projected_3d_arrays(self.canvas,
+                                                                                   struct_pts_xs,
+                                                                                   struct_pts_ys,
+                                                                                   structural_layer_crs,
+                                                                                   geoprofile.topo_profiles.dem_params[0])
+        struct_pts_3d = [Point(x, y, z) for (x, y, z) in zip(struct_pts_prj_xs, struct_pts_prj_ys, struct_pts_zs)]
 
         # - zip together the point value data sets                     
         assert len(struct_pts_3d) == len(structural_planes)
@@ -2523,8 +2686,35 @@ class qprof_QWidget(QWidget):
             mapping_method['individual_axes_values'] = vect_attrs(structural_layer,
                                                                   [trend_field_name, plunge_field_name])
 
-        geoprofile.add_plane_attitudes(map_struct_pts_on_section(structural_data, self.section_data, mapping_method))
+        # the individual axes are read from the layer, so they are covered by the layer fingerprint
+        attitudes_parameters = dict(fields=structural_field_list,
+                                    rhr_strike=isRHRStrike,
+                                    mapping_method=dict((key, value) for key, value in mapping_method.items()
+                                                        if key != 'individual_axes_values'))
+        attitudes_input = GeologicalInput(structural_layer.id(),
+                                          attitudes_parameters,
+                                          geological_fingerprint(self.input_geoprofiles_fingerprint,
+                                                                 structural_layer,
+                                                                 attitudes_parameters))
+
+        try:
+            plane_attitudes = map_struct_pts_on_section(structural_data, self.section_data, mapping_method)
+        except FunInputException as e:
+            warn(self,
+                 self.plugin_name,
+                 str(e))
+            return
+
+        unmapped_num = len(structural_data) - sum(1 for plane_attitude in plane_attitudes
+                                                  if np.isfinite(plane_attitude.sign_hor_dist))
+        if unmapped_num > 0:
+            warn(self,
+                 self.plugin_name,
+                 "{} of {} measures cannot be mapped onto the section".format(unmapped_num, len(structural_data)))
+
+        geoprofile.add_plane_attitudes(plane_attitudes, attitudes_input)
         self.plane_attitudes_colors.append(color)
+        self.save_profiles_cache()
 
         # plot profiles
 
@@ -2544,6 +2734,7 @@ class qprof_QWidget(QWidget):
         try:
             geoprofile = self.input_geoprofiles.geoprofile(0)
             geoprofile.geoplane_attitudes = []
+            geoprofile.geoplane_attitudes_inputs = []
             self.plane_attitudes_colors = []
         except:
             pass
@@ -2609,77 +2800,39 @@ class qprof_QWidget(QWidget):
         densified_proj_crs_MultiLine2D_list = [multiline_2d.densify_2d_multiline(densify_proj_crs_distance) for multiline_2d in
                                                line_proj_crs_MultiLine2D_list]
 
+        # all the vertices as a single array, with offsets describing the multiline structure
+        proj_crs_pts, line_offsets, multiline_offsets = multilines_to_array(densified_proj_crs_MultiLine2D_list)
+        proj_crs_xs, proj_crs_ys = proj_crs_pts[:, 0], proj_crs_pts[:, 1]
+
         # project to Dem CRS
         if on_the_fly_projection and demParams.crs != project_crs:
-            densified_dem_crs_MultiLine2D_list = [multiline_2d.crs_project(project_crs, demParams.crs) for
-                                                  multiline_2d in densified_proj_crs_MultiLine2D_list]
+            dem_crs_xs, dem_crs_ys = project_xy_arrays(proj_crs_xs, proj_crs_ys, project_crs, demParams.crs)
         else:
-            densified_dem_crs_MultiLine2D_list = densified_proj_crs_MultiLine2D_list
+            dem_crs_xs, dem_crs_ys = proj_crs_xs, proj_crs_ys
 
         # interpolate z values from Dem
-        z_list = [interpolate_z(demLayer, demParams, pt_2d) for multiline_2d in densified_dem_crs_MultiLine2D_list
-                  for line_2d in multiline_2d.lines for pt_2d in line_2d.pts]
-
-        # extract x-y pairs for creation of 3D points
-        xy_list = [(pt_2d.x, pt_2d.y) for multiline_2d in densified_proj_crs_MultiLine2D_list for line_2d in
-                   multiline_2d.lines for pt_2d in line_2d.pts]
-
-        # replicate MultiLine list structure with 3D points with project CRS
-        ndx = -1
-        multiline_3d_proj_crs_list = []
-        for multiline_2d in densified_proj_crs_MultiLine2D_list:
-            multiline_3d_list = []
-            for line_2d in multiline_2d.lines:
-                line_3d_pts_list = []
-                for _ in line_2d.pts:
-                    ndx += 1
-                    line_3d_pts_list.append(Point(xy_list[ndx][0], xy_list[ndx][1], z_list[ndx]))
-                multiline_3d_list.append(Line(line_3d_pts_list))
-            multiline_3d_proj_crs_list.append(MultiLine(multiline_3d_list))
-
-        # create projection vector        
+        zs = interpolate_z_array(demLayer,
+                                 demParams,
+                                 dem_crs_xs,
+                                 dem_crs_ys)
+
+        # create projection vector
         trend = float(self.common_axis_line_trend_SpinBox.value())
         plunge = float(self.common_axis_line_plunge_SpinBox.value())
-        axis_versor = GAxis(trend, plunge).as_vect().versor
-        l, m, n = axis_versor.x, axis_versor.y, axis_versor.z
 
         # calculation of Cartesian plane expressing section plane        
         self.section_data = self.calculate_section_data()
 
-        # project CartesianMultiLine3DT points to section
-        intersection_point_list = []
-        for multiline_3d in multiline_3d_proj_crs_list:
-            for line_3d in multiline_3d.lines:
-                for pt_3d in line_3d.pts:
-                    srcPt = pt_3d
-                    param_line = ParamLine3D(srcPt, l, m, n)
-                    intersection_point_list.append(param_line.intersect_cartes_plane(self.section_data['cartes_plane']))
-
-        # replicate MultiLine list structure with 3D points with project CRS
-        ndx = -1
-        multiline_3d_proj_crs_section_list = []
-        for multiline_3d in multiline_3d_proj_crs_list:
-            multiline_3d_list = []
-            for line_3d in multiline_3d.lines:
-                line_3d_pts_list = []
-                for _ in line_3d.pts:
-                    ndx += 1
-                    line_3d_pts_list.append(intersection_point_list[ndx])
-                multiline_3d_list.append(Line(line_3d_pts_list))
-            multiline_3d_proj_crs_section_list.append(MultiLine(multiline_3d_list))
-
-        section_start_point, section_vector = self.section_data['init_pt'], self.section_data['vector']
-        curves_2d_list = []
-        for multiline_3d in multiline_3d_proj_crs_section_list:
-            multiline_2d_list = []
-            for line_3d in multiline_3d.lines:
-                line_2d_pts_list = []
-                for pt_3d in line_3d.pts:
-                    s = calculate_distance_with_sign(pt_3d, section_start_point, section_vector)
-                    z = pt_3d.z
-                    line_2d_pts_list.append(Point(s, z))
-                multiline_2d_list.append(Line(line_2d_pts_list))
-            curves_2d_list.append(MultiLine(multiline_2d_list))
+        # project the 3D points to section, along the axis
+        section_pts, section_s = project_pts_on_section_along_axis(np.column_stack((proj_crs_xs, proj_crs_ys, zs)),
+                                                                   self.section_data,
+                                                                   trend,
+                                                                   plunge)
+
+        section_sz = np.full((section_s.size, 3), np.nan)
+        section_sz[:, 0] = section_s
+        section_sz[:, 1] = section_pts[:, 2]
+        curves_2d_list = multilines_from_array(section_sz, line_offsets, multiline_offsets)
 
         geoprofile.add_curves(curves_2d_list, id_list)
 
@@ -3011,8 +3164,7 @@ class qprof_QWidget(QWidget):
                 return ""
 
         try:
-            geoprofile = self.input_geoprofiles.geoprofile(0)
-            num_intersection_lines = len(geoprofile.outcrops)
+            num_intersection_lines = sum(len(geoprofile.outcrops) for geoprofile in self.input_geoprofiles.geoprofiles)
         except:
             warn(self,
                      self.plugin_name,
@@ -3065,21 +3217,24 @@ class qprof_QWidget(QWidget):
     def output_profile_polygons_intersections(self, output_format, output_filepath, sr):
 
         # definition of field names
-        header_list = ['class_fld',
+        header_list = ['prof_id',
+                       'prof_label',
+                       'class_fld',
                        's',
                        'x',
                        'y',
                        'z']
 
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        intersection_lines = geoprofile.outcrops
+        profiles_intersection_lines = [geoprofile.outcrops for geoprofile in self.input_geoprofiles.geoprofiles]
 
         # output for csv file
         if output_format == "csv":
             success, msg = write_intersection_line_csv(
                 output_filepath,
                 header_list,
-                intersection_lines)
+                self.profiles_labels,
+                self.profiles_order,
+                profiles_intersection_lines)
             if not success:
                 warn(self,
                      self.plugin_name,
@@ -3088,7 +3243,9 @@ class qprof_QWidget(QWidget):
             success, msg = write_intersection_polygon_lnshp(
                 output_filepath,
                 header_list,
-                intersection_lines,
+                self.profiles_labels,
+                self.profiles_order,
+                profiles_intersection_lines,
                 sr)
             if not success:
                 warn(self,
@@ -3103,6 +3260,34 @@ class qprof_QWidget(QWidget):
                  self.plugin_name,
                  "Polygon intersections saved")
 
+    def profiles_cache_path(self):
+        """
+        Path of the profiles cache file of the current project.
+
+        :return: str
+        """
+
+        return geoprofiles_cache_path(os.path.join(QgsApplication.qgisSettingsDirPath(), profiles_cache_dirname),
+                                      QgsProject.instance().fileName())
+
+    def save_profiles_cache(self):
+        """
+        Save the current DEM-line profiles, with their plane attitudes and outcrops, into the profiles cache.
+        A failed save only means that the profiles will be recomputed.
+        """
+
+        if self.input_geoprofiles_fingerprint is None or self.input_geoprofiles.geoprofiles_num == 0:
+            return
+
+        try:
+            save_geoprofiles(self.input_geoprofiles,
+                             self.profiles_cache_path(),
+                             self.input_geoprofiles_fingerprint,
+                             self.plane_attitudes_colors,
+                             self.polygon_classification_colors)
+        except (IOError, OSError, ValueError):
+            pass
+
     def closeEvent(self, event):
 
         def reset_profile_defs():
@@ -3176,6 +3361,27 @@ class qprof_QWidget(QWidget):
         except:
             pass
 
+        try:
+            QgsProject.instance().layerWillBeRemoved[str].disconnect(dem_tile_cache.invalidate)
+            QgsProject.instance().layerWillBeRemoved[str].disconnect(clear_dem_samplers)
+        except:
+            pass
+
+        try:
+            QgsProject.instance().transformContextChanged.disconnect(clear_coordinate_transforms)
+        except:
+            pass
+
+        try:
+            self.save_profiles_cache()
+        except:
+            pass
+
+        dem_tile_cache.clear()
+        clear_dem_samplers()
+        profile_samples_memo.clear()
+        clear_coordinate_transforms()
+
 
 class SourceDEMsDialog(QDialog):
 
@@ -719,18 +719,27 @@ def write_geological_attitudes_ptshp(
 def write_intersection_line_csv(
         output_filepath,
         header_list,
-        parsed_results,
+        labels,
+        orders,
+        multiprofile_results,
         sep=","
 ):
 
+    labels, orders = preprocess_labels(
+        labels,
+        orders,
+        multiprofile_results
+    )
+
     try:
         with open(str(output_filepath), 'w') as f:
             f.write(sep.join(header_list) + '\n')
-            for classification, line3d, s_list in parsed_results:
-                for pt, s in zip(line3d.pts, s_list):
-                    out_values = [classification, s, pt.x, pt.y, pt.z]
-                    out_val_strings = [str(val) for val in out_values]
-                    f.write(sep.join(out_val_strings) + '\n')
+            for prof_ndx, profile_label, parsed_results in zip(orders, labels, multiprofile_results):
+                for classification, line3d, s_list in parsed_results:
+                    for pt, s in zip(line3d.pts, s_list):
+                        out_values = [prof_ndx, profile_label, classification, s, pt.x, pt.y, pt.z]
+                        out_val_strings = [str(val) for val in out_values]
+                        f.write(sep.join(out_val_strings) + '\n')
         return True, "done"
     except Exception as e:
         return False, e
@@ -795,10 +804,18 @@ def write_intersection_line_ptshp(
 def write_intersection_polygon_lnshp(
         fileName,
         header_list,
-        intersline_results,
+        labels,
+        orders,
+        multiprofile_results,
         sr
 ):
 
+    labels, orders = preprocess_labels(
+        labels,
+        orders,
+        multiprofile_results
+    )
+
     shape_driver_name = "ESRI Shapefile"
     shape_driver = ogr.GetDriverByName(shape_driver_name)
     if shape_driver is None:
@@ -817,37 +834,46 @@ def write_intersection_polygon_lnshp(
         return False, "Output layer creation failed"
 
     # creates required fields
-    layer.CreateField(ogr.FieldDefn(header_list[0], ogr.OFTString))
-    layer.CreateField(ogr.FieldDefn(header_list[1], ogr.OFTReal))
+    layer.CreateField(ogr.FieldDefn(header_list[0], ogr.OFTInteger))  # prof ndx
+    labelsFldDef = ogr.FieldDefn(header_list[1], ogr.OFTString)
+    labelsFldDef.SetWidth(255)
+    layer.CreateField(labelsFldDef)
+    layer.CreateField(ogr.FieldDefn(header_list[2], ogr.OFTString))
+    layer.CreateField(ogr.FieldDefn(header_list[3], ogr.OFTReal))
 
     featureDefn = layer.GetLayerDefn()
 
     # loops through output records
 
-    for classification, line3d, s_list in intersline_results:
+    for prof_ndx, profile_label, intersline_results in zip(orders, labels, multiprofile_results):
 
-        assert len(line3d.pts) == len(s_list)
+        for classification, line3d, s_list in intersline_results:
 
-        # loops through output records
+            line3d_pts = line3d.pts
+            assert len(line3d_pts) == len(s_list)
 
-        for ndx in range(len(line3d.pts) - 1):
-            rec_a = line3d.pts[ndx]
-            rec_b = line3d.pts[ndx + 1]
+            # loops through output records
 
-            x0, y0, z0 = rec_a.x, rec_a.y, rec_a.z
-            x1, y1, z1 = rec_b.x, rec_b.y, rec_b.z
-            s = s_list[ndx + 1]
+            for ndx in range(len(line3d_pts) - 1):
+                rec_a = line3d_pts[ndx]
+                rec_b = line3d_pts[ndx + 1]
 
-            ln_feature = ogr.Feature(featureDefn)
-            segment_3d = ogr.CreateGeometryFromWkt('LINESTRING(%f %f %f, %f %f %f)' % (x0, y0, z0, x1, y1, z1))
-            ln_feature.SetGeometry(segment_3d)
+                x0, y0, z0 = rec_a.x, rec_a.y, rec_a.z
+                x1, y1, z1 = rec_b.x, rec_b.y, rec_b.z
+                s = s_list[ndx + 1]
 
-            ln_feature.SetField(header_list[0], str(classification))
-            ln_feature.SetField(header_list[1], s)
+                ln_feature = ogr.Feature(featureDefn)
+                segment_3d = ogr.CreateGeometryFromWkt('LINESTRING(%f %f %f, %f %f %f)' % (x0, y0, z0, x1, y1, z1))
+                ln_feature.SetGeometry(segment_3d)
 
-            layer.CreateFeature(ln_feature)
+                ln_feature.SetField(header_list[0], prof_ndx)
+                ln_feature.SetField(header_list[1], profile_label)
+                ln_feature.SetField(header_list[2], str(classification))
+                ln_feature.SetField(header_list[3], s)
 
-            ln_feature.Destroy()
+                layer.CreateFeature(ln_feature)
+
+                ln_feature.Destroy()
 
     datasource.Destroy()
 
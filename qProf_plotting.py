@@ -9,7 +9,7 @@ from matplotlib import gridspec
 
 from.gis_utils.qgs_tools import qcolor2rgbmpl
 from .gis_utils.profile import define_plot_structural_segment
-from .mpl_utils.mpl_widget import MplWidget, plot_line, plot_filled_line
+from .mpl_utils.mpl_widget import MplWidget, plot_line, plot_filled_line, plot_envelope
 
 
 colors_addit = ["darkseagreen", "darkgoldenrod", "darkviolet", "hotpink", "powderblue", "yellowgreen",
@@ -131,6 +131,35 @@ def plot_geoprofiles(geoprofiles, plot_addit_params, slope_padding=0.2):
 
         s = topo_profiles.profile_s
 
+        # swath envelopes: min-max range, outer percentiles range and mean
+
+        if topo_type == 'elevation' and topo_profiles.profile_swaths:
+
+            for swath, topoline_color, topoline_visibility in zip(topo_profiles.profile_swaths, topoline_colors, topoline_visibilities):
+
+                if topoline_visibility:
+
+                    swath_color = qcolor2rgbmpl(topoline_color)
+
+                    plot_envelope(
+                        axes,
+                        s,
+                        swath.min_zs,
+                        swath.max_zs,
+                        swath_color,
+                        alpha=0.15)
+
+                    if len(swath.percentile_zs) > 1:
+                        plot_envelope(
+                            axes,
+                            s,
+                            swath.percentile_zs[0],
+                            swath.percentile_zs[-1],
+                            swath_color,
+                            alpha=0.3)
+
+                    axes.plot(s, swath.mean_zs, '--', color=swath_color, linewidth=0.5)
+
         for y, topoline_color, topoline_visibility in zip(ys, topoline_colors, topoline_visibilities):
 
             if topoline_visibility:
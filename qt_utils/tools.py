@@ -17,6 +17,11 @@ def warn(parent, header, msg):
 def error(parent, header, msg):
 
     QMessageBox.error(parent, header, str(msg))
+
+
+def confirm(parent, header, msg):
+
+    return QMessageBox.question(parent, header, str(msg), QMessageBox.Yes | QMessageBox.No, QMessageBox.No) == QMessageBox.Yes
     
     
 def update_ComboBox(combobox, init_choice, names):
@@ -0,0 +1,94 @@
+"""
+Shared setup and fakes of the tests.
+
+The plugin folder is registered as the 'qProf' package without executing
+its __init__, that imports QGIS: the QGIS-free modules, including the ones
+with relative imports between sub-packages (e.g. '..gsf'),
+can then be imported as 'qProf.<sub-package>.<module>'.
+"""
+
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+
+plugin_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "qProf" not in sys.modules:
+    plugin_package = types.ModuleType("qProf")
+    plugin_package.__path__ = [plugin_dir]
+    sys.modules["qProf"] = plugin_package
+
+
+from qProf.gis_utils.dem_interpolation import GridInterpolator
+from qProf.gis_utils.raster_backends import RasterBackend, aggregate_cells
+
+
+class ArrayInterpolator(GridInterpolator):
+    """
+    Interpolator over an in-memory array, with array row 0 at the top of the grid.
+    """
+
+    def __init__(self, params, array):
+
+        super(ArrayInterpolator, self).__init__(params)
+        self.array = array
+
+    def cell_values(self, cols, rows):
+
+        values = np.full(cols.shape, np.nan)
+        inside = (0 <= cols) & (cols < self.params.cols) & (0 <= rows) & (rows < self.params.rows)
+        values[inside] = self.array[self.params.rows - 1 - rows[inside], cols[inside]]
+
+        return values
+
+
+class ArrayRasterBackend(RasterBackend):
+    """
+    Raster backend over an in-memory array, counting the window reads.
+    """
+
+    def __init__(self, params, array):
+
+        super(ArrayRasterBackend, self).__init__(params)
+        self.array = array
+        self.reads = 0
+
+    def read_window(self, col_start, top_row_start, cols, rows, decimation=1):
+
+        self.reads += 1
+
+        source_col_start, source_col_end, source_top_row_start, source_top_row_end = \
+            self.source_window(col_start, top_row_start, cols, rows, decimation)
+
+        source = self.array[source_top_row_start:source_top_row_end, source_col_start:source_col_end]
+        if decimation > 1:
+            source = aggregate_cells(source, decimation)
+
+        window = np.full((rows, cols), np.nan)
+        window_col = source_col_start // decimation - col_start
+        window_row = source_top_row_start // decimation - top_row_start
+        window[window_row:window_row + source.shape[0], window_col:window_col + source.shape[1]] = source
+
+        return self.mask_nodata(window)
+
+
+@pytest.fixture
+def array_interpolator():
+    """
+    Factory of interpolators over in-memory arrays.
+    """
+
+    return ArrayInterpolator
+
+
+@pytest.fixture
+def array_raster_backend():
+    """
+    Factory of raster backends over in-memory arrays.
+    """
+
+    return ArrayRasterBackend
@@ -0,0 +1,116 @@
+from math import floor, ceil
+
+import numpy as np
+import pytest
+
+from qProf.gis_utils.dem_interpolation import GridParameters, overview_decimation_factor
+
+
+def point_z(params, array, x, y):
+    """
+    Value of the cell containing a point, as the former per-point identify() query.
+    """
+
+    col = min(int(floor((x - params.xMin) / params.cellsizeEW)), params.cols - 1)
+    row = min(int(floor((y - params.yMin) / params.cellsizeNS)), params.rows - 1)
+
+    return array[params.rows - 1 - row, col]
+
+
+def point_interpolate_z(params, array, x, y):
+    """
+    Point-by-point interpolation, as done before the array version.
+    """
+
+    if params.xMin + params.cellsizeEW / 2.0 <= x <= params.xMax - params.cellsizeEW / 2.0 and \
+       params.yMin + params.cellsizeNS / 2.0 <= y <= params.yMax - params.cellsizeNS / 2.0:
+
+        raster_x = (x - (params.xMin + params.cellsizeEW / 2.0)) / params.cellsizeEW
+        raster_y = (y - (params.yMin + params.cellsizeNS / 2.0)) / params.cellsizeNS
+
+        def center(col, row):
+            return params.xMin + (col + 0.5) * params.cellsizeEW, params.yMin + (row + 0.5) * params.cellsizeNS
+
+        p1 = center(floor(raster_x), floor(raster_y))
+        p2 = center(ceil(raster_x), floor(raster_y))
+        p3 = center(floor(raster_x), ceil(raster_y))
+        p4 = center(ceil(raster_x), ceil(raster_y))
+
+        z1, z2, z3, z4 = [point_z(params, array, px, py) for px, py in (p1, p2, p3, p4)]
+
+        delta_x = x - p1[0]
+        delta_y = y - p1[1]
+
+        z_x_a = z1 + (z2 - z1) * delta_x / params.cellsizeEW
+        z_x_b = z3 + (z4 - z3) * delta_x / params.cellsizeEW
+
+        return z_x_a + (z_x_b - z_x_a) * delta_y / params.cellsizeNS
+
+    elif params.xMin <= x <= params.xMax and params.yMin <= y <= params.yMax:
+
+        return point_z(params, array, x, y)
+
+    else:
+
+        return np.nan
+
+
+class TestGridInterpolator(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, array_interpolator):
+
+        rng = np.random.RandomState(7)
+        self.array = rng.uniform(0.0, 500.0, (40, 60))
+        self.array[12, 33] = np.nan
+        self.params = GridParameters("dem", 10.0, 5.0, 40, 60, 1000.0, 1600.0, 2000.0, 2200.0, -9999.0)
+        self.interpolator = array_interpolator(self.params, self.array)
+
+    def test_bilinear_matches_point_by_point(self):
+
+        rng = np.random.RandomState(11)
+        xs = rng.uniform(990.0, 1610.0, 2000)
+        ys = rng.uniform(1995.0, 2205.0, 2000)
+
+        zs = self.interpolator.interpolate_z_array(xs, ys)
+        expected = np.array([point_interpolate_z(self.params, self.array, x, y) for x, y in zip(xs, ys)])
+
+        np.testing.assert_allclose(zs, expected, rtol=1e-12, atol=1e-9, equal_nan=True)
+
+    def test_cell_centers_and_boundary_band(self):
+
+        xs = np.array([1005.0, 1595.0, 1001.0, 1599.0])
+        ys = np.array([2197.5, 2002.5, 2100.0, 2001.0])
+
+        zs = self.interpolator.interpolate_z_array(xs, ys)
+
+        assert zs[0] == pytest.approx(self.array[0, 0])
+        assert zs[1] == pytest.approx(self.array[39, 59])
+        assert zs[2] == pytest.approx(point_z(self.params, self.array, 1001.0, 2100.0))
+        assert zs[3] == pytest.approx(self.array[39, 59])
+
+    def test_outside_grid_is_nan(self):
+
+        zs = self.interpolator.interpolate_z_array(np.array([999.0, 1300.0]), np.array([2100.0, 2200.1]))
+
+        assert np.isnan(zs).all()
+
+
+class TestOverviewDecimationFactor(object):
+
+    def setup_method(self):
+
+        self.params = GridParameters("dem", 1.0, 1.0, 1000, 1000, 0.0, 1000.0, 0.0, 1000.0, None)
+
+    def test_no_decimation_without_ratio(self):
+
+        assert overview_decimation_factor(self.params, 40.0, 0.0) == 1
+
+    def test_coarsest_level(self):
+
+        assert overview_decimation_factor(self.params, 40.0, 4.0) == 8
+
+    def test_existing_levels_only(self):
+
+        assert overview_decimation_factor(self.params, 40.0, 4.0, set()) == 1
+        assert overview_decimation_factor(self.params, 40.0, 4.0, {2, 4, 16}) == 4
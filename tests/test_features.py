@@ -0,0 +1,226 @@
+import numpy as np
+
+from qProf.gsf.geometry import Point
+from qProf.gis_utils.features import Line, MultiLine, segments_intersections_2d, distances_along_line, \
+    multilines_to_array, multilines_from_array, multilines_segments, not_coincident_mask
+
+
+def intersections(segments_a, segments_b, half_open_a=None):
+
+    segments_a = np.asarray(segments_a, dtype=np.float64)
+    segments_b = np.asarray(segments_b, dtype=np.float64)
+
+    return segments_intersections_2d(segments_a[:, 0], segments_a[:, 1], segments_b[:, 0], segments_b[:, 1],
+                                     half_open_a)
+
+
+class TestNotCoincidentMask(object):
+
+    def test_points_are_compared_with_the_last_kept_point(self):
+
+        # each point is near its previous one, but drifts away from the first one
+        pts = np.zeros((4, 4))
+        pts[:, 0] = [0.0, 0.6e-10, 1.2e-10, 1.8e-10]
+
+        assert not_coincident_mask(pts).tolist() == [True, False, True, False]
+
+    def test_points_with_undefined_distances_are_removed(self):
+
+        pts = np.array([[0.0, 0.0, 0.0, 0.0],
+                        [np.nan, 1.0, 0.0, 0.0],
+                        [0.0, 0.0, 0.0, 0.0],
+                        [0.0, 0.0, np.nan, 0.0],
+                        [1.0, 0.0, np.nan, 0.0]])
+
+        # the 2D distance of the last point is defined
+        assert not_coincident_mask(pts).tolist() == [True, False, False, False, True]
+
+    def test_matches_the_point_by_point_removal(self):
+
+        rng = np.random.RandomState(5)
+        pts = np.zeros((300, 4))
+        pts[:, :3] = np.cumsum(rng.choice([0.0, 0.4e-10, 1.0], size=(300, 3), p=[0.3, 0.5, 0.2]), axis=0)
+
+        kept_pts = [Point(*pts[0])]
+        expected_mask = [True]
+        for pt_values in pts[1:]:
+            pt = Point(*pt_values)
+            expected_mask.append(not pt.coincident(kept_pts[-1], 1e-10))
+            if expected_mask[-1]:
+                kept_pts.append(pt)
+
+        assert not_coincident_mask(pts, 1e-10).tolist() == expected_mask
+
+
+class TestLine(object):
+
+    def setup_method(self):
+
+        self.line = Line.from_arrays([0.0, 3.0, 3.0, 3.0], [0.0, 0.0, 0.0, 4.0], [0.0, 3.0, 3.0, 7.0])
+
+    def test_densify_restarts_at_the_vertices(self):
+
+        densified_line = self.line.densify_2d_line(2.0)
+
+        np.testing.assert_allclose(densified_line.x_array(), [0.0, 2.0, 3.0, 3.0, 3.0])
+        np.testing.assert_allclose(densified_line.y_array(), [0.0, 0.0, 0.0, 2.0, 4.0])
+        np.testing.assert_allclose(densified_line.z_array(), [0.0, 2.0, 3.0, 5.0, 7.0])
+
+    def test_continuous_densify_keeps_the_vertices(self):
+
+        densified_line = self.line.densify_2d_line(2.0, continuous=True)
+
+        np.testing.assert_allclose(densified_line.x_array(), [0.0, 2.0, 3.0, 3.0, 3.0, 3.0])
+        np.testing.assert_allclose(densified_line.y_array(), [0.0, 0.0, 0.0, 1.0, 3.0, 4.0])
+        np.testing.assert_allclose(densified_line.z_array(), [0.0, 2.0, 3.0, 4.0, 6.0, 7.0])
+
+    def test_incremental_lengths(self):
+
+        np.testing.assert_allclose(self.line.incremental_length_2d_array(), [0.0, 3.0, 3.0, 7.0])
+        np.testing.assert_allclose(self.line.incremental_length_3d_array(),
+                                   [0.0, np.sqrt(18.0), np.sqrt(18.0), np.sqrt(18.0) + np.sqrt(32.0)])
+
+    def test_slopes(self):
+
+        line = Line.from_arrays([0.0, 2.0, 2.0, 2.0, 4.0], [0.0, 0.0, 0.0, 0.0, 0.0], [0.0, 2.0, 5.0, 5.0, 5.0])
+
+        np.testing.assert_allclose(line.slopes_array(), [45.0, 90.0, np.nan, 0.0, np.nan])
+
+
+class TestMultilinesArray(object):
+
+    def setup_method(self):
+
+        self.multilines = [
+            MultiLine([Line.from_arrays([0.0, 1.0, 2.0], [0.0, 1.0, 0.0], [10.0, 11.0, np.nan]),
+                       Line(),
+                       Line.from_arrays([5.0, 6.0], [5.0, 6.0], [15.0, 16.0])]),
+            MultiLine(),
+            MultiLine([Line.from_arrays([7.0], [8.0], [9.0])])]
+
+    def test_round_trip(self):
+
+        pts_array, line_offsets, multiline_offsets = multilines_to_array(self.multilines)
+
+        assert pts_array.shape == (6, 4)
+        assert line_offsets.tolist() == [0, 3, 3, 5, 6]
+        assert multiline_offsets.tolist() == [0, 3, 3, 4]
+
+        multilines = multilines_from_array(pts_array, line_offsets, multiline_offsets)
+
+        assert [multiline.num_parts for multiline in multilines] == [3, 0, 1]
+        for multiline, original_multiline in zip(multilines, self.multilines):
+            for line, original_line in zip(multiline.lines, original_multiline.lines):
+                np.testing.assert_array_equal(line.array, original_line.array)
+
+    def test_round_trip_of_sz_arrays(self):
+
+        pts_array, line_offsets, multiline_offsets = multilines_to_array(self.multilines)
+
+        multilines = multilines_from_array(pts_array[:, :3], line_offsets, multiline_offsets)
+
+        np.testing.assert_array_equal(multilines[0].lines[0].z_array(), [10.0, 11.0, np.nan])
+        assert np.isnan(multilines[2].lines[0].array[:, 3]).all()
+
+    def test_no_multilines(self):
+
+        pts_array, line_offsets, multiline_offsets = multilines_to_array([])
+
+        assert pts_array.shape == (0, 4)
+        assert multilines_from_array(pts_array, line_offsets, multiline_offsets) == []
+
+    def test_segments_do_not_cross_the_lines(self):
+
+        pts_array, line_offsets, _ = multilines_to_array(self.multilines)
+
+        assert multilines_segments(pts_array, line_offsets).tolist() == [0, 1, 3]
+
+
+class TestSegmentsIntersections2D(object):
+
+    def test_crossing_segments(self):
+
+        ndxs_a, ndxs_b, ts, us = intersections([[[0.0, 0.0], [4.0, 4.0]], [[10.0, 0.0], [11.0, 0.0]]],
+                                               [[[0.0, 4.0], [4.0, 0.0]], [[0.0, 1.0], [4.0, 1.0]]])
+
+        assert ndxs_a.tolist() == [0, 0]
+        assert ndxs_b.tolist() == [0, 1]
+        np.testing.assert_allclose(ts, [0.5, 0.25])
+        np.testing.assert_allclose(us, [0.5, 0.25])
+
+    def test_parallel_segments_do_not_intersect(self):
+
+        ndxs_a, _, _, _ = intersections([[[0.0, 0.0], [4.0, 4.0]]], [[[0.0, 1.0], [4.0, 5.0]]])
+
+        assert ndxs_a.size == 0
+
+    def test_collinear_segments_do_not_intersect(self):
+
+        ndxs_a, _, _, _ = intersections([[[0.0, 0.0], [4.0, 0.0]]],
+                                        [[[2.0, 0.0], [6.0, 0.0]], [[4.0, 0.0], [5.0, 0.0]]])
+
+        assert ndxs_a.size == 0
+
+    def test_zero_length_segments_do_not_intersect(self):
+
+        ndxs_a, _, _, _ = intersections([[[0.0, 0.0], [4.0, 0.0]], [[2.0, 2.0], [2.0, 2.0]]],
+                                        [[[1.0, 0.0], [1.0, 0.0]], [[2.0, 1.0], [2.0, 3.0]]])
+
+        assert ndxs_a.size == 0
+
+    def test_endpoint_touching_segments_intersect(self):
+
+        ndxs_a, ndxs_b, ts, us = intersections([[[0.0, 0.0], [4.0, 0.0]]],
+                                               [[[2.0, 0.0], [2.0, 3.0]], [[4.0, 0.0], [6.0, 2.0]]])
+
+        assert ndxs_b.tolist() == [0, 1]
+        np.testing.assert_allclose(ts, [0.5, 1.0])
+        np.testing.assert_allclose(us, [0.0, 0.0])
+
+    def test_shared_vertices_of_half_open_segments_are_counted_once(self):
+
+        line_a = [[[0.0, 0.0], [2.0, 0.0]], [[2.0, 0.0], [4.0, 0.0]]]
+        segment_b = [[[2.0, -1.0], [2.0, 1.0]]]
+
+        assert intersections(line_a, segment_b)[0].tolist() == [0, 1]
+        assert intersections(line_a, segment_b, np.array([True, False]))[0].tolist() == [1]
+
+    def test_blocks_give_the_same_intersections(self):
+
+        rng = np.random.RandomState(21)
+        starts_a, ends_a = rng.uniform(0.0, 10.0, (30, 2)), rng.uniform(0.0, 10.0, (30, 2))
+        starts_b, ends_b = rng.uniform(0.0, 10.0, (20, 2)), rng.uniform(0.0, 10.0, (20, 2))
+
+        results = segments_intersections_2d(starts_a, ends_a, starts_b, ends_b)
+        block_results = segments_intersections_2d(starts_a, ends_a, starts_b, ends_b, max_pairs=50)
+
+        assert results[0].size > 0
+        for result, block_result in zip(results, block_results):
+            np.testing.assert_array_equal(block_result, result)
+
+
+class TestDistancesAlongLine(object):
+
+    def test_points_on_a_multi_vertex_line(self):
+
+        line = Line.from_arrays(np.array([0.0, 3.0, 3.0, 7.0]), np.array([0.0, 0.0, 4.0, 7.0]))
+
+        xs = np.array([0.0, 1.5, 3.0, 3.0, 5.0, 7.0])
+        ys = np.array([0.0, 0.0, 0.0, 2.0, 5.5, 7.0])
+
+        np.testing.assert_allclose(distances_along_line(line, xs, ys), [0.0, 1.5, 3.0, 5.0, 9.5, 12.0])
+
+    def test_points_are_located_on_their_nearest_segment(self):
+
+        # a line folding back near itself
+        line = Line.from_arrays(np.array([0.0, 10.0, 10.0, 0.0]), np.array([0.0, 0.0, 1.0, 1.0]))
+
+        distances = distances_along_line(line, np.array([4.0, 4.0]), np.array([0.0, 1.0]))
+
+        np.testing.assert_allclose(distances, [4.0, 17.0])
+
+    def test_repeated_vertices_are_ignored(self):
+
+        line = Line.from_arrays(np.array([0.0, 2.0, 2.0, 2.0]), np.array([0.0, 0.0, 0.0, 2.0]))
+
+        np.testing.assert_allclose(distances_along_line(line, np.array([2.0, 2.0]), np.array([0.0, 1.0])), [2.0, 3.0])
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pytest
+
+from qProf.gis_utils.errors import GPXIOException
+from qProf.gis_utils.gpx import read_gpx_track
+
+
+gpx_template = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <metadata><name>metadata name</name></metadata>
+  <trk>
+    <name>{name}</name>
+    <trkseg>
+{points}
+    </trkseg>
+  </trk>
+</gpx>
+"""
+
+
+class TestReadGpxTrack(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+
+        self.folder = str(tmp_path)
+
+    def gpx_file(self, points, name="track"):
+
+        path = os.path.join(self.folder, "track.gpx")
+        with open(path, "w") as gpx_file:
+            gpx_file.write(gpx_template.format(name=name, points="\n".join(points)))
+
+        return path
+
+    def test_complete_track(self):
+
+        path = self.gpx_file([
+            '<trkpt lat="45.1" lon="10.2"><ele>120.5</ele><time>2017-06-21T10:15:30Z</time></trkpt>',
+            '<trkpt lat="45.2" lon="10.3"><ele>125.0</ele><time>2017-06-21T10:15:40Z</time></trkpt>'])
+
+        name, lats, lons, elevs, times = read_gpx_track(path)
+
+        assert name == "track"
+        np.testing.assert_array_equal(lats, [45.1, 45.2])
+        np.testing.assert_array_equal(lons, [10.2, 10.3])
+        np.testing.assert_array_equal(elevs, [120.5, 125.0])
+        assert times.tolist() == ["2017-06-21T10:15:30Z", "2017-06-21T10:15:40Z"]
+
+    def test_missing_elevations_are_nan(self):
+
+        path = self.gpx_file([
+            '<trkpt lat="45.1" lon="10.2"><time>2017-06-21T10:15:30Z</time></trkpt>',
+            '<trkpt lat="45.2" lon="10.3"><ele></ele><time>2017-06-21T10:15:40Z</time></trkpt>',
+            '<trkpt lat="45.3" lon="10.4"><ele>130</ele><time>2017-06-21T10:15:50Z</time></trkpt>'])
+
+        _, lats, _, elevs, times = read_gpx_track(path)
+
+        assert lats.size == 3
+        assert np.isnan(elevs[:2]).all()
+        assert elevs[2] == 130.0
+        assert len(times) == 3
+
+    def test_missing_times_are_empty_strings(self):
+
+        path = self.gpx_file([
+            '<trkpt lat="45.1" lon="10.2"><ele>120.5</ele></trkpt>',
+            '<trkpt lat="45.2" lon="10.3"><ele>125.0</ele><time> 2017-06-21T10:15:40Z </time></trkpt>'])
+
+        _, _, _, elevs, times = read_gpx_track(path)
+
+        np.testing.assert_array_equal(elevs, [120.5, 125.0])
+        assert times.tolist() == ["", "2017-06-21T10:15:40Z"]
+
+    def test_track_without_points(self):
+
+        name, lats, lons, elevs, times = read_gpx_track(self.gpx_file([], name="empty"))
+
+        assert name == "empty"
+        assert (lats.size, lons.size, elevs.size, len(times)) == (0, 0, 0, 0)
+
+    def test_malformed_file(self):
+
+        path = os.path.join(self.folder, "broken.gpx")
+        with open(path, "w") as gpx_file:
+            gpx_file.write('<gpx><trk><trkseg><trkpt lat="45.1" lon="10.2"></trkseg></gpx>')
+
+        with pytest.raises(GPXIOException):
+            read_gpx_track(path)
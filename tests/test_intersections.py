@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from qProf.gsf.geometry import Point, GPlane, GAxis, Plane
+from qProf.gis_utils.errors import FunInputException
+from qProf.gis_utils.features import Segment, ParamLine3D
+from qProf.gis_utils.intersections import map_measure_to_section, map_struct_pts_on_section, \
+    project_pts_on_section_along_axis, calculate_distance_with_sign
+
+
+def section_data(start_xy, end_xy):
+
+    section_init_pt = Point(start_xy[0], start_xy[1], 0.0)
+    section_final_pt = Point(end_xy[0], end_xy[1], 0.0)
+    section_final_pt_up = Point(end_xy[0], end_xy[1], 1000.0)
+
+    return {'init_pt': section_init_pt,
+            'cartes_plane': Plane.from_points(section_init_pt, section_final_pt, section_final_pt_up),
+            'vector': Segment(section_init_pt, section_final_pt).vector()}
+
+
+class TestMapStructPtsOnSection(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+
+        rng = np.random.RandomState(19)
+
+        self.section_data = section_data((1000.0, 2000.0), (4000.0, 3500.0))
+
+        pts_num = 50
+        xs = rng.uniform(500.0, 4500.0, pts_num)
+        ys = rng.uniform(1500.0, 4000.0, pts_num)
+        zs = rng.uniform(0.0, 800.0, pts_num)
+        dip_dirs = rng.uniform(0.0, 360.0, pts_num)
+        dip_angles = rng.uniform(5.0, 85.0, pts_num)
+
+        self.structural_data = [(Point(x, y, z), GPlane(dip_dir, dip_angle), ndx) for ndx, (x, y, z, dip_dir, dip_angle)
+                                in enumerate(zip(xs, ys, zs, dip_dirs, dip_angles))]
+
+    def assert_matching(self, plane_attitudes, expected_attitudes):
+
+        assert len(plane_attitudes) == len(expected_attitudes)
+
+        for plane_attitude, expected in zip(plane_attitudes, expected_attitudes):
+            assert plane_attitude.id == expected.id
+            np.testing.assert_allclose([plane_attitude.pt_3d.x, plane_attitude.pt_3d.y, plane_attitude.pt_3d.z],
+                                       [expected.pt_3d.x, expected.pt_3d.y, expected.pt_3d.z], rtol=0.0, atol=1e-5)
+            np.testing.assert_allclose(plane_attitude.slope_rad, expected.slope_rad, rtol=0.0, atol=1e-9)
+            np.testing.assert_allclose(plane_attitude.sign_hor_dist, expected.sign_hor_dist, rtol=0.0, atol=1e-5)
+            assert plane_attitude.dwnwrd_sense == expected.dwnwrd_sense
+
+    def test_nearest_matches_the_single_measure_mapping(self):
+
+        plane_attitudes = map_struct_pts_on_section(self.structural_data, self.section_data, {'method': 'nearest'})
+
+        self.assert_matching(plane_attitudes,
+                             [map_measure_to_section(rec, self.section_data) for rec in self.structural_data])
+
+    def test_common_axis_matches_the_single_measure_mapping(self):
+
+        mapping_method = {'method': 'common axis', 'trend': 75.0, 'plunge': 20.0}
+
+        plane_attitudes = map_struct_pts_on_section(self.structural_data, self.section_data, mapping_method)
+
+        map_axis = GAxis(75.0, 20.0)
+        self.assert_matching(plane_attitudes,
+                             [map_measure_to_section(rec, self.section_data, map_axis) for rec in self.structural_data])
+
+    def test_individual_axes_match_the_single_measure_mapping(self):
+
+        axes_values = [(float(trend), 30.0) for trend in np.linspace(0.0, 350.0, len(self.structural_data))]
+        mapping_method = {'method': 'individual axes', 'individual_axes_values': axes_values}
+
+        plane_attitudes = map_struct_pts_on_section(self.structural_data, self.section_data, mapping_method)
+
+        self.assert_matching(plane_attitudes,
+                             [map_measure_to_section(rec, self.section_data, GAxis(trend, plunge))
+                              for rec, (trend, plunge) in zip(self.structural_data, axes_values)])
+
+    def test_unmappable_measures_are_kept_with_common_axis(self):
+
+        # a vertical axis never reaches the vertical section
+        mapping_method = {'method': 'common axis', 'trend': 0.0, 'plunge': 90.0}
+
+        plane_attitudes = map_struct_pts_on_section(self.structural_data[:3], self.section_data, mapping_method)
+
+        assert [plane_attitude.id for plane_attitude in plane_attitudes] == [0, 1, 2]
+        for plane_attitude in plane_attitudes:
+            assert np.isnan(plane_attitude.sign_hor_dist)
+            assert np.isnan(plane_attitude.pt_3d.x)
+
+    def test_invalid_individual_axes_are_skipped(self):
+
+        axes_values = [(30.0, 20.0), (None, 20.0), ("north", 10.0), (120.0, 45.0)]
+        mapping_method = {'method': 'individual axes', 'individual_axes_values': axes_values}
+
+        plane_attitudes = map_struct_pts_on_section(self.structural_data[:4], self.section_data, mapping_method)
+
+        assert [plane_attitude.id for plane_attitude in plane_attitudes] == [0, 3]
+
+    def test_unknown_method_raises(self):
+
+        with pytest.raises(FunInputException):
+            map_struct_pts_on_section(self.structural_data, self.section_data, {'method': 'farthest'})
+
+
+class TestProjectPtsOnSectionAlongAxis(object):
+
+    def test_matches_the_single_point_projection(self):
+
+        rng = np.random.RandomState(20)
+        pts = np.column_stack((rng.uniform(0.0, 5000.0, 40), rng.uniform(0.0, 5000.0, 40), rng.uniform(0.0, 900.0, 40)))
+        section = section_data((500.0, 4000.0), (4500.0, 1000.0))
+
+        for trend, plunge in ((0.0, 0.0), (135.0, 30.0), (290.0, 75.0)):
+
+            section_pts, section_s = project_pts_on_section_along_axis(pts, section, trend, plunge)
+
+            axis_versor = GAxis(trend, plunge).as_vect().versor
+            for pt, section_pt, s in zip(pts, section_pts, section_s):
+                expected_pt = ParamLine3D(Point(*pt), axis_versor.x, axis_versor.y, axis_versor.z) \
+                    .intersect_cartes_plane(section['cartes_plane'])
+                np.testing.assert_allclose(section_pt, [expected_pt.x, expected_pt.y, expected_pt.z],
+                                           rtol=0.0, atol=1e-6)
+                np.testing.assert_allclose(s, calculate_distance_with_sign(expected_pt, section['init_pt'],
+                                                                           section['vector']),
+                                           rtol=0.0, atol=1e-6)
+
+    def test_axes_parallel_to_the_section_give_nan(self):
+
+        section = section_data((0.0, 0.0), (1000.0, 0.0))
+
+        section_pts, section_s = project_pts_on_section_along_axis(np.array([[10.0, 20.0, 30.0]]), section, 90.0, 0.0)
+
+        assert np.isnan(section_pts).all()
+        assert np.isnan(section_s).all()
@@ -0,0 +1,92 @@
+from qProf.gis_utils.layer_signatures import vector_layer_edits_signature
+
+
+class FakeSignal(object):
+
+    def __init__(self):
+
+        self.slots = []
+
+    def connect(self, slot):
+
+        self.slots.append(slot)
+
+    def emit(self, *args):
+
+        for slot in self.slots:
+            slot(*args)
+
+
+class FakeVectorLayer(object):
+
+    def __init__(self, layer_id):
+
+        self._id = layer_id
+        self.modified = False
+
+        self.featureAdded = FakeSignal()
+        self.featureDeleted = FakeSignal()
+        self.geometryChanged = FakeSignal()
+        self.afterRollBack = FakeSignal()
+        self.afterCommitChanges = FakeSignal()
+        self.willBeDeleted = FakeSignal()
+
+    def id(self):
+
+        return self._id
+
+    def source(self):
+
+        return "memory?geometry=LineString"
+
+    def subsetString(self):
+
+        return ""
+
+    def featureCount(self):
+
+        return 3
+
+    def isModified(self):
+
+        return self.modified
+
+
+class TestVectorLayerEditsSignature(object):
+
+    def test_signature_changes_with_the_geometry_edits(self):
+
+        layer = FakeVectorLayer("edited")
+
+        saved_signature = vector_layer_edits_signature(layer)
+
+        layer.modified = True
+        edited_signature = vector_layer_edits_signature(layer)
+        assert edited_signature != saved_signature
+        assert vector_layer_edits_signature(layer) == edited_signature
+
+        layer.geometryChanged.emit(1, None)
+        moved_signature = vector_layer_edits_signature(layer)
+        assert moved_signature != edited_signature
+        assert vector_layer_edits_signature(layer) == moved_signature
+
+        layer.featureDeleted.emit(2)
+        assert vector_layer_edits_signature(layer) != moved_signature
+
+        layer.modified = False
+        layer.afterRollBack.emit()
+        assert vector_layer_edits_signature(layer) == saved_signature
+
+    def test_deleted_layers_are_forgotten(self):
+
+        layer = FakeVectorLayer("deleted")
+        layer.modified = True
+
+        vector_layer_edits_signature(layer)
+        layer.featureAdded.emit(4)
+        layer.willBeDeleted.emit()
+
+        # a new layer with the same id counts its edits from zero
+        new_layer = FakeVectorLayer("deleted")
+        new_layer.modified = True
+        assert vector_layer_edits_signature(new_layer)[-2:] == ("edits", 0)
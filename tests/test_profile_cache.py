@@ -0,0 +1,227 @@
+import numpy as np
+import pytest
+
+from qProf.gsf.geometry import Point, GPlane
+from qProf.gis_utils.features import Line
+from qProf.gis_utils.geoprofiles import GeoProfilesSet, GeoProfile, ProfileElevations, PlaneAttitude, \
+    GeologicalInput
+from qProf.gis_utils.profile_cache import geoprofiles_fingerprint, geological_fingerprint, geoprofiles_cache_path, \
+    save_geoprofiles, load_geoprofiles
+
+
+class FakeCrs(object):
+
+    def __init__(self, authid):
+
+        self._authid = authid
+
+    def authid(self):
+
+        return self._authid
+
+    def toWkt(self):
+
+        return ""
+
+
+class FakeMapSettings(object):
+
+    def destinationCrs(self):
+
+        return FakeCrs("EPSG:32633")
+
+
+class FakeCanvas(object):
+
+    def mapSettings(self):
+
+        return FakeMapSettings()
+
+
+class FakeLayer(object):
+
+    def __init__(self, layer_id, source):
+
+        self._id = layer_id
+        self._source = source
+        self.modified = False
+        self.subset = ""
+        self.features_num = 3
+
+    def id(self):
+
+        return self._id
+
+    def name(self):
+
+        return self._id
+
+    def source(self):
+
+        return self._source
+
+    def crs(self):
+
+        return FakeCrs("EPSG:32633")
+
+    def isModified(self):
+
+        return self.modified
+
+    def subsetString(self):
+
+        return self.subset
+
+    def featureCount(self):
+
+        return self.features_num
+
+
+class TestProfilesCache(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+
+        dem_path = tmp_path / "dem.tif"
+        dem_path.write_bytes(b"dem")
+        points_path = tmp_path / "attitudes.shp"
+        points_path.write_bytes(b"points")
+        polygons_path = tmp_path / "geology.shp"
+        polygons_path.write_bytes(b"polygons")
+
+        self.dem = FakeLayer("dem", str(dem_path))
+        self.points_layer = FakeLayer("attitudes", str(points_path))
+        self.polygons_layer = FakeLayer("geology", str(polygons_path))
+        self.layers = {layer.id(): layer for layer in (self.dem, self.points_layer, self.polygons_layer)}
+
+        line = Line.from_arrays(np.array([0.0, 100.0]), np.array([0.0, 0.0]))
+        self.fingerprint = geoprofiles_fingerprint(FakeCanvas(), [line], 10.0, [self.dem], False)
+        self.cache_path = geoprofiles_cache_path(str(tmp_path), "")
+
+        self.attitudes_parameters = dict(fields=["id", "dip_dir", "dip_ang"], rhr_strike=False,
+                                         mapping_method=dict(method="nearest"))
+        self.outcrops_parameters = dict(classification_field_ndx=1)
+
+        self.geoprofiles_set = self.geoprofiles(line)
+
+    def geoprofiles(self, line):
+
+        topo_profiles = ProfileElevations()
+        topo_profiles.planar_xs = np.linspace(0.0, 100.0, 11)
+        topo_profiles.planar_ys = np.zeros(11)
+        topo_profiles.profile_s = np.linspace(0.0, 100.0, 11)
+        topo_profiles.surface_names = ["dem"]
+        topo_profiles.surface_errors = [None]
+        topo_profiles.profile_zs = [np.linspace(200.0, 300.0, 11)]
+        topo_profiles.profile_s3ds = [np.linspace(0.0, 141.42, 11)]
+        topo_profiles.profile_dirslopes = [np.full(11, 45.0)]
+        topo_profiles.inverted = False
+
+        geoprofile = GeoProfile()
+        geoprofile.source_data_type = "DEM"
+        geoprofile.original_line = line
+        geoprofile.sample_distance = 10.0
+        geoprofile.set_topo_profiles(topo_profiles)
+
+        geoprofile.add_plane_attitudes(
+            [PlaneAttitude(7, Point(10.0, 5.0, 210.0), GPlane(90.0, 30.0), Point(10.0, 0.0, 210.0), 0.5, "right", 5.0),
+             PlaneAttitude("b", Point(60.0, -5.0, 260.0), GPlane(270.0, 60.0), Point(60.0, 0.0, 260.0), 1.0, "left",
+                           -5.0)],
+            GeologicalInput("attitudes",
+                            self.attitudes_parameters,
+                            geological_fingerprint(self.fingerprint, self.points_layer, self.attitudes_parameters)))
+
+        geoprofile.add_intersections_lines(
+            ["limestone", "marl"],
+            [Line.from_arrays(np.array([20.0, 30.0]), np.zeros(2), np.array([220.0, 230.0])),
+             Line.from_arrays(np.array([50.0, 55.0, 60.0]), np.zeros(3), np.array([250.0, 255.0, 260.0]))],
+            [[20.0, 30.0], [50.0, 55.0, 60.0]],
+            GeologicalInput("geology",
+                            self.outcrops_parameters,
+                            geological_fingerprint(self.fingerprint, self.polygons_layer, self.outcrops_parameters)))
+
+        geoprofiles_set = GeoProfilesSet("profiles")
+        geoprofiles_set.append(geoprofile)
+
+        return geoprofiles_set
+
+    def saved_and_loaded(self):
+
+        assert save_geoprofiles(self.geoprofiles_set, self.cache_path, self.fingerprint,
+                                [(1.0, 0.0, 0.0)], {"limestone": (0.0, 0.0, 1.0), "marl": (0.0, 1.0, 0.0)})
+
+        return load_geoprofiles(self.cache_path, self.fingerprint, [self.dem], [None], self.layers)
+
+    def test_unsaved_projects_have_a_cache_path(self, tmp_path):
+
+        assert geoprofiles_cache_path(str(tmp_path), "") == str(tmp_path / "unsaved_project.npz")
+        assert geoprofiles_cache_path(str(tmp_path), "/a/project.qgz") != geoprofiles_cache_path(str(tmp_path), "")
+
+    def test_round_trip(self):
+
+        geoprofiles_set = self.saved_and_loaded()
+
+        assert geoprofiles_set is not None
+        assert geoprofiles_set.name == "profiles"
+        assert geoprofiles_set.plane_attitudes_colors == [(1.0, 0.0, 0.0)]
+        assert geoprofiles_set.polygon_classification_colors == {"limestone": (0.0, 0.0, 1.0), "marl": (0.0, 1.0, 0.0)}
+
+        original = self.geoprofiles_set.geoprofile(0)
+        geoprofile = geoprofiles_set.geoprofile(0)
+
+        np.testing.assert_array_equal(geoprofile.original_line.array, original.original_line.array)
+        np.testing.assert_array_equal(geoprofile.topo_profiles.profile_zs[0], original.topo_profiles.profile_zs[0])
+
+        assert len(geoprofile.geoplane_attitudes) == 1
+        assert geoprofile.geoplane_attitudes_inputs[0].layer_id == "attitudes"
+        for plane_attitude, original_attitude in zip(geoprofile.geoplane_attitudes[0], original.geoplane_attitudes[0]):
+            assert plane_attitude.id == original_attitude.id
+            assert plane_attitude.dwnwrd_sense == original_attitude.dwnwrd_sense
+            assert plane_attitude.src_geol_plane.dd == original_attitude.src_geol_plane.dd
+            assert plane_attitude.src_geol_plane.da == original_attitude.src_geol_plane.da
+            for name in ("x", "y", "z"):
+                assert getattr(plane_attitude.src_pt_3d, name) == getattr(original_attitude.src_pt_3d, name)
+                assert getattr(plane_attitude.pt_3d, name) == getattr(original_attitude.pt_3d, name)
+            assert plane_attitude.slope_rad == original_attitude.slope_rad
+            assert plane_attitude.sign_hor_dist == original_attitude.sign_hor_dist
+
+        assert geoprofile.outcrops_input.layer_id == "geology"
+        assert [formation for formation, _, _ in geoprofile.outcrops] == ["limestone", "marl"]
+        for (_, line, s_list), (_, original_line, original_s_list) in zip(geoprofile.outcrops, original.outcrops):
+            np.testing.assert_array_equal(line.array, original_line.array)
+            assert s_list == original_s_list
+
+    def test_stale_profiles_are_not_loaded(self):
+
+        assert save_geoprofiles(self.geoprofiles_set, self.cache_path, self.fingerprint)
+
+        line = Line.from_arrays(np.array([0.0, 100.0]), np.array([0.0, 1.0]))
+        stale_fingerprint = geoprofiles_fingerprint(FakeCanvas(), [line], 10.0, [self.dem], False)
+
+        assert stale_fingerprint != self.fingerprint
+        assert load_geoprofiles(self.cache_path, stale_fingerprint, [self.dem], [None], self.layers) is None
+
+    def test_stale_geological_elements_are_not_restored(self):
+
+        self.points_layer.features_num = 4
+        self.layers.pop("geology")
+
+        geoprofiles_set = self.saved_and_loaded()
+
+        geoprofile = geoprofiles_set.geoprofile(0)
+        assert geoprofile.geoplane_attitudes == []
+        assert geoprofile.outcrops == []
+        assert geoprofiles_set.plane_attitudes_colors == []
+        assert geoprofiles_set.polygon_classification_colors is None
+        np.testing.assert_array_equal(geoprofile.topo_profiles.profile_zs[0],
+                                      self.geoprofiles_set.geoprofile(0).topo_profiles.profile_zs[0])
+
+    def test_edited_layers_have_no_geological_fingerprint(self):
+
+        assert geological_fingerprint(self.fingerprint, self.points_layer, self.attitudes_parameters) is not None
+        assert geological_fingerprint(self.fingerprint, self.points_layer, dict(fields=["id"])) != \
+            geological_fingerprint(self.fingerprint, self.points_layer, self.attitudes_parameters)
+
+        self.points_layer.modified = True
+
+        assert geological_fingerprint(self.fingerprint, self.points_layer, self.attitudes_parameters) is None
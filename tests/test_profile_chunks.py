@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from qProf.gis_utils.dem_interpolation import GridParameters
+from qProf.gis_utils.features import Line
+from qProf.gis_utils.profile_chunks import chunked_profile_elevations
+
+
+class TestChunkedProfiles(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, array_interpolator):
+
+        # surface rising 1 m every cell eastward, with a ridge along the grid diagonal
+        params = GridParameters("dem", 1.0, 1.0, 100, 100, 0.0, 100.0, 0.0, 100.0, None)
+        rows, cols = np.mgrid[99:-1:-1, 0:100]
+        self.surface = array_interpolator(params, cols + 20.0 - np.abs(rows - cols).astype(np.float64))
+
+        self.line = Line.from_arrays(np.array([5.5, 40.0, 40.0, 90.3, 60.0]), np.array([5.5, 12.0, 50.0, 80.0, 95.0]))
+        self.sample_distance = 1.3
+
+    def sample_points(self, xs, ys):
+
+        return [self.surface.interpolate_z_array(xs, ys), np.full(xs.shape, 3.0)], [None, None]
+
+    def chunked_profiles(self, chunk_size, use_memmap=False):
+
+        return chunked_profile_elevations(self.line.densify_2d_line_chunks(self.sample_distance, chunk_size),
+                                          self.line.densified_2d_pts_max_num(self.sample_distance),
+                                          2,
+                                          self.sample_points,
+                                          use_memmap)
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 7, 50])
+    def test_chunks_continue_the_densified_line(self, chunk_size):
+
+        chunks = list(self.line.densify_2d_line_chunks(self.sample_distance, chunk_size))
+
+        assert all(chunk.num_pts <= chunk_size for chunk in chunks)
+        np.testing.assert_array_equal(np.concatenate([chunk.array for chunk in chunks]),
+                                      self.line.densify_2d_line(self.sample_distance).array)
+
+    @pytest.mark.parametrize("chunk_size", [2, 7, 50])
+    def test_chunked_profiles_equal_the_whole_line_profiles(self, chunk_size):
+
+        profiles = self.chunked_profiles(10 ** 6)
+        chunked_profiles = self.chunked_profiles(chunk_size)
+
+        np.testing.assert_array_equal(chunked_profiles.planar_xs, profiles.planar_xs)
+        np.testing.assert_array_equal(chunked_profiles.planar_ys, profiles.planar_ys)
+        np.testing.assert_allclose(chunked_profiles.profile_s, profiles.profile_s, rtol=1e-12)
+        for name in ("profile_zs", "profile_s3ds", "profile_dirslopes"):
+            for chunked_values, values in zip(getattr(chunked_profiles, name), getattr(profiles, name)):
+                np.testing.assert_allclose(chunked_values, values, rtol=1e-12)
+        assert chunked_profiles.surface_errors == [None, None]
+
+    def test_whole_line_profiles_match_the_line_lengths_and_slopes(self):
+
+        profiles = self.chunked_profiles(10 ** 6)
+
+        resampled_line = self.line.densify_2d_line(self.sample_distance)
+        topoline3d = Line.from_arrays(resampled_line.x_array(), resampled_line.y_array(), profiles.profile_zs[0])
+
+        np.testing.assert_allclose(profiles.profile_s, resampled_line.incremental_length_2d_array())
+        np.testing.assert_allclose(profiles.profile_s3ds[0], topoline3d.incremental_length_3d_array())
+        np.testing.assert_allclose(profiles.profile_dirslopes[0], topoline3d.slopes_array())
+
+    def test_memory_mapped_profiles(self):
+
+        profiles = self.chunked_profiles(7)
+        mapped_profiles = self.chunked_profiles(7, use_memmap=True)
+
+        assert isinstance(mapped_profiles.profile_s, np.memmap)
+        np.testing.assert_array_equal(mapped_profiles.profile_s, profiles.profile_s)
+        np.testing.assert_array_equal(mapped_profiles.profile_s3ds[0], profiles.profile_s3ds[0])
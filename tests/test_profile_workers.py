@@ -0,0 +1,202 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from qProf.gis_utils import profile_workers
+from qProf.gis_utils.dem_interpolation import GridParameters
+from qProf.gis_utils.profile_workers import profile_executor, run_profile_tasks, map_with_thread_copies
+
+
+class TestRunProfileTasks(object):
+    """
+    The worker entry point runs in this process, on a thread pool,
+    with rasters read from in-memory arrays.
+    """
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch, array_raster_backend):
+
+        self.params = GridParameters("dem", 1.0, 1.0, 10, 10, 0.0, 10.0, 0.0, 10.0, None)
+
+        # constant rasters, named by their value
+        self.rasters = dict(("raster_{}".format(value), np.full((10, 10), float(value))) for value in range(5))
+        self.rasters["failing"] = None
+        self.blocked = dict()
+        self.opened = []
+
+        def file_raster_backend(raster_path, params, use_memmap=True):
+            self.opened.append(raster_path)
+            if raster_path in self.blocked:
+                self.blocked[raster_path].wait(5.0)
+            array = self.rasters[raster_path]
+            if array is None:
+                raise IOError("unreadable raster")
+            return array_raster_backend(params, array)
+
+        monkeypatch.setattr(profile_workers, "file_raster_backend", file_raster_backend)
+
+        self.profiles = dict()
+
+    def dem_tasks(self, raster_paths, pts_num=5):
+
+        xs = np.linspace(1.5, 8.5, pts_num)
+        ys = np.full(pts_num, 4.5)
+
+        return [(raster_path, self.params, xs, ys, 1) for raster_path in raster_paths]
+
+    def add_profile(self, profile_ndx, dems_zs, dems_errors):
+
+        self.profiles[profile_ndx] = (dems_zs, dems_errors)
+
+    def test_profiles_are_matched_to_their_tasks(self):
+
+        profiles_tasks = [(profile_ndx, self.dem_tasks(["raster_{}".format(profile_ndx), "raster_0"], 3 + profile_ndx))
+                          for profile_ndx in (4, 1, 3, 2)]
+        progress = []
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            assert run_profile_tasks(executor, profiles_tasks, self.add_profile,
+                                     progress_callback=lambda done_num, total_num: progress.append((done_num, total_num)))
+
+        assert sorted(self.profiles) == [1, 2, 3, 4]
+        for profile_ndx, (dems_zs, dems_errors) in self.profiles.items():
+            np.testing.assert_array_equal(dems_zs[0], np.full(3 + profile_ndx, float(profile_ndx)))
+            np.testing.assert_array_equal(dems_zs[1], np.zeros(3 + profile_ndx))
+            assert dems_errors == [None, None]
+        assert progress[-1] == (4, 4)
+
+    def test_failed_raster_only_fails_its_profile_raster(self):
+
+        profiles_tasks = [(0, self.dem_tasks(["raster_1", "failing"])),
+                          (1, self.dem_tasks(["raster_2", "raster_3"]))]
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            assert run_profile_tasks(executor, profiles_tasks, self.add_profile)
+
+        dems_zs, dems_errors = self.profiles[0]
+        np.testing.assert_array_equal(dems_zs[0], np.full(5, 1.0))
+        assert np.isnan(dems_zs[1]).all()
+        assert dems_errors == [None, "unreadable raster"]
+        assert self.profiles[1][1] == [None, None]
+
+    def test_failed_task_only_fails_its_profile(self, monkeypatch):
+
+        profile_samples_worker = profile_workers.profile_samples_worker
+
+        def failing_worker(profile_ndx, dem_tasks):
+            if profile_ndx == 1:
+                raise MemoryError()
+            return profile_samples_worker(profile_ndx, dem_tasks)
+
+        monkeypatch.setattr(profile_workers, "profile_samples_worker", failing_worker)
+
+        profiles_tasks = [(profile_ndx, self.dem_tasks(["raster_2", "raster_3"], 4)) for profile_ndx in range(3)]
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            assert run_profile_tasks(executor, profiles_tasks, self.add_profile)
+
+        dems_zs, dems_errors = self.profiles[1]
+        assert [zs.shape for zs in dems_zs] == [(4,), (4,)]
+        assert np.isnan(np.concatenate(dems_zs)).all()
+        assert dems_errors == ["MemoryError", "MemoryError"]
+        for profile_ndx in (0, 2):
+            assert self.profiles[profile_ndx][1] == [None, None]
+
+    def test_cancel_does_not_wait_for_the_running_tasks(self):
+
+        self.blocked["raster_1"] = threading.Event()
+        profiles_tasks = [(profile_ndx, self.dem_tasks(["raster_1"])) for profile_ndx in range(3)]
+        polls = []
+
+        def cancel_requested():
+            polls.append(None)
+            return len(polls) > 2
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            assert not run_profile_tasks(executor, profiles_tasks, self.add_profile,
+                                         cancel_requested=cancel_requested, poll_interval=0.01)
+        finally:
+            self.blocked["raster_1"].set()
+            executor.shutdown(wait=True)
+
+        # the running task completes, the others were never started
+        assert self.profiles == dict()
+        assert self.opened == ["raster_1"]
+        assert len(polls) == 3
+
+
+class TestProfileExecutor(object):
+
+    def test_threads_without_worker_processes(self, monkeypatch):
+
+        monkeypatch.setattr(profile_workers, "_process_pool_usable", None)
+        monkeypatch.setattr(profile_workers, "process_pool_context", lambda: None)
+
+        executor = profile_executor(2)
+        try:
+            assert isinstance(executor, ThreadPoolExecutor)
+        finally:
+            executor.shutdown()
+
+        assert profile_workers._process_pool_usable is False
+
+
+class TestMapWithThreadCopies(object):
+
+    class SharedData(object):
+        """
+        Fails when used by two threads at once.
+        """
+
+        def __init__(self):
+
+            self.lock = threading.Lock()
+            self.threads = set()
+
+        def use(self, item):
+
+            assert self.lock.acquire(False), "concurrent use"
+            try:
+                self.threads.add(threading.current_thread().ident)
+                time.sleep(0.001)
+                return item * 2
+            finally:
+                self.lock.release()
+
+    def test_each_thread_uses_its_own_copy(self):
+
+        shared_data = self.SharedData()
+        copies = []
+
+        def copy_shared_data(data):
+            data_copy = self.SharedData()
+            copies.append(data_copy)
+            return data_copy
+
+        results = map_with_thread_copies(lambda item, data: data.use(item),
+                                         list(range(20)),
+                                         shared_data,
+                                         copy_shared_data,
+                                         4)
+
+        assert results == [item * 2 for item in range(20)]
+        assert len(copies) == 4
+        assert shared_data.threads == set()
+        assert all(len(data_copy.threads) == 1 for data_copy in copies)
+
+    def test_single_thread_uses_the_shared_data(self):
+
+        shared_data = self.SharedData()
+
+        results = map_with_thread_copies(lambda item, data: data.use(item),
+                                         [1, 2, 3],
+                                         shared_data,
+                                         lambda data: pytest.fail("copied"),
+                                         1)
+
+        assert results == [2, 4, 6]
+        assert len(shared_data.threads) == 1
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from qProf.gis_utils.dem_interpolation import GridParameters
+from qProf.gis_utils.raster_backends import RasterBlockSampler, aggregate_cells
+from qProf.gis_utils.tile_cache import DEMTileCache
+
+class TestAggregateCells(object):
+
+    def test_block_means_ignore_nan(self):
+
+        array = np.array([[1.0, 3.0, 5.0],
+                          [np.nan, 2.0, 7.0],
+                          [4.0, 4.0, np.nan]])
+
+        aggregated = aggregate_cells(array, 2)
+
+        np.testing.assert_allclose(aggregated, [[2.0, 6.0], [4.0, np.nan]])
+
+
+class TestRasterBlockSampler(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, array_interpolator, array_raster_backend):
+
+        rng = np.random.RandomState(3)
+        self.array = rng.uniform(0.0, 100.0, (70, 90))
+        self.array[20, 40] = -9999.0
+        self.params = GridParameters("dem", 2.0, 2.0, 70, 90, 0.0, 180.0, 0.0, 140.0, -9999.0)
+        self.tile_cache = DEMTileCache(tile_size=16)
+        self.backend = array_raster_backend(self.params, self.array)
+        self.array_interpolator = array_interpolator
+
+    def sampler(self, decimation=1):
+
+        return RasterBlockSampler(self.backend, self.params, "dem", 1, self.tile_cache, decimation)
+
+    def test_matches_whole_grid_interpolation(self):
+
+        rng = np.random.RandomState(5)
+        xs = rng.uniform(-5.0, 185.0, 3000)
+        ys = rng.uniform(-5.0, 145.0, 3000)
+
+        masked_array = np.where(self.array == -9999.0, np.nan, self.array)
+        expected = self.array_interpolator(self.params, masked_array).interpolate_z_array(xs, ys)
+
+        np.testing.assert_allclose(self.sampler().interpolate_z_array(xs, ys), expected, equal_nan=True)
+
+    def test_tiles_are_read_once(self):
+
+        xs = np.linspace(1.0, 179.0, 500)
+        ys = np.linspace(1.0, 139.0, 500)
+
+        zs = self.sampler().interpolate_z_array(xs, ys)
+        reads = self.backend.reads
+
+        np.testing.assert_array_equal(self.sampler().interpolate_z_array(xs, ys), zs)
+        assert self.backend.reads == reads
+
+    def test_decimated_sampling_reads_aggregated_cells(self):
+
+        masked_array = np.where(self.array == -9999.0, np.nan, self.array)
+        decimated_params = self.params.decimated(2)
+        expected = self.array_interpolator(decimated_params, aggregate_cells(masked_array, 2))
+
+        xs = np.array([10.0, 55.5, 120.0])
+        ys = np.array([30.0, 77.0, 101.5])
+
+        np.testing.assert_allclose(self.sampler(decimation=2).interpolate_z_array(xs, ys),
+                                   expected.interpolate_z_array(xs, ys))
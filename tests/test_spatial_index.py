@@ -0,0 +1,102 @@
+import numpy as np
+
+from qProf.gis_utils.spatial_index import GridSpatialIndex, SpatialIndexCache
+
+
+def random_bboxes(size, seed):
+
+    rng = np.random.RandomState(seed)
+    x_mins = rng.uniform(0.0, 1000.0, size)
+    y_mins = rng.uniform(0.0, 1000.0, size)
+    widths = rng.exponential(8.0, size)
+    heights = rng.exponential(8.0, size)
+
+    return np.column_stack((x_mins, y_mins, x_mins + widths, y_mins + heights))
+
+
+def bbox_polyline_distances(bboxes, xs, ys):
+    """
+    Distances between bounding boxes and a densely sampled polyline.
+    """
+
+    fractions = np.linspace(0.0, 1.0, 200)[:-1]
+    sample_xs = np.append((xs[:-1, np.newaxis] + np.diff(xs)[:, np.newaxis] * fractions).ravel(), xs[-1])
+    sample_ys = np.append((ys[:-1, np.newaxis] + np.diff(ys)[:, np.newaxis] * fractions).ravel(), ys[-1])
+
+    dxs = np.maximum(np.maximum(bboxes[:, 0, np.newaxis] - sample_xs, sample_xs - bboxes[:, 2, np.newaxis]), 0.0)
+    dys = np.maximum(np.maximum(bboxes[:, 1, np.newaxis] - sample_ys, sample_ys - bboxes[:, 3, np.newaxis]), 0.0)
+
+    return np.hypot(dxs, dys).min(axis=1)
+
+
+class TestGridSpatialIndex(object):
+
+    def setup_method(self):
+
+        self.bboxes = random_bboxes(3000, 1)
+        # a few items much larger than the others
+        self.bboxes[:3] = [[100.0, 100.0, 900.0, 900.0], [0.0, 450.0, 1000.0, 470.0], [600.0, 0.0, 610.0, 1000.0]]
+        self.ids = np.arange(3000) * 10
+        self.index = GridSpatialIndex(self.bboxes, self.ids)
+
+    def test_query_rect(self):
+
+        for x_min, y_min, x_max, y_max in ((200.0, 300.0, 260.0, 420.0), (-50.0, -50.0, 10.0, 10.0),
+                                           (990.0, 0.0, 1100.0, 1100.0), (2000.0, 2000.0, 2100.0, 2100.0)):
+
+            expected = self.ids[(self.bboxes[:, 0] <= x_max) & (self.bboxes[:, 2] >= x_min) &
+                                (self.bboxes[:, 1] <= y_max) & (self.bboxes[:, 3] >= y_min)]
+
+            np.testing.assert_array_equal(np.sort(self.index.query_rect(x_min, y_min, x_max, y_max)),
+                                          np.sort(expected))
+
+    def test_query_polyline_finds_all_items_in_corridor(self):
+
+        xs = np.array([20.0, 480.0, 510.0, 980.0])
+        ys = np.array([30.0, 700.0, 690.0, 120.0])
+
+        for half_width in (0.0, 5.0, 40.0):
+
+            distances = bbox_polyline_distances(self.bboxes, xs, ys)
+            candidates = self.index.query_polyline(xs, ys, half_width)
+
+            assert set(self.ids[distances <= half_width]).issubset(set(candidates.tolist()))
+
+            # apart from oversized items, candidates are within the half width plus a quarter of cell
+            # from a polyline sample, along each axis
+            oversized_ids = set(self.ids[self.index.oversized_items].tolist())
+            reach = np.sqrt(2.0) * (half_width + self.index.cell_size / 4.0)
+            far_ids = set(self.ids[distances > reach + 1e-6].tolist())
+            assert not (set(candidates.tolist()) - oversized_ids) & far_ids
+
+    def test_wide_corridor_is_queried_by_extent(self):
+
+        xs = np.array([300.0, 500.0])
+        ys = np.array([300.0, 350.0])
+        half_width = 10000.0
+
+        np.testing.assert_array_equal(np.sort(self.index.query_polyline(xs, ys, half_width)), np.sort(self.ids))
+
+    def test_empty_index(self):
+
+        index = GridSpatialIndex(np.empty((0, 4)), np.empty(0, dtype=np.int64))
+
+        assert index.query_rect(0.0, 0.0, 10.0, 10.0).size == 0
+        assert index.query_polyline(np.array([0.0, 10.0]), np.array([0.0, 10.0]), 5.0).size == 0
+
+
+class TestSpatialIndexCache(object):
+
+    def test_indices_rebuilt_on_signature_change(self):
+
+        cache = SpatialIndexCache()
+        builds = []
+
+        def builder():
+            builds.append(1)
+            return GridSpatialIndex(random_bboxes(10, 2), np.arange(10))
+
+        first = cache.index("layer", 1, builder)
+        assert cache.index("layer", 1, builder) is first
+        assert cache.index("layer", 2, builder) is not first
+        assert len(builds) == 2
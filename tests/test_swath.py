@@ -0,0 +1,126 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from qProf.gis_utils.dem_interpolation import GridParameters
+from qProf.gis_utils.swath import swath_points, swath_statistics, swath_elevations
+
+
+class TestSwathPoints(object):
+
+    def test_points_along_station_normals(self):
+
+        xs = np.array([0.0, 10.0, 20.0])
+        ys = np.array([5.0, 5.0, 5.0])
+        offsets = np.array([-2.0, 0.0, 3.0])
+
+        swath_xs, swath_ys = swath_points(xs, ys, offsets)
+
+        assert swath_xs.shape == (3, 3)
+        np.testing.assert_allclose(swath_xs, np.repeat(xs[:, np.newaxis], 3, axis=1))
+        np.testing.assert_allclose(swath_ys, [[3.0, 5.0, 8.0]] * 3)
+
+    def test_normal_at_bend_bisects_adjacent_segments(self):
+
+        xs = np.array([0.0, 10.0, 10.0])
+        ys = np.array([0.0, 0.0, 10.0])
+
+        swath_xs, swath_ys = swath_points(xs, ys, np.array([np.sqrt(2.0)]))
+
+        np.testing.assert_allclose([swath_xs[1, 0], swath_ys[1, 0]], [9.0, 1.0])
+        np.testing.assert_allclose([swath_xs[2, 0], swath_ys[2, 0]], [10.0 - np.sqrt(2.0), 10.0])
+
+    def test_coincident_stations_have_undefined_normals(self):
+
+        swath_xs, swath_ys = swath_points(np.array([3.0, 3.0]), np.array([4.0, 4.0]), np.array([-1.0, 1.0]))
+
+        assert np.isnan(swath_xs).all()
+        assert np.isnan(swath_ys).all()
+
+
+class TestSwathStatistics(object):
+
+    def test_statistics_ignore_nan(self):
+
+        zs = np.array([[1.0, 2.0, 3.0, 4.0, np.nan],
+                       [10.0, 10.0, 10.0, 10.0, 10.0]])
+
+        swath = swath_statistics(zs, (25.0, 50.0))
+
+        np.testing.assert_allclose(swath.min_zs, [1.0, 10.0])
+        np.testing.assert_allclose(swath.max_zs, [4.0, 10.0])
+        np.testing.assert_allclose(swath.mean_zs, [2.5, 10.0])
+        assert swath.percentiles == (25.0, 50.0)
+        np.testing.assert_allclose(swath.percentile_zs[0], [1.75, 10.0])
+        np.testing.assert_allclose(swath.percentile_zs[1], [2.5, 10.0])
+
+    def test_stations_without_values_are_nan(self):
+
+        zs = np.array([[np.nan, np.nan], [1.0, 3.0]])
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            swath = swath_statistics(zs, (50.0,))
+
+        for values in (swath.min_zs, swath.max_zs, swath.mean_zs, swath.percentile_zs[0]):
+            assert np.isnan(values[0])
+            assert not np.isnan(values[1])
+
+    def test_no_percentiles(self):
+
+        swath = swath_statistics(np.ones((3, 4)), ())
+
+        assert swath.percentiles == ()
+        assert swath.percentile_zs == []
+
+
+class TestSwathElevations(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, array_interpolator):
+
+        # plane rising 2 m every cell northward and 1 m every cell eastward
+        self.params = GridParameters("dem", 1.0, 1.0, 100, 100, 0.0, 100.0, 0.0, 100.0, None)
+        rows, cols = np.mgrid[99:-1:-1, 0:100]
+        self.plane = array_interpolator(self.params, 2.0 * rows + cols.astype(np.float64))
+        self.calls = []
+
+    def sample_points(self, xs, ys):
+
+        self.calls.append(xs.size)
+
+        return [self.plane.interpolate_z_array(xs, ys), np.full(xs.shape, 7.0)], [None, "second surface error"]
+
+    def test_envelopes_across_a_planar_surface(self):
+
+        xs = np.linspace(20.5, 80.5, 61)
+        ys = np.full(61, 50.5)
+
+        swaths, errors = swath_elevations(xs, ys, 2, 10.0, 21, (25.0, 75.0), self.sample_points)
+
+        center_zs = self.plane.interpolate_z_array(xs, ys)
+        np.testing.assert_allclose(swaths[0].min_zs, center_zs - 20.0)
+        np.testing.assert_allclose(swaths[0].max_zs, center_zs + 20.0)
+        np.testing.assert_allclose(swaths[0].mean_zs, center_zs)
+        np.testing.assert_allclose(swaths[0].percentile_zs[0], center_zs - 10.0)
+        np.testing.assert_allclose(swaths[0].percentile_zs[1], center_zs + 10.0)
+        np.testing.assert_allclose(swaths[1].mean_zs, np.full(61, 7.0))
+        assert errors == [None, "second surface error"]
+
+    def test_chunked_stations_give_the_same_statistics(self):
+
+        xs = np.linspace(20.5, 80.5, 61)
+        ys = np.linspace(30.5, 60.5, 61)
+
+        swaths, _ = swath_elevations(xs, ys, 2, 8.0, 11, (50.0,), self.sample_points)
+        assert self.calls == [61 * 11]
+
+        self.calls = []
+        chunked_swaths, _ = swath_elevations(xs, ys, 2, 8.0, 11, (50.0,), self.sample_points, chunk_max_pts=100)
+        assert self.calls == [99] * 6 + [61 * 11 - 6 * 99]
+
+        for swath, chunked_swath in zip(swaths, chunked_swaths):
+            for name in ("min_zs", "max_zs", "mean_zs"):
+                np.testing.assert_array_equal(getattr(chunked_swath, name), getattr(swath, name))
+            np.testing.assert_array_equal(chunked_swath.percentile_zs[0], swath.percentile_zs[0])
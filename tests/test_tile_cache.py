@@ -0,0 +1,77 @@
+import numpy as np
+
+from qProf.gis_utils.tile_cache import DEMTileCache
+
+
+def tile_loader(value, loads):
+    """
+    Loader of a 100 x 100 float tile (80000 bytes), counting its calls.
+    """
+
+    def load():
+        loads.append(value)
+        return np.full((100, 100), float(value))
+
+    return load
+
+
+class TestDEMTileCache(object):
+
+    def setup_method(self):
+
+        # room for three 80000-byte tiles
+        self.cache = DEMTileCache(max_mb=250000 / (1024.0 * 1024.0), tile_size=100)
+        self.loads = []
+
+    def tile(self, layer_id, signature, tile_ndx):
+
+        return self.cache.tile(layer_id, signature, tile_ndx, tile_loader(tile_ndx, self.loads))
+
+    def test_cached_tiles_are_not_read_again(self):
+
+        first = self.tile("dem", 1, 0)
+        second = self.tile("dem", 1, 0)
+
+        assert first is second
+        assert self.loads == [0]
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+
+    def test_least_recently_used_tile_is_evicted(self):
+
+        for tile_ndx in (0, 1, 2):
+            self.tile("dem", 1, tile_ndx)
+
+        self.tile("dem", 1, 0)  # tile 1 becomes the least recently used one
+        self.tile("dem", 1, 3)
+
+        assert self.cache.tiles_num == 3
+        assert self.cache.nbytes <= self.cache.max_bytes
+        assert self.cache.contains("dem", 1, 0)
+        assert not self.cache.contains("dem", 1, 1)
+        assert self.cache.contains("dem", 1, 2)
+        assert self.cache.contains("dem", 1, 3)
+
+    def test_changed_signature_discards_layer_tiles(self):
+
+        self.tile("dem", 1, 0)
+        self.tile("other", 1, 0)
+
+        self.tile("dem", 2, 0)
+
+        assert self.loads == [0, 0, 0]
+        assert not self.cache.contains("dem", 1, 0)
+        assert self.cache.contains("dem", 2, 0)
+        assert self.cache.contains("other", 1, 0)
+        assert self.cache.nbytes == 2 * 80000
+
+    def test_invalidate_and_clear(self):
+
+        self.tile("dem", 1, 0)
+        self.tile("other", 1, 0)
+
+        self.cache.invalidate("dem")
+        assert not self.cache.contains("dem", 1, 0)
+        assert self.cache.contains("other", 1, 0)
+
+        self.cache.clear()
+        assert (self.cache.tiles_num, self.cache.nbytes) == (0, 0)
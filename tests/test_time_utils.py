@@ -0,0 +1,87 @@
+import calendar
+
+import numpy as np
+
+from qProf.gis_utils.time_utils import gpstimes_to_seconds, seconds_to_datetime64, seconds_to_iso8601, \
+    standard_gpstime_to_seconds
+
+
+class TestGpsTimesToSeconds(object):
+
+    def test_utc_times(self):
+
+        seconds = gpstimes_to_seconds(["1970-01-01T00:00:00Z", "2017-06-21T10:15:30Z", "2000-02-29T23:59:59Z"])
+
+        np.testing.assert_array_equal(seconds, [0.0,
+                                                calendar.timegm((2017, 6, 21, 10, 15, 30)),
+                                                calendar.timegm((2000, 2, 29, 23, 59, 59))])
+
+    def test_fractional_seconds(self):
+
+        seconds = gpstimes_to_seconds(["2017-06-21T10:15:30.25Z", "2017-06-21T10:15:30.125+00:00"])
+
+        base = calendar.timegm((2017, 6, 21, 10, 15, 30))
+        np.testing.assert_allclose(seconds, [base + 0.25, base + 0.125])
+
+    def test_time_zones(self):
+
+        seconds = gpstimes_to_seconds(["2017-06-21T12:15:30+02:00",
+                                       "2017-06-21T05:15:30-05:00",
+                                       "2017-06-21T15:45:30+0530",
+                                       "2017-06-21T10:15:30"])
+
+        np.testing.assert_array_equal(seconds, np.full(4, calendar.timegm((2017, 6, 21, 10, 15, 30))))
+
+    def test_date_change_with_offset(self):
+
+        seconds = gpstimes_to_seconds(["2016-12-31T23:30:00-01:00"])
+
+        assert seconds[0] == calendar.timegm((2017, 1, 1, 0, 30, 0))
+
+    def test_malformed_values_are_nan(self):
+
+        seconds = gpstimes_to_seconds(["", None, "not a time", "2017-06-21", "2017-06-21T10:15:30Z"])
+
+        assert np.isnan(seconds[:4]).all()
+        assert seconds[4] == calendar.timegm((2017, 6, 21, 10, 15, 30))
+
+    def test_matches_per_string_conversion(self):
+
+        time_strs = ["2018-03-04T05:06:07Z", "1999-12-31T23:59:59.5Z"]
+
+        np.testing.assert_allclose(gpstimes_to_seconds(time_strs),
+                                   [standard_gpstime_to_seconds(time_str) for time_str in time_strs])
+
+    def test_datetime64_conversion(self):
+
+        datetimes = seconds_to_datetime64(gpstimes_to_seconds(["2017-06-21T10:15:30.5Z"]))
+
+        assert datetimes[0] == np.datetime64("2017-06-21T10:15:30.500")
+
+    def test_hours_range(self):
+
+        seconds = gpstimes_to_seconds(["2017-06-21T23:59:59Z", "2017-06-21T24:00:00Z",
+                                       "2017-06-21T24:00:01Z", "2017-06-21T24:30:00Z", "2017-06-21T25:00:00Z"])
+
+        assert seconds[0] == calendar.timegm((2017, 6, 21, 23, 59, 59))
+        assert seconds[1] == calendar.timegm((2017, 6, 22, 0, 0, 0))
+        assert np.isnan(seconds[2:]).all()
+
+    def test_canonical_and_other_layouts_agree(self):
+
+        canonical = ["2017-06-21T10:15:30Z", "2017-06-21T10:15:30.125Z", "2017-06-21 10:15:30", "2017-06-21T10:15:30."]
+        others = ["2017-6-21T10:15:30Z", "2017-06-21T10:15:30.125+00:00", "  2017-06-21T10:15:30.0 ", "2017-06-21T10:15:30.0-00"]
+
+        np.testing.assert_array_equal(gpstimes_to_seconds(canonical), gpstimes_to_seconds(others))
+
+    def test_trailing_characters_are_malformed(self):
+
+        seconds = gpstimes_to_seconds(["2017-06-21T10:15:30ZZ", "2017-06-21T10:15:30.5x", "2017-06-21T10:1:30:00"])
+
+        assert np.isnan(seconds).all()
+
+    def test_iso8601_conversion(self):
+
+        time_strs = seconds_to_iso8601(gpstimes_to_seconds(["2017-06-21T12:15:30+02:00", "2017-06-21T10:15:30.25Z", ""]))
+
+        assert time_strs.tolist() == ["2017-06-21T10:15:30Z", "2017-06-21T10:15:30.25Z", ""]